@@ -1,16 +1,47 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
-from utils.memory import QdrantMemory
+from typing import Dict, Any, List, Optional, Iterator, AsyncIterator
+from utils.memory_backend import MemoryBackend
 from utils.llm_manager import GroqLLMManager
+from utils.history_store import HistoryStore, InMemoryHistoryStore
+from utils.context_builder import ContextBuilder
+from utils.knowledge_index import DEFAULT_KNOWLEDGE_DIR, KnowledgeIndex, load_sections
+from utils.model_tiers import ModelTierPolicy
+from utils.metrics import record_prompt, run_in_executor, span
+import logging
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
+import time
 import uuid
 
+logger = logging.getLogger(__name__)
+
+# How the stored "User/Agent" interaction is vectorized:
+# - "transcript": embed the full transcript (a second encode pass per turn)
+# - "query": reuse the query vector computed for retrieval (one pass per turn)
+MEMORY_VECTOR_POLICIES = ("transcript", "query")
+
 class BaseAgent(ABC):
+    # Knowledge directory scope of the agent's FAQs or catalog (None for none)
+    knowledge_scope: Optional[str] = None
+    # Reference text used when a knowledge search finds nothing; built from
+    # the scope's knowledge files (see `load_knowledge_fallback`)
+    knowledge_fallback: Optional[str] = None
+    
     def __init__(self, 
                  llm_manager: GroqLLMManager, 
-                 memory: QdrantMemory,
+                 memory: MemoryBackend,
                  system_message: str = None,
                  name: str = "Agent",
-                 description: str = "A helpful AI agent"):
+                 description: str = "A helpful AI agent",
+                 memory_vector_policy: str = "transcript",
+                 concurrent_retrieval: bool = False,
+                 history_store: Optional[HistoryStore] = None,
+                 history_limit: int = 10,
+                 context_builder: Optional[ContextBuilder] = None,
+                 model_policy: Optional[ModelTierPolicy] = None,
+                 knowledge: Optional[KnowledgeIndex] = None,
+                 knowledge_dir: Optional[str] = None):
         """
         Initialize the base agent.
         
@@ -20,62 +51,424 @@ class BaseAgent(ABC):
             system_message: System message to guide the agent's behavior
             name: Name of the agent
             description: Description of the agent's purpose
+            memory_vector_policy: Which vector to store interactions under
+                ("transcript" or "query")
+            concurrent_retrieval: Run memory retrieval concurrently with
+                history preparation
+            history_store: Where conversation history is kept (defaults to a
+                process-local ring buffer per user)
+            history_limit: Number of history messages included in the prompt
+            context_builder: Optional builder that fits history and memories
+                into a token budget
+            model_policy: Optional tiering policy choosing the model per turn,
+                looked up by agent class name
+            knowledge: Optional index queried each turn for the agent's
+                knowledge snippets; without one the agent's prompt carries
+                its reference information inline
+            knowledge_dir: Directory of the knowledge files (defaults to
+                knowledge/ in the repository)
         """
+        if memory_vector_policy not in MEMORY_VECTOR_POLICIES:
+            raise ValueError(f"Unknown memory vector policy: {memory_vector_policy}")
+        
         self.llm_manager = llm_manager
         self.memory = memory
+        self.knowledge = knowledge
+        self.knowledge_dir = knowledge_dir
         self.system_message = system_message
         self.name = name
         self.description = description
-        self.conversation_history = {}
+        self.memory_vector_policy = memory_vector_policy
+        self.concurrent_retrieval = concurrent_retrieval
+        self.history_store = history_store or InMemoryHistoryStore(capacity=history_limit)
+        self.history_limit = history_limit
+        self.context_builder = context_builder
+        self.model_policy = model_policy
+        self._retrieval_pool = None
     
-    def process_message(self, message: str, user_id: str = None) -> str:
+    def process_message(self, message: str, user_id: str = None, model: Optional[str] = None,
+                        query_embedding=None) -> str:
         """
         Process a message from a user and return a response.
         
         Args:
             message: The user's message
             user_id: Unique identifier for the user
+            model: Model override (otherwise chosen by the model policy)
+            query_embedding: Precomputed vector of the message (e.g. from the
+                router), so it is not embedded again
             
         Returns:
             Agent's response
         """
-        # Create a user ID if not provided
-        if user_id is None:
-            user_id = str(uuid.uuid4())
+        with span("agent.turn"):
+            user_id, messages, query_embedding, model = self._begin_turn(message, user_id, model, query_embedding)
             
-        # Initialize conversation history for new users
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
+            # Generate response
+            response = self.llm_manager.generate_with_history(messages, cache_scope=self.name, cache_user=user_id, model=model)
             
-        # Retrieve relevant memories
-        relevant_memories = self.memory.search_memories(message, user_id=user_id)
-        context = self._format_memories(relevant_memories)
+            self._finish_turn(message, response, user_id, query_embedding)
         
-        # Prepare messages for the LLM
-        messages = self._prepare_messages(message, user_id, context)
+        return response
+    
+    def stream_message(self, message: str, user_id: str = None, model: Optional[str] = None,
+                       query_embedding=None) -> Iterator[str]:
+        """
+        Process a message and stream the response as it is generated.
         
-        # Generate response
-        response = self.llm_manager.generate_with_history(messages)
+        History and memory are updated once the stream has been fully consumed.
         
-        # Update conversation history
-        self.conversation_history[user_id].append({
-            "role": "user",
-            "content": message
-        })
-        self.conversation_history[user_id].append({
-            "role": "assistant",
-            "content": response
-        })
+        Args:
+            message: The user's message
+            user_id: Unique identifier for the user
+            model: Model override (otherwise chosen by the model policy)
+            query_embedding: Precomputed vector of the message
+            
+        Yields:
+            Chunks of the agent's response
+        """
+        user_id, messages, query_embedding, model = self._begin_turn(message, user_id, model, query_embedding)
         
-        # Store interaction in memory
-        self.memory.add_memory(
-            text=f"User: {message}\nAgent: {response}",
-            metadata={"interaction_type": "conversation"},
-            user_id=user_id
-        )
+        chunks = []
+        for chunk in self.llm_manager.stream_with_history(messages, cache_scope=self.name, cache_user=user_id, model=model):
+            chunks.append(chunk)
+            yield chunk
+        
+        self._finish_turn(message, "".join(chunks), user_id, query_embedding)
+    
+    async def aprocess_message(self, message: str, user_id: str = None, model: Optional[str] = None,
+                               query_embedding=None) -> str:
+        """Async variant of `process_message`; never blocks the event loop."""
+        with span("agent.turn"):
+            user_id, messages, query_embedding, model = await self._abegin_turn(message, user_id, model, query_embedding)
+            
+            response = await self.llm_manager.agenerate_with_history(messages, cache_scope=self.name, cache_user=user_id, model=model)
+            
+            await self._afinish_turn(message, response, user_id, query_embedding)
         
         return response
     
+    async def astream_message(self, message: str, user_id: str = None, model: Optional[str] = None,
+                              query_embedding=None) -> AsyncIterator[str]:
+        """Async variant of `stream_message`."""
+        user_id, messages, query_embedding, model = await self._abegin_turn(message, user_id, model, query_embedding)
+        
+        chunks = []
+        async for chunk in self.llm_manager.astream_with_history(messages, cache_scope=self.name, cache_user=user_id, model=model):
+            chunks.append(chunk)
+            yield chunk
+        
+        await self._afinish_turn(message, "".join(chunks), user_id, query_embedding)
+    
+    def process_batch(self,
+                      messages: List[str],
+                      user_ids: Optional[List[Optional[str]]] = None,
+                      concurrency: int = 8,
+                      batch_size: int = 64) -> Iterator[Dict[str, Any]]:
+        """
+        Process many independent messages, yielding results as they complete.
+        
+        Each chunk of `batch_size` messages is embedded in one pass and
+        searched in one Qdrant round trip. LLM calls then run with at most
+        `concurrency` in flight. History is read before the chunk's replies
+        are recorded, so repeated messages from one user in the same chunk
+        don't see each other.
+        
+        Args:
+            messages: The users' messages
+            user_ids: User ID per message (generated when missing)
+            concurrency: Maximum number of concurrent LLM calls
+            batch_size: Messages embedded and searched together
+            
+        Yields:
+            {"index", "user_id", "response"} per message, or {"index", "user_id", "error"}
+            when retrieval or the LLM call failed for it
+        """
+        user_ids = [self._resolve_user(user_id) for user_id in (user_ids or [None] * len(messages))]
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"{self.name} batch")
+        pending = set()
+        try:
+            for start in range(0, len(messages), batch_size):
+                turns = self._begin_batch(messages[start:start + batch_size], user_ids[start:start + batch_size])
+                for index, turn in enumerate(turns, start):
+                    if isinstance(turn, Exception):
+                        yield _batch_error(index, user_ids[index], turn)
+                        continue
+                    while len(pending) >= concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                    pending.add(pool.submit(self._run_batch_turn, index, *turn))
+            
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            pool.shutdown(wait=False)
+    
+    async def aprocess_batch(self,
+                             messages: List[str],
+                             user_ids: Optional[List[Optional[str]]] = None,
+                             concurrency: int = 8,
+                             batch_size: int = 64) -> AsyncIterator[Dict[str, Any]]:
+        """Async variant of `process_batch`."""
+        user_ids = [self._resolve_user(user_id) for user_id in (user_ids or [None] * len(messages))]
+        pending = set()
+        try:
+            for start in range(0, len(messages), batch_size):
+                turns = await self._abegin_batch(messages[start:start + batch_size], user_ids[start:start + batch_size])
+                for index, turn in enumerate(turns, start):
+                    if isinstance(turn, Exception):
+                        yield _batch_error(index, user_ids[index], turn)
+                        continue
+                    while len(pending) >= concurrency:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            yield task.result()
+                    pending.add(asyncio.ensure_future(self._arun_batch_turn(index, *turn)))
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _begin_batch(self, messages: List[str], user_ids: List[str]):
+        """
+        Batched `_begin_turn`: one embedding pass and one search round trip.
+        
+        If the batched calls fail, the messages are retried one at a time.
+        
+        Returns:
+            A turn per message, or the exception retrieval failed with for it
+        """
+        try:
+            query_embeddings = self.memory.embed_batch(messages)
+            memories = self.memory.search_memories_batch(messages, user_ids=user_ids, query_embeddings=query_embeddings)
+        except Exception:
+            logger.exception("%s batch retrieval failed; retrying its %d items one by one", self.name, len(messages))
+            return [self._begin_batch_item(message, user_id) for message, user_id in zip(messages, user_ids)]
+        
+        return self._batch_turns(messages, user_ids, query_embeddings, memories)
+    
+    async def _abegin_batch(self, messages: List[str], user_ids: List[str]):
+        """Async variant of `_begin_batch`."""
+        try:
+            query_embeddings = await self.memory.aembed_batch(messages)
+            memories = await self.memory.asearch_memories_batch(messages, user_ids=user_ids, query_embeddings=query_embeddings)
+        except Exception:
+            logger.exception("%s batch retrieval failed; retrying its %d items one by one", self.name, len(messages))
+            return [await self._abegin_batch_item(message, user_id) for message, user_id in zip(messages, user_ids)]
+        
+        # History reads and knowledge searches may block (SQLite, first index build)
+        return await run_in_executor(self._batch_turns, messages, user_ids, query_embeddings, memories)
+    
+    def _begin_batch_item(self, message, user_id):
+        try:
+            user_id, llm_messages, query_embedding, model = self._begin_turn(message, user_id)
+        except Exception as e:
+            logger.exception("%s batch item retrieval failed", self.name)
+            return e
+        return message, user_id, llm_messages, query_embedding, model
+    
+    async def _abegin_batch_item(self, message, user_id):
+        try:
+            user_id, llm_messages, query_embedding, model = await self._abegin_turn(message, user_id)
+        except Exception as e:
+            logger.exception("%s batch item retrieval failed", self.name)
+            return e
+        return message, user_id, llm_messages, query_embedding, model
+    
+    def _batch_turns(self, messages, user_ids, query_embeddings, memories):
+        turns = []
+        for message, user_id, query_embedding, found in zip(messages, user_ids, query_embeddings, memories):
+            try:
+                history = self._history_messages(user_id)
+                knowledge = self._search_knowledge(message, query_embedding)
+                llm_messages = self._build_messages(message, user_id, found, history, knowledge)
+            except Exception as e:
+                logger.exception("%s batch item retrieval failed", self.name)
+                turns.append(e)
+                continue
+            turns.append((message, user_id, llm_messages, query_embedding, self._select_model(message, history)))
+        return turns
+    
+    def _run_batch_turn(self, index, message, user_id, messages, query_embedding, model):
+        try:
+            response = self.llm_manager.generate_with_history(messages, cache_scope=self.name, cache_user=user_id, model=model)
+            self._finish_turn(message, response, user_id, query_embedding)
+        except Exception as e:
+            logger.exception("%s batch item %d failed", self.name, index)
+            return _batch_error(index, user_id, e)
+        return {"index": index, "user_id": user_id, "response": response}
+    
+    async def _arun_batch_turn(self, index, message, user_id, messages, query_embedding, model):
+        try:
+            response = await self.llm_manager.agenerate_with_history(messages, cache_scope=self.name, cache_user=user_id, model=model)
+            await self._afinish_turn(message, response, user_id, query_embedding)
+        except Exception as e:
+            logger.exception("%s batch item %d failed", self.name, index)
+            return _batch_error(index, user_id, e)
+        return {"index": index, "user_id": user_id, "response": response}
+    
+    def _begin_turn(self, message: str, user_id: Optional[str], model: Optional[str] = None, query_embedding=None):
+        """Resolve the user, retrieve memories, build the LLM messages and pick the model for a turn."""
+        user_id = self._resolve_user(user_id)
+        
+        if self.concurrent_retrieval:
+            # Embed and search on a worker thread while the history is prepared;
+            # the copied context keeps its spans in this request's timings
+            retrieval = self._get_retrieval_pool().submit(
+                contextvars.copy_context().run, self._retrieve, message, user_id, query_embedding
+            )
+            history = self._history_messages(user_id)
+            query_embedding, memories = retrieval.result()
+        else:
+            query_embedding, memories = self._retrieve(message, user_id, query_embedding)
+            history = self._history_messages(user_id)
+        knowledge = self._search_knowledge(message, query_embedding)
+        
+        # Prepare messages for the LLM
+        with span("agent.prompt"):
+            messages = self._build_messages(message, user_id, memories, history, knowledge)
+        
+        return user_id, messages, query_embedding, model or self._select_model(message, history)
+    
+    async def _abegin_turn(self, message: str, user_id: Optional[str], model: Optional[str] = None,
+                           query_embedding=None):
+        """Async variant of `_begin_turn`."""
+        user_id = self._resolve_user(user_id)
+        
+        if self.concurrent_retrieval:
+            retrieval = asyncio.ensure_future(self._aretrieve(message, user_id, query_embedding))
+            history = await run_in_executor(self._history_messages, user_id)
+            query_embedding, memories = await retrieval
+        else:
+            query_embedding, memories = await self._aretrieve(message, user_id, query_embedding)
+            history = await run_in_executor(self._history_messages, user_id)
+        knowledge = await self._asearch_knowledge(message, query_embedding)
+        
+        with span("agent.prompt"):
+            messages = self._build_messages(message, user_id, memories, history, knowledge)
+        
+        return user_id, messages, query_embedding, model or self._select_model(message, history)
+    
+    def _select_model(self, message: str, history: List[Dict[str, str]]) -> Optional[str]:
+        """Model chosen by the tiering policy for this agent class (None for the default)."""
+        if self.model_policy is None:
+            return None
+        return self.model_policy.select(type(self).__name__, message=message, history=history)
+    
+    def _retrieve(self, message: str, user_id: str, query_embedding=None):
+        """Embed the query (unless already embedded) and retrieve relevant memories."""
+        with span("agent.retrieve"):
+            # Embed the query once; the vector may be reused when storing the interaction
+            if query_embedding is None:
+                query_embedding = self.memory.embed_batch([message])[0]
+            
+            # Retrieve relevant memories
+            relevant_memories = self.memory.search_memories(
+                message, user_id=user_id, query_embedding=query_embedding
+            )
+        
+        return query_embedding, relevant_memories
+    
+    async def _aretrieve(self, message: str, user_id: str, query_embedding=None):
+        """Async variant of `_retrieve`."""
+        with span("agent.retrieve"):
+            if query_embedding is None:
+                query_embedding = (await self.memory.aembed_batch([message]))[0]
+            relevant_memories = await self.memory.asearch_memories(
+                message, user_id=user_id, query_embedding=query_embedding
+            )
+        
+        return query_embedding, relevant_memories
+    
+    def _search_knowledge(self, message: str, query_embedding=None) -> List[Dict[str, Any]]:
+        """
+        Knowledge snippets relevant to the message, reusing the query vector.
+        
+        When nothing matches, the agent's `knowledge_fallback` is returned as
+        a single snippet so the prompt never loses its reference information.
+        """
+        if self.knowledge is None or not self.knowledge_scope:
+            return []
+        with span("agent.knowledge"):
+            snippets = self.knowledge.search(message, scope=self.knowledge_scope, query_embedding=query_embedding)
+        if not snippets and self.knowledge_fallback:
+            return [{"title": "", "text": self.knowledge_fallback, "source": None, "score": 0.0}]
+        return snippets
+    
+    def load_knowledge_fallback(self, knowledge_dir: Optional[str] = None) -> Optional[str]:
+        """
+        Build the agent's reference text from its knowledge files.
+        
+        The files are the only copy of the catalog and FAQs, so the inline
+        prompt and the indexed snippets never disagree.
+        """
+        if not self.knowledge_scope:
+            return None
+        sections = load_sections(self.knowledge_scope, knowledge_dir or DEFAULT_KNOWLEDGE_DIR)
+        return self.format_knowledge_fallback(sections) if sections else None
+    
+    def format_knowledge_fallback(self, sections: List[Dict[str, str]]) -> str:
+        """Reference text from knowledge sections; the full text unless an agent condenses it."""
+        return self._format_knowledge(sections)[len("Reference information:\n"):]
+    
+    async def _asearch_knowledge(self, message: str, query_embedding=None) -> List[Dict[str, Any]]:
+        """Async variant of `_search_knowledge`."""
+        if self.knowledge is None or not self.knowledge_scope:
+            return []
+        return await run_in_executor(self._search_knowledge, message, query_embedding)
+    
+    def _get_retrieval_pool(self) -> ThreadPoolExecutor:
+        if self._retrieval_pool is None:
+            self._retrieval_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"{self.name} retrieval")
+        return self._retrieval_pool
+    
+    def _resolve_user(self, user_id: Optional[str]) -> str:
+        """Create a user ID if not provided."""
+        if user_id is None:
+            user_id = str(uuid.uuid4())
+            
+        return user_id
+    
+    def _finish_turn(self, message: str, response: str, user_id: str, query_embedding=None):
+        """Record a completed exchange in the conversation history and memory."""
+        with span("agent.record"):
+            self._record_history(message, response, user_id)
+            
+            # Store interaction in memory
+            self.memory.add_memory(**self._interaction_memory(message, response, user_id, query_embedding))
+    
+    async def _afinish_turn(self, message: str, response: str, user_id: str, query_embedding=None):
+        """Async variant of `_finish_turn`."""
+        with span("agent.record"):
+            await run_in_executor(self._record_history, message, response, user_id)
+            
+            await self.memory.aadd_memory(**self._interaction_memory(message, response, user_id, query_embedding))
+    
+    def _record_history(self, message: str, response: str, user_id: str):
+        """Append an exchange to the user's conversation history."""
+        self.history_store.append(self.name, user_id, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": response}
+        ])
+    
+    def _interaction_memory(self, message: str, response: str, user_id: str, query_embedding=None) -> Dict[str, Any]:
+        """Build the "User/Agent" transcript memory according to the vector policy."""
+        embedding = query_embedding if self.memory_vector_policy == "query" else None
+        
+        return {
+            "text": f"User: {message}\nAgent: {response}",
+            "metadata": {"interaction_type": "conversation", "created_at": time.time()},
+            "user_id": user_id,
+            "embedding": embedding
+        }
+    
     def _format_memories(self, memories: List[Dict[str, Any]]) -> str:
         """Format retrieved memories as context for the LLM."""
         if not memories:
@@ -87,7 +480,42 @@ class BaseAgent(ABC):
             
         return formatted_memories
     
-    def _prepare_messages(self, message: str, user_id: str, context: str) -> List[Dict[str, str]]:
+    def _format_knowledge(self, knowledge: Optional[List[Dict[str, Any]]]) -> str:
+        """Format knowledge snippets as reference information for the LLM."""
+        if not knowledge:
+            return ""
+        
+        return "Reference information:\n" + "\n\n".join(
+            f"{snippet['title']}\n{snippet['text']}" if snippet["title"] else snippet["text"]
+            for snippet in knowledge
+        )
+    
+    def _history_messages(self, user_id: str) -> List[Dict[str, str]]:
+        """Return the abbreviated conversation history (last 5 exchanges by default)."""
+        with span("agent.history"):
+            return self.history_store.get(self.name, user_id, limit=self.history_limit)
+    
+    def _build_messages(self, message: str, user_id: str, memories: List[Dict[str, Any]],
+                        history: List[Dict[str, str]],
+                        knowledge: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, str]]:
+        """Build the LLM messages, within the token budget when a context builder is set."""
+        reference = self._format_knowledge(knowledge)
+        if self.context_builder is None:
+            return self._prepare_messages(
+                message, user_id, self._format_memories(memories), history=history, reference=reference
+            )
+        
+        messages, stats = self.context_builder.build(
+            self.system_message, history, memories, message, reference=reference
+        )
+        record_prompt(self.name, stats)
+        logger.debug("%s prompt: %s", self.name, stats)
+        
+        return messages
+    
+    def _prepare_messages(self, message: str, user_id: str, context: str,
+                          history: Optional[List[Dict[str, str]]] = None,
+                          reference: str = "") -> List[Dict[str, str]]:
         """Prepare messages for the LLM including history and context."""
         messages = []
         
@@ -97,11 +525,18 @@ class BaseAgent(ABC):
                 "role": "system",
                 "content": self.system_message
             })
+        
+        # Add knowledge snippets for this turn
+        if reference:
+            messages.append({
+                "role": "system",
+                "content": reference
+            })
             
-        # Add abbreviated conversation history (last 5 messages)
-        if user_id in self.conversation_history:
-            history = self.conversation_history[user_id][-10:]  # Last 5 exchanges (10 messages)
-            messages.extend(history)
+        # Add abbreviated conversation history
+        if history is None:
+            history = self._history_messages(user_id)
+        messages.extend(history)
             
         # Add context from memory if available
         if context:
@@ -122,3 +557,7 @@ class BaseAgent(ABC):
     def get_agent_prompt(self) -> str:
         """Return the agent-specific system prompt."""
         pass
+
+
+def _batch_error(index: int, user_id: str, error: Exception) -> Dict[str, Any]:
+    return {"index": index, "user_id": user_id, "error": str(error)}
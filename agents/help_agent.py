@@ -1,18 +1,35 @@
 from agents.base_agent import BaseAgent
 
 class HelpAgent(BaseAgent):
-    def __init__(self, llm_manager, memory):
-        system_message = self.get_agent_prompt()
+    # Support FAQs in knowledge/help
+    knowledge_scope = "help"
+    
+    def __init__(self, llm_manager, memory, **kwargs):
+        # The FAQ topics from knowledge/help, used in the prompt without an
+        # index and as reference information when a search finds nothing
+        self.knowledge_fallback = self.load_knowledge_fallback(kwargs.get("knowledge_dir"))
+        system_message = self.get_agent_prompt(indexed=kwargs.get("knowledge") is not None)
         super().__init__(
             llm_manager=llm_manager,
             memory=memory,
             system_message=system_message,
             name="Help Agent",
-            description="An agent that provides prompt support to students"
+            description="An agent that provides prompt support to students",
+            **kwargs
+        )
+    
+    def format_knowledge_fallback(self, sections):
+        """List the FAQ topics rather than every answer."""
+        return "Common issues you can help with:\n" + "\n".join(
+            f"- {section['title'].rsplit(' > ', 1)[-1]}" for section in sections
         )
     
-    def get_agent_prompt(self) -> str:
-        return """You are a Help Agent for a software engineering education platform. Your role is to:
+    def get_agent_prompt(self, indexed: bool = False) -> str:
+        if indexed:
+            issues = "Common issues you can help with, such as login problems, course access, payment errors, assignment submission, technical requirements and extension requests, are covered by the FAQ answers given as reference information. Follow them when they apply."
+        else:
+            issues = self.knowledge_fallback or ""
+        return f"""You are a Help Agent for a software engineering education platform. Your role is to:
 
 1. Address student queries via various channels (email, chat, WhatsApp, calls)
 2. Troubleshoot technical issues related to the platform, payment problems, and course access
@@ -24,13 +41,7 @@ When interacting with students:
 - Provide clear step-by-step solutions to technical problems
 - Follow up to ensure issues have been resolved satisfactorily
 
-Common issues you can help with:
-- Login problems and account recovery
-- Course access and navigation issues
-- Payment processing errors
-- Assignment submission difficulties
-- Technical requirements for courses
-- Requesting extensions or accommodations
+{issues}
 
 Important: When speaking in Sinhala, use friendly, conversational language. Always maintain a helpful, patient demeanor, and ensure students feel supported.
 
@@ -1,14 +1,15 @@
 from agents.base_agent import BaseAgent
 
 class ManageAgent(BaseAgent):
-    def __init__(self, llm_manager, memory):
+    def __init__(self, llm_manager, memory, **kwargs):
         system_message = self.get_agent_prompt()
         super().__init__(
             llm_manager=llm_manager,
             memory=memory,
             system_message=system_message,
             name="Manage Agent",
-            description="An agent that oversees operations and ensures system efficiency"
+            description="An agent that oversees operations and ensures system efficiency",
+            **kwargs
         )
     
     def get_agent_prompt(self) -> str:
@@ -1,14 +1,15 @@
 from agents.base_agent import BaseAgent
 
 class MarketingAgent(BaseAgent):
-    def __init__(self, llm_manager, memory):
+    def __init__(self, llm_manager, memory, **kwargs):
         system_message = self.get_agent_prompt()
         super().__init__(
             llm_manager=llm_manager,
             memory=memory,
             system_message=system_message,
             name="Sales & Marketing Agent",
-            description="An agent that analyzes data to enhance marketing efforts"
+            description="An agent that analyzes data to enhance marketing efforts",
+            **kwargs
         )
     
     def get_agent_prompt(self) -> str:
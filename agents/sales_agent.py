@@ -1,18 +1,29 @@
 from agents.base_agent import BaseAgent
 
 class SalesAgent(BaseAgent):
-    def __init__(self, llm_manager, memory):
-        system_message = self.get_agent_prompt()
+    # Course catalog in knowledge/sales
+    knowledge_scope = "sales"
+    
+    def __init__(self, llm_manager, memory, **kwargs):
+        # The catalog from knowledge/sales, used in the prompt without an index
+        # and as reference information when a search finds nothing
+        self.knowledge_fallback = self.load_knowledge_fallback(kwargs.get("knowledge_dir"))
+        system_message = self.get_agent_prompt(indexed=kwargs.get("knowledge") is not None)
         super().__init__(
             llm_manager=llm_manager,
             memory=memory,
             system_message=system_message,
             name="Sales Agent",
-            description="An agent that promotes and sells educational courses"
+            description="An agent that promotes and sells educational courses",
+            **kwargs
         )
     
-    def get_agent_prompt(self) -> str:
-        return """You are a Sales Agent for a software engineering education platform. Your role is to:
+    def get_agent_prompt(self, indexed: bool = False) -> str:
+        if indexed:
+            catalog = "Course details, prices and key selling points are given as reference information. Only quote courses, prices and figures found there.\n"
+        else:
+            catalog = self.knowledge_fallback or ""
+        return f"""You are a Sales Agent for a software engineering education platform. Your role is to:
 
 1. Identify and engage potential students
 2. Build trust with prospects and maintain customer relationships
@@ -29,16 +40,4 @@ You should be able to explain our course offerings, pricing models, and the uniq
 
 Important: When speaking in Sinhala, use friendly, conversational language rather than formal language.
 
-Course offerings:
-- Web Development Bootcamp (12 weeks, $4,999)
-- Data Science & AI Program (16 weeks, $6,499)
-- Mobile App Development (10 weeks, $4,499)
-- DevOps Engineering (8 weeks, $3,999)
-
-Key selling points:
-- 94% job placement rate within 6 months
-- Industry-experienced instructors
-- Project-based curriculum
-- Career services and networking opportunities
-- Flexible payment plans available
-"""
+{catalog}"""
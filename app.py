@@ -1,42 +1,119 @@
-from flask import Flask, request, jsonify
+import time
+_started = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from dotenv import load_dotenv
 import os
-from agents.sales_agent import SalesAgent
-from agents.help_agent import HelpAgent
-from agents.manage_agent import ManageAgent
-from agents.marketing_agent import MarketingAgent
-from utils.memory import QdrantMemory
-from utils.llm_manager import GroqLLMManager
+import json
+from utils.batching import parse_batch
+from utils.factory import Components
+from utils.startup import StartupTimer
+from utils import metrics
 
 # Load environment variables
 load_dotenv()
 
+# Per-phase startup timings, logged when startup completes
+startup = StartupTimer(_started)
+startup.mark("imports")
+
 app = Flask(__name__)
 
-# Initialize dependencies
-qdrant_memory = QdrantMemory(
-    url=os.getenv("QDRANT_URL", "http://localhost:6333"),
-    collection_name="agent_memory"
-)
+# Initialize dependencies from the environment (see utils/factory.py);
+# asgi.py and chainlit_app.py build theirs the same way
+components = Components(startup)
+agent_memory = components.agent_memory
+llm_manager = components.llm_manager
+agent_options = components.agent_options
+
+# Map agent IDs to agent instances
+agents = components.agents
+sales_agent = agents["sales"]
+help_agent = agents["help"]
+manage_agent = agents["manage"]
+marketing_agent = agents["marketing"]
 
-llm_manager = GroqLLMManager(
-    api_key=os.getenv("GROQ_API_KEY"),
-    model=os.getenv("GROQ_MODEL", "llama3-70b-8192")
-)
+# Warm-up, readiness and graceful shutdown. Under gunicorn with preload_app
+# this runs once in the master and workers inherit the loaded model.
+lifecycle = components.lifecycle
+components.warm_up_on_start(startup)
+lifecycle.startup_report = startup.report()
 
-# Initialize agents
-sales_agent = SalesAgent(llm_manager=llm_manager, memory=qdrant_memory)
-help_agent = HelpAgent(llm_manager=llm_manager, memory=qdrant_memory)
-manage_agent = ManageAgent(llm_manager=llm_manager, memory=qdrant_memory)
-marketing_agent = MarketingAgent(llm_manager=llm_manager, memory=qdrant_memory)
+# Memory compaction and retention (MEMORY_COMPACTION_* variables)
+memory_compactor = components.memory_compactor
+start_background_jobs = components.start_background_jobs
 
-# Map agent IDs to agent instances
-agents = {
-    "sales": sales_agent,
-    "help": help_agent,
-    "manage": manage_agent,
-    "marketing": marketing_agent
-}
+# Metrics read at scrape time from the components that already track them
+components.register_metrics()
+
+# Add a Server-Timing header with per-span durations to every response
+TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "false").lower() == "true"
+
+@app.before_request
+def start_timing():
+    start_background_jobs()
+    g.metrics_start = time.perf_counter()
+    g.metrics_token = metrics.start_request()
+    metrics.HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_timing(response):
+    elapsed = time.perf_counter() - g.metrics_start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    metrics.HTTP_SECONDS.observe(elapsed, endpoint=endpoint)
+    # Streamed bodies are produced later, so their headers only cover the work done so far
+    if TIMING_HEADERS:
+        response.headers['Server-Timing'] = metrics.server_timing(metrics.request_timings() or {}, elapsed)
+    return response
+
+@app.teardown_request
+def end_timing(exc):
+    if 'metrics_token' in g:
+        metrics.end_request(g.pop('metrics_token'))
+        metrics.HTTP_IN_FLIGHT.dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    if not lifecycle.ready:
+        lifecycle.warm_up_in_background()
+        return jsonify(lifecycle.status()), 503
+    return jsonify(lifecycle.status())
+
+def _stream_mode(data):
+    """Return the requested streaming mode ("sse" or "chunked"), or None."""
+    mode = data.get('stream')
+    if mode is None and 'text/event-stream' in request.headers.get('Accept', ''):
+        mode = 'sse'
+    if mode is True:
+        mode = 'sse'
+    return mode if mode in ('sse', 'chunked') else None
+
+def _stream_response(agent, user_input, user_id, mode):
+    """Stream an agent's response as Server-Sent Events or plain chunked text."""
+    tokens = agent.stream_message(user_input, user_id)
+    
+    if mode == 'chunked':
+        return Response(stream_with_context(tokens), mimetype='text/plain')
+    
+    def events():
+        for token in tokens:
+            yield f"data: {json.dumps({'token': token})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -50,11 +127,31 @@ def chat():
     if agent_id not in agents:
         return jsonify({"error": "Invalid agent ID"}), 400
     
+    mode = _stream_mode(data)
+    if mode:
+        return _stream_response(agents[agent_id], user_input, user_id, mode)
+    
     # Process the message with the selected agent
     response = agents[agent_id].process_message(user_input, user_id)
     
     return jsonify({"response": response})
 
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Process many messages and stream the results back as NDJSON, in completion order."""
+    groups, concurrency, error = parse_batch(request.json, agents)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    
+    def lines():
+        for agent_id, group in groups.items():
+            indexes, messages, user_ids = zip(*group)
+            for result in agents[agent_id].process_batch(list(messages), list(user_ids), concurrency=concurrency):
+                result.update(index=indexes[result["index"]], agent_id=agent_id)
+                yield json.dumps(result) + "\n"
+    
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
 @app.route('/agent/<agent_id>', methods=['POST'])
 def agent_endpoint(agent_id):
     if agent_id not in agents:
@@ -64,10 +161,15 @@ def agent_endpoint(agent_id):
     user_input = data.get('message')
     user_id = data.get('user_id')
     
+    mode = _stream_mode(data)
+    if mode:
+        return _stream_response(agents[agent_id], user_input, user_id, mode)
+    
     # Process the message with the specified agent
     response = agents[agent_id].process_message(user_input, user_id)
     
     return jsonify({"response": response})
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true', host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
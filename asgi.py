@@ -0,0 +1,171 @@
+"""
+ASGI variant of the Flask API, built from the same configuration.
+
+Run with: uvicorn asgi:app, or under gunicorn with
+GUNICORN_APP=asgi:app GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+Agents run on their async paths, so one worker serves many concurrent
+requests without a thread each.
+"""
+import time
+_started = time.perf_counter()
+
+import json
+import os
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from utils import metrics
+from utils.batching import parse_batch
+from utils.factory import Components
+from utils.startup import StartupTimer
+
+load_dotenv()
+
+startup = StartupTimer(_started)
+startup.mark("imports")
+
+# Same components as app.py (see utils/factory.py)
+components = Components(startup)
+agents = components.agents
+lifecycle = components.lifecycle
+memory_compactor = components.memory_compactor
+components.warm_up_on_start(startup)
+lifecycle.startup_report = startup.report()
+components.register_metrics()
+
+# Add a Server-Timing header with per-span durations to every response
+TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "false").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(_):
+    if not lifecycle.ready:
+        lifecycle.warm_up_in_background()
+    components.start_background_jobs()
+    yield
+    memory_compactor.stop()
+    await lifecycle.ashutdown()
+
+
+app = FastAPI(title="Agentic AI System", lifespan=lifespan)
+
+
+@app.middleware('http')
+async def record_timing(request: Request, call_next):
+    start = time.perf_counter()
+    token = metrics.start_request()
+    metrics.HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if TIMING_HEADERS:
+            timings = metrics.request_timings() or {}
+            response.headers['Server-Timing'] = metrics.server_timing(timings, time.perf_counter() - start)
+        return response
+    finally:
+        route = request.scope.get('route')
+        endpoint = route.path if route is not None else 'unmatched'
+        metrics.HTTP_REQUESTS.inc(endpoint=endpoint, status=status)
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        metrics.HTTP_IN_FLIGHT.dec()
+        metrics.end_request(token)
+
+
+def _stream_mode(data, request):
+    """Return the requested streaming mode ("sse" or "chunked"), or None."""
+    mode = data.get('stream')
+    if mode is None and 'text/event-stream' in request.headers.get('accept', ''):
+        mode = 'sse'
+    if mode is True:
+        mode = 'sse'
+    return mode if mode in ('sse', 'chunked') else None
+
+
+def _stream_response(agent, user_input, user_id, mode):
+    """Stream an agent's response as Server-Sent Events or plain chunked text."""
+    tokens = agent.astream_message(user_input, user_id)
+
+    if mode == 'chunked':
+        return StreamingResponse(tokens, media_type='text/plain')
+
+    async def events():
+        async for token in tokens:
+            yield f"data: {json.dumps({'token': token})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def _respond(agent, data, request):
+    user_input = data.get('message')
+    user_id = data.get('user_id')
+
+    mode = _stream_mode(data, request)
+    if mode:
+        return _stream_response(agent, user_input, user_id, mode)
+
+    response = await agent.aprocess_message(user_input, user_id)
+
+    return {"response": response}
+
+
+@app.post('/chat')
+async def chat(request: Request):
+    data = await request.json()
+    agent_id = data.get('agent_id', 'help')  # Default to help agent
+
+    if agent_id not in agents:
+        return JSONResponse({"error": "Invalid agent ID"}, status_code=400)
+
+    return await _respond(agents[agent_id], data, request)
+
+
+@app.post('/chat/batch')
+async def chat_batch(request: Request):
+    """Process many messages and stream the results back as NDJSON, in completion order."""
+    groups, concurrency, error = parse_batch(await request.json(), agents)
+    if error:
+        return JSONResponse({"error": error[0]}, status_code=error[1])
+
+    async def lines():
+        for agent_id, group in groups.items():
+            indexes, messages, user_ids = zip(*group)
+            async for result in agents[agent_id].aprocess_batch(list(messages), list(user_ids), concurrency=concurrency):
+                result.update(index=indexes[result["index"]], agent_id=agent_id)
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+@app.post('/agent/{agent_id}')
+async def agent_endpoint(agent_id: str, request: Request):
+    if agent_id not in agents:
+        return JSONResponse({"error": "Agent not found"}, status_code=404)
+
+    return await _respond(agents[agent_id], await request.json(), request)
+
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.get('/healthz')
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get('/readyz')
+async def readyz():
+    if not lifecycle.ready:
+        lifecycle.warm_up_in_background()
+        return JSONResponse(lifecycle.status(), status_code=503)
+    return lifecycle.status()
@@ -0,0 +1 @@
+"""Offline benchmarks: a fake Groq server and a load generator (see benchmarks.load)."""
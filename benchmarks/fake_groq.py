@@ -0,0 +1,201 @@
+"""
+Groq/OpenAI-compatible chat completion server for offline benchmarks.
+
+Replies after a fixed first-token latency and then emit tokens at a fixed
+rate, with or without streaming, so runs are repeatable and cost nothing.
+Router prompts are answered with an agent name. Point the app at it with
+GROQ_BASE_URL:
+
+    python -m benchmarks.fake_groq --port 8787 --latency-ms 200 --tokens-per-second 250
+    GROQ_BASE_URL=http://127.0.0.1:8787 QDRANT_URL=:memory: python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+COMPLETION_PATHS = ("/openai/v1/chat/completions", "/v1/chat/completions")
+
+# Marker of AgentGraph's router prompt
+ROUTER_MARKER = "Reply with just the agent name"
+
+FILLER = (
+    "Thanks for reaching out. Our programs combine live sessions with hands-on projects, "
+    "and a mentor reviews your work every week so you always know what to improve next. "
+).split()
+
+
+@dataclass
+class FakeGroqSettings:
+    latency_ms: float = 200.0
+    jitter_ms: float = 0.0
+    tokens_per_second: float = 250.0
+    completion_tokens: int = 64
+    route: str = "help"
+
+    def reply(self, messages: List[Dict[str, str]], max_tokens: int) -> List[str]:
+        """Tokens of the reply; router prompts get the configured agent name."""
+        if ROUTER_MARKER in messages[-1].get("content", ""):
+            return [self.route]
+        count = min(self.completion_tokens, max_tokens or self.completion_tokens)
+        return [FILLER[i % len(FILLER)] + " " for i in range(count)]
+
+    def first_token_delay(self) -> float:
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without this, delayed ACKs add ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.split("?")[0].rstrip("/") not in COMPLETION_PATHS:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        request = json.loads(body or b"{}")
+        settings = self.server.settings
+        messages = request.get("messages", [])
+        tokens = settings.reply(messages, request.get("max_tokens"))
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "fake")
+
+        time.sleep(settings.first_token_delay())
+        if request.get("stream"):
+            self._stream(completion_id, model, tokens, settings.token_delay())
+            return
+
+        time.sleep(settings.token_delay() * max(0, len(tokens) - 1))
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens)
+            }
+        })
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, completion_id, model, tokens, token_delay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(token_delay)
+            self._write_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            })
+        self._write_event({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_event(self, payload):
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address: Tuple[str, int], settings: FakeGroqSettings):
+        super().__init__(address, FakeGroqHandler)
+        self.settings = settings
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_groq(host: str = "127.0.0.1", port: int = 0, **settings) -> FakeGroqServer:
+    """Serve on a background thread (port 0 picks a free port); stop with `shutdown()`."""
+    server = FakeGroqServer((host, port), FakeGroqSettings(**settings))
+    threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True).start()
+    return server
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = FakeGroqSettings()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="Time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms, help="Uniform +/- latency jitter")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens)
+    parser.add_argument("--route", default=defaults.route, help="Agent named in router replies")
+
+
+def settings_from_args(args) -> Dict[str, object]:
+    return {
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "tokens_per_second": args.tokens_per_second,
+        "completion_tokens": args.completion_tokens,
+        "route": args.route
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Groq-compatible completion server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = FakeGroqServer((args.host, args.port), FakeGroqSettings(**settings_from_args(args)))
+    print(f"Fake Groq server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
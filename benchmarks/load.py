@@ -0,0 +1,329 @@
+"""
+Offline load generator for the API, the agents and the agent graph.
+
+By default everything runs in this process: a fake Groq server
+(benchmarks.fake_groq), Qdrant in `:memory:` mode and the Flask app on a
+local port. Each target is driven at each concurrency level, and the
+report gives latency percentiles, requests per second and a per-phase
+breakdown taken from the app's Server-Timing spans.
+
+    python -m benchmarks.load --targets chat,agent,graph --concurrency 1,8,32 --requests 200
+
+The first run writes the baseline file (benchmarks/baseline.json by default);
+later runs are compared with it, and the command exits with status 1 when
+p95 latency or throughput regresses by more than --tolerance. Use
+--update-baseline after an intended change. Set --url to benchmark an
+already running server instead.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from benchmarks.fake_groq import add_settings_arguments, settings_from_args, start_fake_groq
+
+TARGETS = ("chat", "agent", "graph")
+AGENT_IDS = ("sales", "help", "manage", "marketing")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def sample_messages() -> List[str]:
+    """Realistic queries for every agent (the router prototypes)."""
+    from langgraph_setup.intent_router import DEFAULT_PROTOTYPES
+    return [text for texts in DEFAULT_PROTOTYPES.values() for text in texts]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Server-Timing header to {span: seconds}."""
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                timings[name] = float(value) / 1000.0
+    return timings
+
+
+class HttpTarget:
+    def __init__(self, base_url: str, target: str):
+        """POSTs messages to /chat or, cycling through the agents, to /agent/<agent_id>."""
+        parsed = urlparse(base_url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.target = target
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        return connection
+
+    def __call__(self, index: int, message: str, user_id: str) -> Dict[str, float]:
+        path = "/chat" if self.target == "chat" else f"/agent/{AGENT_IDS[index % len(AGENT_IDS)]}"
+        body = json.dumps({"message": message, "user_id": user_id})
+        connection = self._connection()
+        try:
+            connection.request("POST", path, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            # Reconnect once; the server may have closed an idle connection
+            connection.close()
+            self._local.connection = None
+            connection = self._connection()
+            connection.request("POST", path, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+        if response.status != 200:
+            raise RuntimeError(f"{path} returned {response.status}")
+        return parse_server_timing(response.getheader("Server-Timing"))
+
+
+class GraphTarget:
+    def __init__(self, graph):
+        """Runs queries through AgentGraph.process_query in this process."""
+        self.graph = graph
+
+    def __call__(self, index: int, message: str, user_id: str) -> Dict[str, float]:
+        from utils import metrics
+
+        token = metrics.start_request()
+        try:
+            self.graph.process_query(message)
+            return dict(metrics.request_timings())
+        finally:
+            metrics.end_request(token)
+
+
+def run_load(call: Callable[[int, str, str], Dict[str, float]],
+             messages: List[str],
+             concurrency: int,
+             requests: int,
+             users: int = 50,
+             warmup: int = 0) -> Dict[str, Any]:
+    """
+    Send `requests` calls with `concurrency` in flight and summarize them.
+
+    Returns:
+        requests, errors, rps, latency_ms percentiles and per-phase
+        mean/p95 milliseconds
+    """
+    def one(index):
+        start = time.perf_counter()
+        try:
+            phases = call(index, messages[index % len(messages)], f"bench-user-{index % users}")
+            return time.perf_counter() - start, phases, None
+        except Exception as e:
+            return time.perf_counter() - start, {}, e
+
+    for index in range(warmup):
+        one(index)
+
+    counter = itertools.count()
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            result = one(index)
+            with lock:
+                results.append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _, error in results if error is None]) * 1000.0
+    errors = [error for _, _, error in results if error is not None]
+    phases = {}
+    for _, timings, error in results:
+        if error is None:
+            for name, seconds in timings.items():
+                phases.setdefault(name, []).append(seconds * 1000.0)
+
+    return {
+        "requests": len(results),
+        "errors": len(errors),
+        "first_error": repr(errors[0]) if errors else None,
+        "rps": round((len(results) - len(errors)) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": _summary(latencies),
+        "phases_ms": {
+            name: {"mean": round(float(np.mean(values)), 2), "p95": round(float(np.percentile(values, 95)), 2)}
+            for name, values in sorted(phases.items())
+        }
+    }
+
+
+def _summary(values):
+    if not len(values):
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "mean": round(float(np.mean(values)), 2)
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Scenarios whose p95 latency or throughput is worse than the baseline by more than `tolerance`."""
+    regressions = []
+    for scenario, result in report["results"].items():
+        base = baseline.get("results", {}).get(scenario)
+        if base is None:
+            continue
+        p95, base_p95 = result["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if p95 is not None and base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {p95:.1f} ms vs baseline {base_p95:.1f} ms")
+        if base["rps"] and result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: {result['rps']:.1f} rps vs baseline {base['rps']:.1f} rps")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{scenario}: {result['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'scenario':<16}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"]
+    for scenario, result in report["results"].items():
+        latency = result["latency_ms"]
+        lines.append(
+            f"{scenario:<16}{result['rps']:>10.1f}"
+            + "".join(f"{latency[key] if latency[key] is not None else '-':>10}" for key in ("p50", "p95", "p99"))
+            + f"{result['errors']:>8}"
+        )
+        for name, phase in result["phases_ms"].items():
+            lines.append(f"    {name:<24}mean {phase['mean']:>9.2f} ms   p95 {phase['p95']:>9.2f} ms")
+    return "\n".join(lines)
+
+
+def _configure_environment(args) -> Optional[Any]:
+    """Point the app at local stand-ins before it is imported; returns the fake Groq server."""
+    fake = None
+    groq_url = args.groq_url
+    if not groq_url:
+        fake = start_fake_groq(**settings_from_args(args))
+        groq_url = fake.url
+    # Set explicitly: load_dotenv() does not override existing variables
+    os.environ["GROQ_BASE_URL"] = groq_url
+    os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY") or "benchmark"
+    os.environ["QDRANT_URL"] = args.qdrant_url
+    os.environ["METRICS_TIMING_HEADERS"] = "true"
+    os.environ.setdefault("RESPONSE_CACHE", "false")
+    os.environ.setdefault("WARMUP_ON_START", "true")
+    return fake
+
+
+def _start_app_server():
+    from werkzeug.serving import make_server
+    import app
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _build_graph():
+    import app
+
+    return app.components.build_agent_graph()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for /chat, /agent/<agent_id> and the agent graph")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Comma-separated subset of chat,agent,graph")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per target and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--users", type=int, default=50, help="Distinct user IDs to spread requests over")
+    parser.add_argument("--messages", help="File with one message per line (defaults to the router prototypes)")
+    parser.add_argument("--url", help="Benchmark a running server instead of starting the app in-process")
+    parser.add_argument("--groq-url", help="Use this completion server instead of starting the fake one")
+    parser.add_argument("--qdrant-url", default=":memory:", help="Qdrant for the in-process app (default: local :memory:)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    fake = None
+    app_server = None
+    base_url = args.url
+    if not base_url or "graph" in targets:
+        fake = _configure_environment(args)
+    if not base_url and set(targets) & {"chat", "agent"}:
+        app_server, base_url = _start_app_server()
+
+    if args.messages:
+        with open(args.messages, "r", encoding="utf-8") as f:
+            messages = [line.strip() for line in f if line.strip()]
+    else:
+        messages = sample_messages()
+
+    report = {
+        "settings": {
+            "requests": args.requests,
+            "users": args.users,
+            "url": args.url,
+            "fake_groq": settings_from_args(args) if fake else None,
+            "qdrant_url": None if args.url else args.qdrant_url
+        },
+        "results": {}
+    }
+    try:
+        for target in targets:
+            call = GraphTarget(_build_graph()) if target == "graph" else HttpTarget(base_url, target)
+            for level in levels:
+                scenario = f"{target}@{level}"
+                report["results"][scenario] = run_load(
+                    call, messages, level, args.requests, users=args.users, warmup=args.warmup
+                )
+                print(f"{scenario}: {report['results'][scenario]['rps']} rps", file=sys.stderr)
+    finally:
+        if app_server is not None:
+            app_server.shutdown()
+        if fake is not None:
+            fake.shutdown()
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare(report, json.load(f), args.tolerance)
+    if regressions:
+        print("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,29 @@
+import time
+_started = time.perf_counter()
+
 import chainlit as cl
-import os
 from dotenv import load_dotenv
-from utils.llm_manager import GroqLLMManager
-from utils.memory import QdrantMemory
-from agents.sales_agent import SalesAgent
-from agents.help_agent import HelpAgent
-from agents.manage_agent import ManageAgent
-from agents.marketing_agent import MarketingAgent
-from langgraph_setup.agent_graph import AgentGraph
+from utils.factory import Components
+from utils.startup import StartupTimer
 
 # Load environment variables
 load_dotenv()
 
-# Initialize components
-llm_manager = GroqLLMManager(
-    api_key=os.getenv("GROQ_API_KEY"),
-    model=os.getenv("GROQ_MODEL", "llama3-70b-8192")
-)
-
-memory = QdrantMemory(
-    url=os.getenv("QDRANT_URL", "http://localhost:6333"),
-    collection_name="agent_memory"
-)
+# Per-phase startup timings, logged when startup completes
+startup = StartupTimer(_started)
+startup.mark("imports")
 
-# Initialize agents
-sales_agent = SalesAgent(llm_manager=llm_manager, memory=memory)
-help_agent = HelpAgent(llm_manager=llm_manager, memory=memory)
-manage_agent = ManageAgent(llm_manager=llm_manager, memory=memory)
-marketing_agent = MarketingAgent(llm_manager=llm_manager, memory=memory)
+# Initialize components from the environment (see utils/factory.py)
+components = Components(startup)
+knowledge_index = components.knowledge_index
+sales_agent = components.agents["sales"]
+help_agent = components.agents["help"]
+manage_agent = components.agents["manage"]
+marketing_agent = components.agents["marketing"]
 
-# Initialize agent graph
-agent_graph = AgentGraph(llm_manager=llm_manager, memory=memory)
+# Agent graph with the local fast-path router; it reuses the agents above
+agent_graph = components.build_agent_graph()
+startup.mark("agents")
 
 # Create a mapping of agents for UI selection
 agent_mapping = {
@@ -61,6 +54,13 @@ agent_mapping = {
     }
 }
 
+# Build the knowledge index before serving, so no chat session waits for it
+if knowledge_index is not None:
+    knowledge_index.ensure_built()
+    startup.mark("knowledge")
+
+startup.report()
+
 @cl.on_chat_start
 async def on_chat_start():
     # Store user session information
@@ -88,6 +88,23 @@ async def on_chat_start():
         actions=actions
     ).send()
 
+async def stream_reply(tokens, state=None) -> str:
+    """
+    Relay an async token iterator to the UI as a streamed message.
+
+    With a graph `state` (see AgentGraph.astream_query), the message is
+    attributed to the agent the router picked.
+    """
+    msg = cl.Message(content="")
+    
+    async for token in tokens:
+        await msg.stream_token(token)
+    
+    if state and state.get("current_agent") in agent_mapping:
+        msg.author = agent_mapping[state["current_agent"]]["name"]
+    await msg.send()
+    return msg.content
+
 @cl.on_message
 async def on_message(message: cl.Message):
     # Get user session data
@@ -96,22 +113,24 @@ async def on_message(message: cl.Message):
     
     # Process the message based on current agent selection
     if current_agent == "auto":
-        # Use the agent graph for automatic routing
-        final_response, updated_history = agent_graph.process_query(message.content, history)
-        cl.user_session.set("history", updated_history)
-        
-        await cl.Message(content=final_response).send()
+        # Use the agent graph for automatic routing; history is updated once streaming ends
+        state = {}
+        await stream_reply(agent_graph.astream_query(message.content, history, state=state), state)
+        cl.user_session.set("history", history)
+        cl.user_session.set("last_routing", {
+            "agent": state.get("current_agent"),
+            "executed_nodes": state.get("executed_nodes"),
+            **state.get("routing", {})
+        })
     else:
         # Use the specifically selected agent
         agent = agent_mapping[current_agent]["agent"]
-        response = agent.process_message(message.content)
+        response = await stream_reply(agent.astream_message(message.content))
         
         # Update history
         history.append({"role": "user", "content": message.content})
         history.append({"role": "assistant", "content": response})
         cl.user_session.set("history", history)
-        
-        await cl.Message(content=response).send()
 
 @cl.on_action
 async def on_action(action):
@@ -0,0 +1,51 @@
+# Production server settings: gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master (preload_app), which warms up the
+# embedding model; forked workers share those pages copy-on-write and only
+# open their own connections. Set GUNICORN_APP=asgi:app and
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker for the ASGI variant.
+import gc
+import importlib
+import os
+
+wsgi_app = os.getenv("GUNICORN_APP", "app:app")
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+# The embedded memory store belongs to a single process
+if os.getenv("MEMORY_BACKEND", "qdrant") == "embedded":
+    workers = 1
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Streaming responses can run long; graceful_timeout bounds the final flush
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = "-"
+
+
+def _lifecycle():
+    # The served module (app or asgi) owns the lifecycle
+    return importlib.import_module(wsgi_app.split(":")[0]).lifecycle
+
+
+def when_ready(server):
+    # Move everything loaded so far (model weights, agents) out of the
+    # garbage collector's reach so collections in workers don't touch
+    # those pages and break copy-on-write sharing
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        _lifecycle().after_fork()
+
+
+def worker_exit(server, worker):
+    _lifecycle().shutdown(timeout=graceful_timeout)
@@ -1,138 +1,194 @@
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, List, Tuple, Any, Optional, TypedDict, Annotated, Iterator, AsyncIterator
 from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableLambda
 import json
+import operator
+import threading
 from utils.llm_manager import GroqLLMManager
 from agents.sales_agent import SalesAgent
 from agents.help_agent import HelpAgent
 from agents.manage_agent import ManageAgent
 from agents.marketing_agent import MarketingAgent
-from utils.memory import QdrantMemory
+from agents.base_agent import BaseAgent
+from utils.memory_backend import MemoryBackend
+from langgraph_setup.intent_router import IntentClassifier
+from utils.model_tiers import ModelTierPolicy
+from utils.metrics import span, timed
+
+AGENT_NODES = ("sales", "help", "manage", "marketing")
 
 class AgentGraph:
-    def __init__(self, llm_manager: GroqLLMManager, memory: QdrantMemory):
-        """Initialize agent communication graph."""
+    def __init__(self,
+                 llm_manager: GroqLLMManager,
+                 memory: MemoryBackend,
+                 agent_options: Optional[Dict[str, Any]] = None,
+                 intent_classifier: Optional[IntentClassifier] = None,
+                 model_policy: Optional[ModelTierPolicy] = None,
+                 agents: Optional[Dict[str, BaseAgent]] = None):
+        """
+        Initialize agent communication graph.
+        
+        Args:
+            llm_manager: The LLM manager shared by the router and agents
+            memory: Vector memory shared by the agents
+            agent_options: Extra keyword arguments passed to every agent
+            intent_classifier: Optional local router tried before the LLM router
+            model_policy: Tiering policy for graph nodes ("router", "sales", ...);
+                defaults to the agents' `model_policy` option
+            agents: Existing agent instances to share, keyed by node name
+                (missing ones are created with `agent_options`)
+        """
         self.llm_manager = llm_manager
         self.memory = memory
+        self.intent_classifier = intent_classifier
+        self.routing_stats = {"local": 0, "llm": 0}
+        self._stats_lock = threading.Lock()
+        agent_options = agent_options or {}
+        self.model_policy = model_policy or agent_options.get("model_policy")
         
-        # Initialize agents
-        self.sales_agent = SalesAgent(llm_manager=llm_manager, memory=memory)
-        self.help_agent = HelpAgent(llm_manager=llm_manager, memory=memory)
-        self.manage_agent = ManageAgent(llm_manager=llm_manager, memory=memory)
-        self.marketing_agent = MarketingAgent(llm_manager=llm_manager, memory=memory)
+        # Initialize agents, reusing any that were passed in
+        agents = agents or {}
+        self.sales_agent = agents.get("sales") or SalesAgent(llm_manager=llm_manager, memory=memory, **agent_options)
+        self.help_agent = agents.get("help") or HelpAgent(llm_manager=llm_manager, memory=memory, **agent_options)
+        self.manage_agent = agents.get("manage") or ManageAgent(llm_manager=llm_manager, memory=memory, **agent_options)
+        self.marketing_agent = agents.get("marketing") or MarketingAgent(llm_manager=llm_manager, memory=memory, **agent_options)
+        self.agents = {
+            "sales": self.sales_agent,
+            "help": self.help_agent,
+            "manage": self.manage_agent,
+            "marketing": self.marketing_agent
+        }
         
         # Build the graph
         self.graph = self._build_graph()
     
+    def route(self, query: str) -> Dict[str, Any]:
+        """
+        Decide which agent should handle the query.
+        
+        Returns:
+            Dict with the selected `current_agent` and `routing` details, plus
+            the `query_embedding` computed by the local classifier (if any) so
+            the agent can reuse it
+        """
+        routing = {"path": "llm"}
+        query_embedding = None
+        
+        # Try the local classifier first; only ambiguous queries reach the LLM
+        if self.intent_classifier is not None:
+            query_embedding = self.intent_classifier.memory.embed_batch([query])[0]
+            decision = self.intent_classifier.classify(query, query_embedding)
+            routing.update(decision)
+            if decision["agent"] is not None:
+                routing["path"] = "local"
+                self._count_route("local")
+                return {"current_agent": decision["agent"], "routing": routing, "query_embedding": query_embedding}
+        
+        # Use the LLM to determine which agent should handle the query
+        agent = self.llm_manager.generate(self._router_prompt(query), model=self._node_model("router", query))
+        
+        return self._llm_route(agent, routing, query_embedding)
+    
+    async def aroute(self, query: str) -> Dict[str, Any]:
+        """Async variant of `route`."""
+        routing = {"path": "llm"}
+        query_embedding = None
+        
+        if self.intent_classifier is not None:
+            query_embedding = (await self.intent_classifier.memory.aembed_batch([query]))[0]
+            decision = await self.intent_classifier.aclassify(query, query_embedding)
+            routing.update(decision)
+            if decision["agent"] is not None:
+                routing["path"] = "local"
+                self._count_route("local")
+                return {"current_agent": decision["agent"], "routing": routing, "query_embedding": query_embedding}
+        
+        agent = await self.llm_manager.agenerate(self._router_prompt(query), model=self._node_model("router", query))
+        
+        return self._llm_route(agent, routing, query_embedding)
+    
+    def _node_model(self, node: str, query: str) -> Optional[str]:
+        """Model for a graph node, or None to defer to the agent's own policy."""
+        if self.model_policy is None:
+            return None
+        return self.model_policy.select(node, message=query)
+    
+    def _router_prompt(self, query: str) -> str:
+        return f"""Based on the following query, determine which agent should handle it:
+        Query: {query}
+        
+        Available agents:
+        - sales: For queries about courses, pricing, and enrollment
+        - help: For technical issues, login problems, and general support
+        - manage: For operational inquiries and system status
+        - marketing: For information about promotions and marketing materials
+        
+        Reply with just the agent name (sales, help, manage, or marketing):"""
+    
+    def _llm_route(self, answer: str, routing: Dict[str, Any], query_embedding=None) -> Dict[str, Any]:
+        """Turn the LLM router's answer into a routing decision."""
+        agent = answer.strip().lower()
+        
+        # Fallback to help agent if the determination is unclear
+        if agent not in AGENT_NODES:
+            agent = "help"
+            
+        self._count_route("llm")
+        return {"current_agent": agent, "routing": routing, "query_embedding": query_embedding}
+    
+    def _query_embedding(self, name: str, state) -> Optional[Any]:
+        """The router's query vector, if the agent embeds with the same memory."""
+        if self.intent_classifier is None or self.agents[name].memory is not self.intent_classifier.memory:
+            return None
+        return state.get("query_embedding")
+    
+    def _count_route(self, path: str):
+        with self._stats_lock:
+            self.routing_stats[path] += 1
+    
     def _build_graph(self):
         """Build the agent communication graph."""
-        # Define the state
-        class AgentState:
+        # Define the state; `executed_nodes` accumulates an execution trace
+        class AgentState(TypedDict, total=False):
             query: str
             agent_responses: Dict[str, str]
             current_agent: str
             conversation_history: List[Dict[str, str]]
-            final_response: Optional[str] = None
+            final_response: Optional[str]
+            routing: Dict[str, Any]
+            query_embedding: Any
+            executed_nodes: Annotated[List[str], operator.add]
         
         # Create the state graph
         graph = StateGraph(AgentState)
         
-        # Define nodes
-        
-        # Router node to determine which agent should respond
-        def router(state):
-            """Route the query to appropriate agent."""
-            query = state["query"]
+        # Define nodes; each carries sync and async implementations so the
+        # graph works with `invoke` and `ainvoke`
+        def agent_node(name):
+            """Build the node that runs a single agent."""
+            def run(state):
+                return self._agent_node(name, state)
             
-            # Use the LLM to determine which agent should handle the query
-            router_prompt = f"""Based on the following query, determine which agent should handle it:
-            Query: {query}
+            async def arun(state):
+                return await self._aagent_node(name, state)
             
-            Available agents:
-            - sales: For queries about courses, pricing, and enrollment
-            - help: For technical issues, login problems, and general support
-            - manage: For operational inquiries and system status
-            - marketing: For information about promotions and marketing materials
-            
-            Reply with just the agent name (sales, help, manage, or marketing):"""
-            
-            agent = self.llm_manager.generate(router_prompt).strip().lower()
-            
-            # Fallback to help agent if the determination is unclear
-            if agent not in ["sales", "help", "manage", "marketing"]:
-                agent = "help"
-                
-            return {"current_agent": agent}
-        
-        # Agent nodes
-        def sales_node(state):
-            """Sales agent node."""
-            query = state["query"]
-            response = self.sales_agent.process_message(query)
-            return {"agent_responses": {**state.get("agent_responses", {}), "sales": response}}
-        
-        def help_node(state):
-            """Help agent node."""
-            query = state["query"]
-            response = self.help_agent.process_message(query)
-            return {"agent_responses": {**state.get("agent_responses", {}), "help": response}}
-        
-        def manage_node(state):
-            """Manage agent node."""
-            query = state["query"]
-            response = self.manage_agent.process_message(query)
-            return {"agent_responses": {**state.get("agent_responses", {}), "manage": response}}
-        
-        def marketing_node(state):
-            """Marketing agent node."""
-            query = state["query"]
-            response = self.marketing_agent.process_message(query)
-            return {"agent_responses": {**state.get("agent_responses", {}), "marketing": response}}
-        
-        # Summarizer node to prepare the final response
-        def summarizer(state):
-            """Summarize and prepare the final response."""
-            current_agent = state["current_agent"]
-            agent_responses = state["agent_responses"]
-            
-            # If we have a response from the current agent, use it
-            if current_agent in agent_responses:
-                final_response = agent_responses[current_agent]
-            else:
-                # Fallback to help agent or any available response
-                final_response = agent_responses.get("help", 
-                                 next(iter(agent_responses.values()), 
-                                 "I'm sorry, but I couldn't process your request."))
-                
-            # Add the response to conversation history
-            history = state.get("conversation_history", [])
-            history.append({"role": "user", "content": state["query"]})
-            history.append({"role": "assistant", "content": final_response})
-            
-            return {"final_response": final_response, "conversation_history": history}
+            return RunnableLambda(run, afunc=arun, name=name)
         
         # Add nodes to graph
-        graph.add_node("router", router)
-        graph.add_node("sales", sales_node)
-        graph.add_node("help", help_node)
-        graph.add_node("manage", manage_node)
-        graph.add_node("marketing", marketing_node)
-        graph.add_node("summarizer", summarizer)
-        
-        # Define edges
-        graph.add_edge("router", "sales")
-        graph.add_edge("router", "help")
-        graph.add_edge("router", "manage")
-        graph.add_edge("router", "marketing")
+        graph.add_node("router", RunnableLambda(self._router_node, afunc=self._arouter_node, name="router"))
+        for name in AGENT_NODES:
+            graph.add_node(name, agent_node(name))
+        graph.add_node("summarizer", self._summarizer_node)
         
+        # Define edges; only the agent selected by the router runs
         graph.add_conditional_edges(
             "router",
-            lambda state: state["current_agent"]
+            lambda state: state["current_agent"],
+            {agent: agent for agent in AGENT_NODES}
         )
         
-        graph.add_edge("sales", "summarizer")
-        graph.add_edge("help", "summarizer")
-        graph.add_edge("manage", "summarizer")
-        graph.add_edge("marketing", "summarizer")
+        for name in AGENT_NODES:
+            graph.add_edge(name, "summarizer")
         graph.add_edge("summarizer", END)
         
         # Set the entry point
@@ -140,6 +196,68 @@ class AgentGraph:
         
         return graph.compile()
     
+    # Nodes
+    
+    def _router_node(self, state):
+        """Route the query to appropriate agent."""
+        with span("graph.router"):
+            return {**self.route(state["query"]), "executed_nodes": ["router"]}
+    
+    async def _arouter_node(self, state):
+        with span("graph.router"):
+            return {**await self.aroute(state["query"]), "executed_nodes": ["router"]}
+    
+    def _agent_node(self, name, state):
+        """Run a single agent."""
+        with span(f"graph.{name}"):
+            response = self.agents[name].process_message(
+                state["query"],
+                model=self._node_model(name, state["query"]),
+                query_embedding=self._query_embedding(name, state)
+            )
+        return self._agent_update(name, state, response)
+    
+    async def _aagent_node(self, name, state):
+        with span(f"graph.{name}"):
+            response = await self.agents[name].aprocess_message(
+                state["query"],
+                model=self._node_model(name, state["query"]),
+                query_embedding=self._query_embedding(name, state)
+            )
+        return self._agent_update(name, state, response)
+    
+    def _agent_update(self, name, state, response):
+        return {
+            "agent_responses": {**state.get("agent_responses", {}), name: response},
+            "executed_nodes": [name]
+        }
+    
+    @timed("graph.summarizer")
+    def _summarizer_node(self, state):
+        """Summarize and prepare the final response."""
+        current_agent = state["current_agent"]
+        agent_responses = state["agent_responses"]
+        
+        # If we have a response from the current agent, use it
+        if current_agent in agent_responses:
+            final_response = agent_responses[current_agent]
+        else:
+            # Fallback to help agent or any available response
+            final_response = agent_responses.get("help", 
+                             next(iter(agent_responses.values()), 
+                             "I'm sorry, but I couldn't process your request."))
+            
+        # Add the response to conversation history
+        history = state.get("conversation_history", [])
+        history.append({"role": "user", "content": state["query"]})
+        history.append({"role": "assistant", "content": final_response})
+        
+        return {
+            "final_response": final_response,
+            "conversation_history": history,
+            "executed_nodes": ["summarizer"]
+        }
+    
     def process_query(self, query: str, conversation_history: List[Dict[str, str]] = None) -> str:
         """
         Process a user query through the agent graph.
@@ -151,14 +269,112 @@ class AgentGraph:
         Returns:
             The final response from the appropriate agent
         """
-        if conversation_history is None:
-            conversation_history = []
-            
-        # Run the graph
-        result = self.graph.invoke({
+        result = self.run(query, conversation_history)
+        
+        return result["final_response"], result["conversation_history"]
+    
+    async def aprocess_query(self, query: str, conversation_history: List[Dict[str, str]] = None):
+        """Async variant of `process_query`."""
+        result = await self.arun(query, conversation_history)
+        
+        return result["final_response"], result["conversation_history"]
+    
+    def run(self, query: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Run the graph and return its final state.
+        
+        The state's `executed_nodes` lists every node that ran, in order,
+        e.g. ["router", "sales", "summarizer"], and `routing` records whether
+        the local classifier or the LLM picked the agent.
+        """
+        # Run the graph; time not spent in nodes is framework overhead
+        with span("graph.run"):
+            return self.graph.invoke(self._initial_state(query, conversation_history))
+    
+    async def arun(self, query: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Async variant of `run`."""
+        with span("graph.run"):
+            return await self.graph.ainvoke(self._initial_state(query, conversation_history))
+    
+    def _initial_state(self, query: str, conversation_history: Optional[List[Dict[str, str]]]) -> Dict[str, Any]:
+        return {
             "query": query,
             "agent_responses": {},
-            "conversation_history": conversation_history
-        })
+            "conversation_history": conversation_history if conversation_history is not None else [],
+            "executed_nodes": []
+        }
+    
+    def stream_query(self,
+                     query: str,
+                     conversation_history: List[Dict[str, str]] = None,
+                     state: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Route a query and stream the selected agent's response.
         
-        return result["final_response"], result["conversation_history"]
+        Runs the graph's nodes in order (router, the selected agent, summarizer),
+        with the agent node streaming: tokens are yielded as the agent generates
+        them, and the summarizer runs once the stream is exhausted, appending
+        the exchange to `conversation_history`.
+        
+        Args:
+            query: The user's query
+            conversation_history: Optional conversation history to update in place
+            state: Optional dict filled with the final graph state, as returned
+                by `run` (`current_agent`, `routing`, `executed_nodes`, ...)
+            
+        Yields:
+            Chunks of the selected agent's response
+        """
+        final = self._initial_state(query, conversation_history)
+        with span("graph.run"):
+            _apply(final, self._router_node(final))
+        name = final["current_agent"]
+        
+        chunks = []
+        stream = self.agents[name].stream_message(
+            query,
+            model=self._node_model(name, query),
+            query_embedding=self._query_embedding(name, final)
+        )
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        
+        _apply(final, self._agent_update(name, final, "".join(chunks)))
+        _apply(final, self._summarizer_node(final))
+        if state is not None:
+            state.update(final)
+    
+    async def astream_query(self,
+                            query: str,
+                            conversation_history: List[Dict[str, str]] = None,
+                            state: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Async variant of `stream_query`."""
+        final = self._initial_state(query, conversation_history)
+        with span("graph.run"):
+            _apply(final, await self._arouter_node(final))
+        name = final["current_agent"]
+        
+        chunks = []
+        stream = self.agents[name].astream_message(
+            query,
+            model=self._node_model(name, query),
+            query_embedding=self._query_embedding(name, final)
+        )
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        
+        _apply(final, self._agent_update(name, final, "".join(chunks)))
+        _apply(final, self._summarizer_node(final))
+        if state is not None:
+            state.update(final)
+
+
+def _apply(state: Dict[str, Any], update: Dict[str, Any]) -> None:
+    """Merge a node's update into the state like the graph does (the trace accumulates)."""
+    for key, value in update.items():
+        if key == "executed_nodes":
+            state[key] = state.get(key, []) + value
+        else:
+            state[key] = value
@@ -0,0 +1,125 @@
+from typing import Dict, List, Optional, Any
+import threading
+import numpy as np
+from utils.memory_backend import MemoryBackend
+from utils.metrics import run_in_executor
+
+# Labeled prototype queries for each agent node
+DEFAULT_PROTOTYPES = {
+    "sales": [
+        "How much does the web development bootcamp cost?",
+        "What courses do you offer?",
+        "I want to enroll in the data science program",
+        "Do you have flexible payment plans?",
+        "How long is the mobile app development course?",
+        "What is your job placement rate?",
+        "Can I book a demo session?",
+        "Which course is best for becoming a DevOps engineer?"
+    ],
+    "help": [
+        "I can't log in to my account",
+        "How do I reset my password?",
+        "My payment failed but I was charged",
+        "I can't access the course videos",
+        "How do I submit my assignment?",
+        "Can I get an extension on my deadline?",
+        "The platform is not loading on my browser",
+        "What are the technical requirements for the course?"
+    ],
+    "manage": [
+        "Show me this month's enrollment and completion KPIs",
+        "How are the sales and help agents performing?",
+        "What is the current system status?",
+        "Prepare a report on student satisfaction trends",
+        "How should we adjust course pricing strategy?",
+        "Which repetitive operations can we automate?",
+        "Review the student onboarding process",
+        "Summarize operational metrics for the dashboard"
+    ],
+    "marketing": [
+        "Are there any promotions or discounts right now?",
+        "Write a social media post for the new bootcamp",
+        "Create an email campaign for the data science program",
+        "What marketing materials do you have?",
+        "Analyze the results of our last ad campaign",
+        "Draft a promotional script using the AIDA method",
+        "Which audience segment should we target next?",
+        "Plan a content calendar for next month"
+    ]
+}
+
+
+class IntentClassifier:
+    def __init__(self,
+                 memory: MemoryBackend,
+                 prototypes: Optional[Dict[str, List[str]]] = None,
+                 threshold: float = 0.5,
+                 margin: float = 0.05):
+        """
+        Embedding-similarity router that runs before the LLM router.
+
+        Queries are compared against labeled prototype queries using the
+        memory's embedding model. A query is routed locally only when its best
+        agent scores at least `threshold` and beats the runner-up by `margin`;
+        everything else is left to the LLM.
+
+        Args:
+            memory: Memory whose embedding model (and cache) is reused
+            prototypes: Mapping of agent name to example queries
+            threshold: Minimum cosine similarity for a confident decision
+            margin: Minimum gap between the best and second-best agent
+        """
+        self.memory = memory
+        self.prototypes = prototypes or DEFAULT_PROTOTYPES
+        self.threshold = threshold
+        self.margin = margin
+        self._labels = None
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def _prototype_matrix(self):
+        """Embed and normalize all prototypes once, on first use."""
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    labels = [label for label, texts in self.prototypes.items() for _ in texts]
+                    texts = [text for texts in self.prototypes.values() for text in texts]
+                    self._labels = np.array(labels)
+                    self._matrix = _normalize(self.memory.embed_batch(texts))
+        return self._labels, self._matrix
+
+    def classify(self, query: str, query_embedding=None) -> Dict[str, Any]:
+        """
+        Score the query against every agent.
+
+        Returns:
+            Dict with the confident `agent` (None if ambiguous), the best
+            `candidate`, its `score` and the `margin` over the runner-up
+        """
+        labels, matrix = self._prototype_matrix()
+        if query_embedding is None:
+            query_embedding = self.memory.embed_batch([query])[0]
+
+        similarities = matrix @ _normalize(np.asarray(query_embedding, dtype=np.float32))
+        scores = {label: float(similarities[labels == label].max()) for label in self.prototypes}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        candidate, score = ranked[0]
+        margin = score - ranked[1][1] if len(ranked) > 1 else score
+        confident = score >= self.threshold and margin >= self.margin
+
+        return {
+            "agent": candidate if confident else None,
+            "candidate": candidate,
+            "score": score,
+            "margin": margin
+        }
+
+    async def aclassify(self, query: str, query_embedding=None) -> Dict[str, Any]:
+        """Async variant of `classify`; the CPU work runs in the default executor."""
+        return await run_in_executor(self.classify, query, query_embedding)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
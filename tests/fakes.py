@@ -0,0 +1,98 @@
+"""Small stand-ins for the embedding model, memory backend and LLM used by the tests."""
+import hashlib
+import re
+
+import numpy as np
+
+DIM = 16
+
+
+def embed_text(text):
+    """Deterministic unit vector from a bag of hashed words."""
+    vector = np.zeros(DIM, dtype=np.float32)
+    for word in text.lower().split():
+        digest = hashlib.sha1(word.encode("utf-8")).digest()
+        vector[digest[0] % DIM] += 1.0 if digest[1] % 2 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeEncoder:
+    """SentenceTransformer-compatible encoder for real memory backends."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, **kwargs):
+        self.calls += 1
+        return np.stack([embed_text(text) for text in texts])
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+class FakeMemory:
+    """The parts of MemoryBackend the agents call, with plain lists behind them."""
+
+    def __init__(self):
+        self.memories = []
+
+    def embed_batch(self, texts):
+        return np.stack([embed_text(text) for text in texts])
+
+    async def aembed_batch(self, texts):
+        return self.embed_batch(texts)
+
+    def search_memories(self, query, user_id=None, limit=5, query_embedding=None, filters=None):
+        return [m for m in self.memories if m["metadata"].get("user_id") == user_id][:limit]
+
+    async def asearch_memories(self, query, user_id=None, limit=5, query_embedding=None, filters=None):
+        return self.search_memories(query, user_id, limit, query_embedding, filters)
+
+    def search_memories_batch(self, queries, user_ids=None, limit=5, query_embeddings=None, filters=None):
+        return [self.search_memories(q, u, limit) for q, u in zip(queries, user_ids)]
+
+    async def asearch_memories_batch(self, queries, user_ids=None, limit=5, query_embeddings=None, filters=None):
+        return self.search_memories_batch(queries, user_ids, limit, query_embeddings, filters)
+
+    def add_memory(self, text, metadata=None, user_id=None, embedding=None):
+        self.memories.append({"text": text, "metadata": {**(metadata or {}), "user_id": user_id}, "score": 1.0})
+
+    async def aadd_memory(self, text, metadata=None, user_id=None, embedding=None):
+        self.add_memory(text, metadata, user_id, embedding)
+
+
+class FakeLLM:
+    """Records the messages and model of every call and answers with a fixed reply (`route` for router prompts)."""
+
+    def __init__(self, reply="ok", route="help"):
+        self.reply = reply
+        self.route = route
+        self.calls = []
+        self.models = []
+        self.prompts = []
+
+    def generate(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return self.route
+
+    async def agenerate(self, prompt, **kwargs):
+        return self.generate(prompt, **kwargs)
+
+    def generate_with_history(self, messages, **kwargs):
+        self.calls.append(messages)
+        self.models.append(kwargs.get("model"))
+        return self.reply
+
+    async def agenerate_with_history(self, messages, **kwargs):
+        return self.generate_with_history(messages, **kwargs)
+
+    def stream_with_history(self, messages, **kwargs):
+        self.calls.append(messages)
+        self.models.append(kwargs.get("model"))
+        # Word by word, so the chunks join back to the reply
+        yield from re.findall(r"\S+\s*", self.reply)
+
+    async def astream_with_history(self, messages, **kwargs):
+        for chunk in self.stream_with_history(messages, **kwargs):
+            yield chunk
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langgraph_setup.agent_graph import AgentGraph
+from langgraph_setup.intent_router import IntentClassifier
+from tests.fakes import FakeLLM, FakeMemory
+
+
+class FixedClassifier:
+    """Local router stand-in that always picks one agent."""
+
+    def __init__(self, agent, memory=None):
+        self.agent = agent
+        self.memory = memory or FakeMemory()
+
+    def classify(self, query, query_embedding=None):
+        return {"agent": self.agent, "candidate": self.agent, "score": 0.9, "margin": 0.5}
+
+    async def aclassify(self, query, query_embedding=None):
+        return self.classify(query, query_embedding)
+
+
+class CountingMemory(FakeMemory):
+    def __init__(self):
+        super().__init__()
+        self.embedded = []
+
+    def embed_batch(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_batch(texts)
+
+
+def _graph(route="sales", classifier=None, memory=None):
+    llm = FakeLLM(reply="streamed reply", route=route)
+    return AgentGraph(llm_manager=llm, memory=memory or FakeMemory(), intent_classifier=classifier), llm
+
+
+def test_run_traces_router_agent_and_summarizer():
+    graph, _ = _graph()
+    result = graph.run("How much is the bootcamp?")
+
+    assert result["executed_nodes"] == ["router", "sales", "summarizer"]
+    assert result["routing"]["path"] == "llm"
+    assert result["final_response"] == "streamed reply"
+    assert graph.routing_stats == {"local": 0, "llm": 1}
+
+
+def test_unknown_router_answer_falls_back_to_help():
+    graph, _ = _graph(route="nonsense")
+    assert graph.run("?")["current_agent"] == "help"
+
+
+def test_stream_query_matches_the_graph_trace():
+    graph, _ = _graph(classifier=FixedClassifier("marketing"))
+    expected = graph.run("Any promotions?")
+
+    history, state = [], {}
+    chunks = list(graph.stream_query("Any promotions?", history, state=state))
+
+    assert len(chunks) == 2 and "".join(chunks) == "streamed reply"
+    for key in ("current_agent", "routing", "executed_nodes"):
+        assert state[key] == expected[key]
+    assert state["final_response"] == "".join(chunks)
+    assert history == [
+        {"role": "user", "content": "Any promotions?"},
+        {"role": "assistant", "content": "".join(chunks)}
+    ]
+    assert graph.routing_stats == {"local": 2, "llm": 0}
+
+
+def test_astream_query_matches_the_graph_trace():
+    graph, _ = _graph(route="manage")
+
+    async def run():
+        state = {}
+        chunks = [chunk async for chunk in graph.astream_query("System status?", state=state)]
+        return chunks, state, await graph.arun("System status?")
+
+    chunks, state, expected = asyncio.run(run())
+    assert chunks
+    assert state["executed_nodes"] == expected["executed_nodes"] == ["router", "manage", "summarizer"]
+    assert state["routing"] == expected["routing"]
+
+
+def test_routing_stats_are_counted_under_concurrency():
+    graph, _ = _graph(classifier=FixedClassifier("help"))
+    threads = [threading.Thread(target=lambda: [graph.route("hi") for _ in range(500)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert graph.routing_stats["local"] == 4000
+
+
+@pytest.mark.parametrize("threshold", [0.0, 1.1])
+def test_routed_query_is_embedded_once(threshold):
+    # threshold 0 routes locally, 1.1 always falls through to the LLM router
+    memory = CountingMemory()
+    classifier = IntentClassifier(memory, {"sales": ["bootcamp cost"], "help": ["login"]}, threshold=threshold, margin=0)
+    graph, _ = _graph(route="help", classifier=classifier, memory=memory)
+
+    graph.run("How much is the bootcamp?")
+    asyncio.run(graph.arun("How much is the bootcamp?"))
+    list(graph.stream_query("How much is the bootcamp?"))
+
+    assert memory.embedded.count("How much is the bootcamp?") == 3
+
+
+def test_router_embedding_is_not_reused_across_memories():
+    memory = CountingMemory()
+    graph, _ = _graph(classifier=FixedClassifier("sales"), memory=memory)
+    graph.run("How much is the bootcamp?")
+    assert memory.embedded == ["How much is the bootcamp?"]
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+
+from agents.base_agent import BaseAgent
+from agents.help_agent import HelpAgent
+from agents.sales_agent import SalesAgent
+from utils.history_store import InMemoryHistoryStore
+from tests.fakes import FakeLLM, FakeMemory
+
+
+class EchoAgent(BaseAgent):
+    knowledge_scope = "help"
+
+    def get_agent_prompt(self):
+        return "You help."
+
+
+class ThreadRecordingHistory(InMemoryHistoryStore):
+    def __init__(self):
+        super().__init__(capacity=10)
+        self.threads = []
+
+    def get(self, namespace, user_id, limit=None):
+        self.threads.append(threading.get_ident())
+        return super().get(namespace, user_id, limit)
+
+    def append(self, namespace, user_id, messages):
+        self.threads.append(threading.get_ident())
+        super().append(namespace, user_id, messages)
+
+
+class FakeKnowledge:
+    def __init__(self):
+        self.threads = []
+
+    def search(self, query, scope=None, limit=None, query_embedding=None):
+        self.threads.append(threading.get_ident())
+        return [{"title": "FAQ > Login", "text": "Reset your password.", "source": "help/faq.md", "score": 1.0}]
+
+
+class EmptyKnowledge:
+    def search(self, query, scope=None, limit=None, query_embedding=None):
+        return []
+
+
+def _agent(**kwargs):
+    llm = FakeLLM()
+    agent = EchoAgent(llm_manager=llm, memory=FakeMemory(), system_message="You help.", **kwargs)
+    return agent, llm
+
+
+def test_turn_records_history_and_memory():
+    agent, llm = _agent()
+    assert agent.process_message("hello", user_id="u1") == "ok"
+    agent.process_message("again", user_id="u1")
+
+    assert [m["content"] for m in llm.calls[-1] if m["role"] != "system"] == ["hello", "ok", "again"]
+    assert len(agent.memory.memories) == 2
+
+
+def test_knowledge_snippets_follow_the_system_prompt():
+    agent, llm = _agent(knowledge=FakeKnowledge())
+    agent.process_message("I can't log in", user_id="u1")
+
+    system = [m["content"] for m in llm.calls[-1] if m["role"] == "system"]
+    assert system[0] == "You help."
+    assert system[1].startswith("Reference information:\nFAQ > Login\nReset your password.")
+
+
+def test_catalog_stays_inline_without_an_index():
+    agent = SalesAgent(llm_manager=FakeLLM(), memory=FakeMemory())
+
+    assert "Web Development Bootcamp\nDuration: 12 weeks. Price: $4,999." in agent.system_message
+
+
+def test_search_miss_falls_back_to_the_inline_catalog():
+    llm = FakeLLM()
+    agent = SalesAgent(llm_manager=llm, memory=FakeMemory(), knowledge=EmptyKnowledge())
+    assert "Web Development Bootcamp" not in agent.system_message
+
+    agent.process_message("How much is the bootcamp?", user_id="u1")
+
+    system = [m["content"] for m in llm.calls[-1] if m["role"] == "system"]
+    assert system[1] == "Reference information:\n" + agent.knowledge_fallback
+
+
+def test_inline_reference_text_comes_from_the_knowledge_files(tmp_path):
+    (tmp_path / "sales").mkdir()
+    (tmp_path / "sales" / "catalog.md").write_text("# Catalog\n\n## Cloud Course\nPrice: $100.\n")
+    (tmp_path / "help").mkdir()
+    (tmp_path / "help" / "faq.md").write_text("# FAQ\n\n## Lost password\nReset it.\n\n## Refunds\nAsk us.\n")
+
+    sales = SalesAgent(llm_manager=FakeLLM(), memory=FakeMemory(), knowledge_dir=str(tmp_path))
+    help_agent = HelpAgent(llm_manager=FakeLLM(), memory=FakeMemory(), knowledge_dir=str(tmp_path))
+
+    assert "Cloud Course\nPrice: $100." in sales.system_message
+    assert "Web Development Bootcamp" not in sales.system_message
+    assert help_agent.knowledge_fallback == "Common issues you can help with:\n- Lost password\n- Refunds"
+
+
+def test_async_turn_keeps_blocking_work_off_the_event_loop():
+    history = ThreadRecordingHistory()
+    knowledge = FakeKnowledge()
+
+    async def run(concurrent):
+        agent, _ = _agent(history_store=history, knowledge=knowledge, concurrent_retrieval=concurrent)
+        loop_thread = threading.get_ident()
+        await agent.aprocess_message("hello", user_id="u1")
+        return loop_thread
+
+    for concurrent in (False, True):
+        history.threads.clear()
+        knowledge.threads.clear()
+        loop_thread = asyncio.run(run(concurrent))
+        assert len(history.threads) == 2 and loop_thread not in history.threads
+        assert knowledge.threads and loop_thread not in knowledge.threads
+
+
+def test_async_batch_builds_prompts_off_the_event_loop():
+    history = ThreadRecordingHistory()
+
+    async def run():
+        agent, _ = _agent(history_store=history)
+        loop_thread = threading.get_ident()
+        results = [r async for r in agent.aprocess_batch(["a", "b"], user_ids=["u1", "u2"])]
+        return loop_thread, results
+
+    loop_thread, results = asyncio.run(run())
+    assert sorted(r["index"] for r in results) == [0, 1]
+    assert history.threads and loop_thread not in history.threads
+
+
+class FlakyMemory(FakeMemory):
+    """Batched search is down, and single searches fail for one message."""
+
+    def search_memories_batch(self, *args, **kwargs):
+        raise ConnectionError("search unavailable")
+
+    def search_memories(self, query, user_id=None, limit=5, query_embedding=None, filters=None):
+        if query == "broken":
+            raise ConnectionError("search unavailable")
+        return super().search_memories(query, user_id, limit, query_embedding, filters)
+
+
+def test_batch_retrieval_failures_come_back_per_item():
+    agent = EchoAgent(llm_manager=FakeLLM(), memory=FlakyMemory(), system_message="You help.")
+
+    results = sorted(agent.process_batch(["fine", "broken", "also fine"], ["u1", "u2", "u3"]), key=lambda r: r["index"])
+    assert [r.get("response") for r in results] == ["ok", None, "ok"]
+    assert results[1] == {"index": 1, "user_id": "u2", "error": "search unavailable"}
+
+    async def run():
+        return [r async for r in agent.aprocess_batch(["broken", "fine"], ["u4", None])]
+
+    results = sorted(asyncio.run(run()), key=lambda r: r["index"])
+    assert results[0]["error"] == "search unavailable"
+    assert results[1]["response"] == "ok" and results[1]["user_id"]
@@ -0,0 +1,32 @@
+from utils.batching import parse_batch
+
+AGENTS = {"sales": object(), "help": object()}
+
+
+def test_items_are_grouped_by_agent_with_their_positions():
+    groups, concurrency, error = parse_batch(
+        {"messages": ["hi", {"message": "price?", "agent_id": "sales", "user_id": "u1"}, "bye"], "concurrency": 3},
+        AGENTS
+    )
+    assert error is None and concurrency == 3
+    assert groups == {"help": [(0, "hi", None), (2, "bye", None)], "sales": [(1, "price?", "u1")]}
+
+
+def test_invalid_batches_are_rejected():
+    assert parse_batch({"messages": []}, AGENTS)[2] == ("messages must be a non-empty list", 400)
+    assert parse_batch({"messages": ["a", "b"]}, AGENTS, max_items=1)[2][1] == 413
+    assert parse_batch({"messages": [{"message": "a", "agent_id": "ops"}]}, AGENTS)[2] == ("Invalid agent ID: ops", 400)
+
+
+def test_concurrency_is_clamped():
+    assert parse_batch({"messages": ["a"], "concurrency": 99}, AGENTS, max_concurrency=8)[1] == 8
+    assert parse_batch({"messages": ["a"], "concurrency": 0}, AGENTS)[1] == 1
+
+
+def test_malformed_items_and_concurrency_are_rejected_up_front():
+    assert parse_batch({"messages": ["a", 5]}, AGENTS)[2] == ("messages[1] must be a string or an object", 400)
+    assert parse_batch({"messages": [{"user_id": "u1"}]}, AGENTS)[2] == ("messages[0].message must be a non-empty string", 400)
+    assert parse_batch({"messages": [{"message": ["hi"]}]}, AGENTS)[2][1] == 400
+    assert parse_batch({"messages": ["  "]}, AGENTS)[2][1] == 400
+    assert parse_batch({"messages": [{"message": "hi", "user_id": 7}]}, AGENTS)[2] == ("messages[0].user_id must be a string", 400)
+    assert parse_batch({"messages": ["hi"], "concurrency": "fast"}, AGENTS)[2] == ("concurrency must be an integer", 400)
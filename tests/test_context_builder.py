@@ -0,0 +1,83 @@
+from agents.help_agent import HelpAgent
+from tests.fakes import FakeLLM, FakeMemory
+from utils import metrics
+from utils.context_builder import ContextBuilder, estimate_tokens
+
+
+def _history(exchanges):
+    history = []
+    for n in range(exchanges):
+        history += [
+            {"role": "user", "content": f"Tell me about course number {n} please"},
+            {"role": "assistant", "content": f"Course number {n} covers topic {n} in depth"}
+        ]
+    return history
+
+
+def test_estimate_is_conservative_for_words_and_characters():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("one two three") == 4
+    assert estimate_tokens("x" * 40) == 10
+
+
+def test_system_prompt_and_message_are_always_kept():
+    builder = ContextBuilder(max_prompt_tokens=10)
+    messages, stats = builder.build("You help.", _history(5), [], "What now?")
+
+    assert messages[0] == {"role": "system", "content": "You help."}
+    assert messages[-1] == {"role": "user", "content": "What now?"}
+    assert stats["history_messages"] == 0 and stats["history_dropped"] == 10
+
+
+def test_history_is_trimmed_oldest_first_without_an_orphaned_reply():
+    history = _history(5)
+    builder = ContextBuilder(max_prompt_tokens=60)
+    messages, stats = builder.build("You help.", history, [], "What now?")
+
+    kept = messages[1:-1]
+    assert kept == history[-len(kept):]
+    assert 0 < len(kept) < len(history)
+    assert kept[0]["role"] == "user"
+    assert stats["prompt_tokens"] <= 60
+
+
+def test_memories_are_deduplicated_truncated_and_ranked():
+    history = _history(1)
+    memories = [
+        {"text": "Prefers evening classes", "score": 0.5},
+        {"text": "prefers EVENING classes", "score": 0.4},
+        {"text": f"User: {history[0]['content']}\nAgent: {history[1]['content']}", "score": 0.9},
+        {"text": "word " * 100, "score": 0.7}
+    ]
+    builder = ContextBuilder(max_memory_item_tokens=20)
+    messages, stats = builder.build("You help.", history, memories, "Any news?")
+
+    context = next(m["content"] for m in messages if m["content"].startswith("Additional context"))
+    lines = context.splitlines()[1:]
+    assert lines[0].startswith("1. word word") and lines[0].endswith("…")
+    assert lines[1] == "2. Prefers evening classes"
+    assert stats["memories"] == 2
+    assert stats["memories_duplicate"] == 2
+    assert stats["memories_truncated"] == 1
+
+
+def test_reference_follows_the_system_prompt():
+    messages, _ = ContextBuilder().build("You help.", [], [], "Hi", reference="Reference information:\nFAQ")
+
+    assert [m["content"] for m in messages] == ["You help.", "Reference information:\nFAQ", "Hi"]
+
+
+def test_agents_record_prompt_sizes_as_metrics():
+    def observed():
+        state = metrics.PROMPT_TOKENS._values.get(("Help Agent",))
+        return (state[2], state[1]) if state else (0, 0.0)
+
+    agent = HelpAgent(llm_manager=FakeLLM(), memory=FakeMemory(), context_builder=ContextBuilder(max_prompt_tokens=50))
+    count, total = observed()
+    for n in range(3):
+        agent.process_message(f"Question {n} about my account settings", user_id="u1")
+
+    new_count, new_total = observed()
+    assert new_count == count + 3 and new_total > total
+    assert metrics.PROMPT_TRIMMED._values.get(("Help Agent", "history_dropped"), 0) > 0
+    assert not hasattr(agent, "last_prompt_stats")
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from utils.embedded_store import EmbeddedVectorStore
+
+DIM = 8
+
+
+def _vector(i):
+    rng = np.random.default_rng(i)
+    return rng.normal(size=DIM).astype(np.float32)
+
+
+def _records(ids, user_id="u1"):
+    return [(str(i), _vector(i), {"user_id": user_id, "n": i}) for i in ids]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddedVectorStore(str(tmp_path / "store"), DIM, compact_min_rows=4, compact_ratio=0.3)
+    yield store
+    store.close()
+
+
+def test_search_returns_nearest_first(store):
+    store.upsert(_records(range(20)))
+    hits = store.search(_vector(7), limit=3)
+    assert hits[0][0] == "7"
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_filters_and_delete(store):
+    store.upsert(_records(range(5), "a") + _records(range(5, 8), "b"))
+    assert store.count({"user_id": "b"}) == 3
+    assert store.delete(["5", "6", "missing"]) == 2
+    assert store.ids({"user_id": "b"}) == ["7"]
+
+
+def test_reopen_keeps_records(tmp_path):
+    path = str(tmp_path / "store")
+    store = EmbeddedVectorStore(path, DIM)
+    store.upsert(_records(range(3)))
+    store.delete(["1"])
+    store.close()
+
+    store = EmbeddedVectorStore(path, DIM)
+    try:
+        assert sorted(store.ids()) == ["0", "2"]
+    finally:
+        store.close()
+
+
+def test_second_open_is_refused(store):
+    with pytest.raises(RuntimeError):
+        EmbeddedVectorStore(store.path, DIM)
+
+
+def test_scan_survives_compaction_between_batches(store):
+    store.upsert(_records(range(10)))
+    scan = store.scan(with_vectors=True, batch_size=3)
+    first = [next(scan) for _ in range(3)]
+
+    # Deleting most rows compacts the store and renumbers the survivors
+    generation = store.generation
+    store.delete([str(i) for i in range(0, 5)])
+    assert store.generation > generation
+
+    rest = list(scan)
+    seen = first + rest
+    # Records already yielded stay as they were; the rest are resolved after compaction
+    assert [record_id for record_id, _, _ in seen] == ["0", "1", "2", "5", "6", "7", "8", "9"]
+    for record_id, payload, vector in rest:
+        assert payload["n"] == int(record_id)
+        np.testing.assert_allclose(vector, _vector(int(record_id)) / np.linalg.norm(_vector(int(record_id))), atol=1e-5)
+
+
+def test_scan_skips_records_that_no_longer_match(store):
+    store.upsert(_records(range(4), "a"))
+    scan = store.scan({"user_id": "a"}, batch_size=2)
+    next(scan)
+    store.upsert(_records([3], "b"))
+    assert [record_id for record_id, _, _ in scan] == ["1", "2"]
+
+
+def test_upsert_replaces_records_with_the_same_id(store):
+    store.upsert(_records(range(3), "a"))
+    store.upsert([("1", _vector(9), {"user_id": "b", "n": 9})])
+
+    assert store.count() == 3
+    assert store.ids({"user_id": "b"}) == ["1"]
+    assert sorted(store.values("user_id")) == ["a", "b"]
+    assert store.search(_vector(9), limit=1)[0][0] == "1"
+
+
+def test_created_before_and_field_selection(store):
+    store.upsert([(str(i), _vector(i), {"user_id": "a", "created_at": float(i)}) for i in range(5)])
+
+    assert sorted(store.ids(created_before=2.0)) == ["0", "1"]
+    assert [payload for _, payload, _ in store.scan(fields=["created_at"], batch_size=2)][:2] == [
+        {"created_at": 0.0}, {"created_at": 1.0}
+    ]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_approximate_search_finds_exact_matches(tmp_path, dtype):
+    store = EmbeddedVectorStore(str(tmp_path / "store"), DIM, dtype=dtype, ann_threshold=50, nprobe=4)
+    try:
+        store.upsert(_records(range(300)))
+        for i in (3, 150, 299):
+            assert store.search(_vector(i), limit=1)[0][0] == str(i)
+    finally:
+        store.close()
@@ -0,0 +1,154 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from utils.embedding_cache import EmbeddingCache
+
+
+def test_lru_eviction_and_hits():
+    cache = EmbeddingCache("m", max_size=2)
+    cache.put("a", [1.0, 0.0])
+    cache.put("b", [0.0, 1.0])
+    assert cache.get("a") is not None
+    cache.put("c", [1.0, 1.0])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_whitespace_variants_share_an_entry():
+    cache = EmbeddingCache("m")
+    cache.put("hello   world", [1.0])
+    assert cache.get(" hello world ") is not None
+
+
+def test_models_do_not_share_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    EmbeddingCache("m1", disk_path=path).put("a", [1.0])
+    assert EmbeddingCache("m2", disk_path=path).get("a") is None
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("utils.embedding_cache.time.time", lambda: now[0])
+    cache = EmbeddingCache("m", ttl=10)
+    cache.put("a", [1.0])
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    EmbeddingCache("m", disk_path=path).put("a", [0.5, 0.25])
+
+    cache = EmbeddingCache("m", disk_path=path)
+    np.testing.assert_array_equal(cache.get("a"), np.array([0.5, 0.25], dtype=np.float32))
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_connection_per_thread(tmp_path):
+    cache = EmbeddingCache("m", disk_path=str(tmp_path / "cache.db"))
+    main = cache._disk()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache._disk()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main
+    assert cache._disk() is main
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_opens_its_own_connection(tmp_path):
+    cache = EmbeddingCache("m", disk_path=str(tmp_path / "cache.db"))
+    parent = cache._disk()
+    cache.put("parent", [1.0])
+
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = cache._disk() is not parent and cache.get("parent") is not None
+            cache.put("child", [2.0])
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.WEXITSTATUS(status) == 0
+    assert EmbeddingCache("m", disk_path=cache.disk_path).get("child") is not None
+
+
+def _disk_rows(cache):
+    return cache._disk().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_disk_tier_is_capped_on_write(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("utils.embedding_cache.time.time", lambda: now[0])
+    cache = EmbeddingCache("m", disk_path=str(tmp_path / "cache.db"), max_disk_entries=3, disk_prune_interval=60)
+    for i in range(5):
+        now[0] += 1
+        cache.put(f"text {i}", [float(i)])
+    # Not pruned before the interval has passed
+    assert _disk_rows(cache) == 5
+
+    now[0] += 60
+    cache.put("text 5", [5.0])
+    assert _disk_rows(cache) == 3
+
+    fresh = EmbeddingCache("m", disk_path=cache.disk_path)
+    assert fresh.get("text 5") is not None
+    assert fresh.get("text 2") is None
+
+
+def test_expired_disk_entries_are_pruned(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("utils.embedding_cache.time.time", lambda: now[0])
+    cache = EmbeddingCache("m", ttl=10, disk_path=str(tmp_path / "cache.db"))
+    cache.put("old", [1.0])
+    now[0] += 20
+    cache.put("new", [2.0])
+    assert cache.prune_disk() == 1
+    assert _disk_rows(cache) == 1
+
+
+class BlockingDisk:
+    """Per-thread disk connections whose reads wait until released."""
+
+    def __init__(self, cache):
+        self.connect = cache._disk
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        return self
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT"):
+            self.reading.set()
+            self.release.wait(5)
+        return self.connect().execute(sql, params)
+
+
+def test_slow_disk_reads_do_not_block_memory_hits(tmp_path):
+    cache = EmbeddingCache("m", disk_path=str(tmp_path / "cache.db"))
+    cache.put("warm", [1.0])
+    disk = cache._disk = BlockingDisk(cache)
+
+    missed = threading.Thread(target=cache.get, args=("cold",))
+    missed.start()
+    assert disk.reading.wait(5)
+
+    hit = threading.Thread(target=cache.get, args=("warm",))
+    hit.start()
+    hit.join(1)
+    finished = not hit.is_alive()
+    disk.release.set()
+    missed.join()
+    hit.join()
+
+    assert finished
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,52 @@
+import pytest
+
+from utils import history_store
+from utils.history_store import InMemoryHistoryStore, SQLiteHistoryStore
+
+
+def _exchange(n):
+    return [{"role": "user", "content": f"question {n}"}, {"role": "assistant", "content": f"answer {n}"}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryHistoryStore(capacity=4, idle_ttl=60)
+    return SQLiteHistoryStore(str(tmp_path / "history.db"), capacity=4, idle_ttl=60)
+
+
+def test_sessions_keep_the_newest_messages_up_to_capacity(store):
+    for n in range(3):
+        store.append("Help Agent", "u1", _exchange(n))
+
+    assert [m["content"] for m in store.get("Help Agent", "u1")] == ["question 1", "answer 1", "question 2", "answer 2"]
+    assert store.get("Help Agent", "u1", limit=1) == [{"role": "assistant", "content": "answer 2"}]
+
+
+def test_sessions_are_separated_by_namespace_and_user(store):
+    store.append("Help Agent", "u1", _exchange(1))
+
+    assert store.get("Sales Agent", "u1") == []
+    assert store.get("Help Agent", "u2") == []
+    store.clear("Help Agent", "u1")
+    assert store.get("Help Agent", "u1") == []
+
+
+def test_idle_sessions_are_evicted(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(history_store.time, "time", lambda: now[0])
+    store.append("Help Agent", "idle", _exchange(1))
+    now[0] += 30
+    store.append("Help Agent", "active", _exchange(2))
+
+    now[0] += 45
+    assert store.evict_idle() >= 1
+    assert store.get("Help Agent", "idle") == []
+    assert len(store.get("Help Agent", "active")) == 2
+
+
+def test_sqlite_history_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "history.db")
+    SQLiteHistoryStore(path).append("Help Agent", "u1", _exchange(1))
+
+    assert len(SQLiteHistoryStore(path).get("Help Agent", "u1")) == 2
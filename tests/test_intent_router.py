@@ -0,0 +1,48 @@
+import asyncio
+
+from langgraph_setup.intent_router import IntentClassifier
+from tests.fakes import FakeMemory, embed_text
+from utils import metrics
+
+PROTOTYPES = {
+    "sales": ["course price enroll", "bootcamp cost payment"],
+    "help": ["login password reset", "video not loading"]
+}
+
+
+def test_classify_routes_confident_queries_and_leaves_ambiguous_ones():
+    classifier = IntentClassifier(FakeMemory(), PROTOTYPES, threshold=0.9, margin=0.05)
+
+    decision = classifier.classify("login password reset")
+    assert decision["agent"] == "help" and decision["score"] > 0.99
+
+    assert classifier.classify("something else entirely")["agent"] is None
+
+
+def test_classify_uses_a_given_embedding():
+    classifier = IntentClassifier(FakeMemory(), PROTOTYPES, threshold=0.9)
+    decision = classifier.classify("unrelated words", query_embedding=embed_text("course price enroll"))
+    assert decision["agent"] == "sales"
+
+
+def test_aclassify_spans_land_in_the_request_timings():
+    classifier = IntentClassifier(FakeMemory(), PROTOTYPES)
+    original = classifier.classify
+
+    def classify(query, query_embedding=None):
+        with metrics.span("router.classify"):
+            return original(query, query_embedding)
+
+    classifier.classify = classify
+
+    async def run():
+        token = metrics.start_request()
+        try:
+            decision = await classifier.aclassify("login password reset")
+            return decision, dict(metrics.request_timings())
+        finally:
+            metrics.end_request(token)
+
+    decision, timings = asyncio.run(run())
+    assert decision["agent"] == "help"
+    assert "router.classify" in timings
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from utils.context_builder import estimate_tokens
+from utils.llm_manager import GroqLLMManager
+from utils.llm_transport import TokenBucket
+
+MESSAGES = [{"role": "user", "content": "How much is the data science bootcamp?"}]
+CHUNKS = ["The bootcamp ", "costs ", "$4,999."]
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        assert kwargs["stream"]
+        return iter([_chunk(content) for content in CHUNKS])
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncClient(FakeClient):
+    async def create(self, **kwargs):
+        async def stream():
+            for content in CHUNKS:
+                yield _chunk(content)
+        return stream()
+
+    async def close(self):
+        self.closed = True
+
+
+def _manager():
+    manager = GroqLLMManager(api_key="test", tokens_per_minute=10000)
+    manager.client.close()
+    manager.client, manager.async_client = FakeClient(), FakeAsyncClient()
+    # Practically no refill, so the balance only moves with reservations
+    manager.token_bucket = TokenBucket(0.001, capacity=10000)
+    return manager
+
+
+def _spent(chunks):
+    return estimate_tokens(MESSAGES[0]["content"]) + estimate_tokens("".join(chunks))
+
+
+def test_stream_settles_its_token_reservation():
+    manager = _manager()
+    assert "".join(manager.stream_with_history(MESSAGES, max_tokens=500)) == "".join(CHUNKS)
+    assert round(manager.token_bucket._available) == 10000 - _spent(CHUNKS)
+
+
+def test_abandoned_stream_settles_what_was_streamed():
+    manager = _manager()
+    stream = manager.stream_with_history(MESSAGES, max_tokens=500)
+    next(stream)
+    stream.close()
+    assert round(manager.token_bucket._available) == 10000 - _spent(CHUNKS[:1])
+
+
+def test_async_stream_settles_its_token_reservation():
+    manager = _manager()
+
+    async def run():
+        return [chunk async for chunk in manager.astream_with_history(MESSAGES, max_tokens=500)]
+
+    assert asyncio.run(run()) == CHUNKS
+    assert round(manager.token_bucket._available) == 10000 - _spent(CHUNKS)
+
+
+def test_close_releases_both_clients():
+    manager = _manager()
+    manager.close()
+    assert manager.client.closed and manager.async_client.closed
+
+    manager = _manager()
+    asyncio.run(manager.aclose())
+    assert manager.client.closed and manager.async_client.closed
+
+
+class SlowPrimaryClient:
+    """Non-streaming client where the primary model is slower than the fallback."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, **kwargs):
+        time.sleep(self.delays[model])
+        message = SimpleNamespace(content=model)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    def close(self):
+        pass
+
+
+def test_hedges_do_not_queue_behind_primaries():
+    manager = GroqLLMManager(api_key="test", model="primary", fallback_model="fallback", hedge_after=0.05, max_hedges=2)
+    manager.client.close()
+    manager.client = SlowPrimaryClient({"primary": 0.6, "fallback": 0.2})
+    results = []
+
+    def call():
+        results.append(manager.generate_with_history(MESSAGES))
+
+    threads = [threading.Thread(target=call) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manager.close()
+
+    assert sorted(results) == ["fallback"] * 2 + ["primary"] * 8
+    stats = manager.transport_stats
+    assert (stats["hedged"], stats["hedge_wins"], stats["hedge_skipped"]) == (2, 2, 8)
@@ -0,0 +1,108 @@
+import asyncio
+from types import SimpleNamespace
+
+import groq
+import httpx
+import pytest
+
+from utils import llm_transport
+from utils.llm_transport import RetryPolicy, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_transport.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(llm_transport.time, "sleep", clock.sleep)
+    return clock
+
+
+def _error(cls, status, headers=None):
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("error", response=response, body=None)
+
+
+def test_bucket_allows_a_burst_then_asks_callers_to_wait(clock):
+    bucket = TokenBucket(60, capacity=2)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+
+    clock.now += 10
+    assert bucket.reserve() == 0.0
+
+
+def test_oversized_requests_are_capped_at_capacity(clock):
+    bucket = TokenBucket(600, capacity=100)
+
+    assert bucket.reserve(500) == 0.0
+    assert bucket.reserve(10) == pytest.approx(1.0)
+
+
+def test_adjust_returns_unused_reservations(clock):
+    bucket = TokenBucket(60, capacity=10)
+    bucket.reserve(10)
+    bucket.adjust(4)
+
+    assert bucket.reserve(4) == 0.0
+    bucket.adjust(100)
+    assert bucket._available == 10
+
+
+def test_acquire_sleeps_for_the_shortfall(clock):
+    bucket = TokenBucket(60, capacity=1)
+    bucket.acquire()
+    bucket.acquire()
+
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_aacquire_waits_without_blocking(clock, monkeypatch):
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(llm_transport.asyncio, "sleep", sleep)
+    bucket = TokenBucket(60, capacity=1)
+    asyncio.run(bucket.aacquire())
+    asyncio.run(bucket.aacquire())
+
+    assert waits == [pytest.approx(1.0)] and clock.slept == []
+
+
+def test_only_transient_errors_are_retried():
+    policy = RetryPolicy(max_retries=2)
+
+    assert policy.should_retry(_error(groq.RateLimitError, 429), 0)
+    assert policy.should_retry(_error(groq.InternalServerError, 503), 1)
+    assert not policy.should_retry(_error(groq.InternalServerError, 503), 2)
+    assert not policy.should_retry(_error(groq.BadRequestError, 400), 0)
+    assert not policy.should_retry(ValueError("bad"), 0)
+
+
+def test_delay_honours_retry_after_and_backs_off_with_jitter(monkeypatch):
+    policy = RetryPolicy(base_delay=0.5, max_delay=8.0)
+
+    assert policy.delay(_error(groq.RateLimitError, 429, {"retry-after": "3"}), 0) == 3.0
+    assert policy.delay(_error(groq.RateLimitError, 429, {"retry-after": "60"}), 0) == 8.0
+
+    monkeypatch.setattr(llm_transport.random, "uniform", lambda low, high: high)
+    error = SimpleNamespace()
+    assert [policy.delay(error, attempt) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0]
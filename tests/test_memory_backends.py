@@ -0,0 +1,49 @@
+import pytest
+
+from tests.fakes import FakeEncoder
+from utils.embedded_memory import EmbeddedMemory
+
+
+@pytest.fixture(params=["embedded", "qdrant"])
+def memory(request, tmp_path):
+    if request.param == "embedded":
+        backend = EmbeddedMemory(path=str(tmp_path), collection_name="agent_memory", encoder=FakeEncoder())
+    else:
+        pytest.importorskip("qdrant_client")
+        from utils.memory import LOCAL_URL, QdrantMemory
+        backend = QdrantMemory(url=LOCAL_URL, collection_name="agent_memory", encoder=FakeEncoder())
+    yield backend
+    backend.close()
+
+
+def _fill(memory):
+    for user_id in ("carol", "alice", "bob", "alice"):
+        memory.add_memory(f"User: hi from {user_id}\nAgent: hello", {"interaction_type": "conversation"}, user_id=user_id)
+    memory.add_memory("Unowned note", {"interaction_type": "note"})
+    memory.flush()
+
+
+def test_user_ids_are_distinct_and_sorted(memory):
+    _fill(memory)
+    assert memory.user_ids() == ["alice", "bob", "carol"]
+
+
+def test_payload_fields_limit_what_is_read(memory):
+    _fill(memory)
+    rows = list(memory.iter_memories(payload_fields=["user_id"]))
+    assert len(rows) == 5
+    assert all(row["text"] is None and set(row["metadata"]) <= {"user_id"} for row in rows)
+
+    full = list(memory.iter_memories(user_id="bob"))
+    assert full[0]["text"].startswith("User: hi from bob")
+    assert full[0]["metadata"]["interaction_type"] == "conversation"
+
+
+def test_user_ids_can_be_limited_to_recent_writes(memory):
+    memory.add_memory("old", {"created_at": 100.0}, user_id="alice")
+    memory.add_memory("new", {"created_at": 200.0}, user_id="bob")
+    memory.add_memory("legacy", {}, user_id="carol")
+    memory.flush()
+
+    assert memory.user_ids(created_after=150.0) == ["bob"]
+    assert memory.user_ids() == ["alice", "bob", "carol"]
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+from tests.fakes import FakeEncoder, FakeLLM
+from utils.embedded_memory import EmbeddedMemory
+from utils.memory_compaction import DAY, MemoryCompactor
+
+NOW = time.time()
+
+
+@pytest.fixture
+def memory(tmp_path):
+    memory = EmbeddedMemory(path=str(tmp_path / "store"), collection_name="agent_memory", encoder=FakeEncoder())
+    yield memory
+    memory.close()
+
+
+def _add(memory, user_id, text, days_ago, interaction_type="conversation"):
+    memory.add_memory(text, {"interaction_type": interaction_type, "created_at": NOW - days_ago * DAY}, user_id=user_id)
+
+
+def _texts(memory, user_id):
+    return sorted(m["text"] for m in memory.iter_memories(user_id=user_id))
+
+
+def test_expired_duplicate_and_excess_memories_are_removed(memory):
+    _add(memory, "u1", "User: very old question", 400)
+    _add(memory, "u1", "User: price of the bootcamp", 3)
+    _add(memory, "u1", "User: price of the bootcamp", 1)
+    for n in range(4):
+        _add(memory, "u1", f"User: question {n} about topic {n}", 2 - n * 0.1)
+    memory.flush()
+
+    compactor = MemoryCompactor(memory, max_age=365 * DAY, max_per_user=4, pause=0)
+    stats = compactor.compact_user("u1")
+
+    assert stats == {"expired": 1, "merged": 1, "summarized": 0, "summaries": 0, "trimmed": 1}
+    texts = _texts(memory, "u1")
+    assert len(texts) == 4 and "User: price of the bootcamp" in texts
+    assert "User: very old question" not in texts
+
+
+def test_old_conversations_are_rolled_into_summaries(memory):
+    for n in range(5):
+        _add(memory, "u1", f"User: question {n} about topic {n}", 60 - n)
+    _add(memory, "u1", "User: yesterday's question", 1)
+    memory.flush()
+
+    llm = FakeLLM(route="Wants an evening data science course.")
+    compactor = MemoryCompactor(memory, llm_manager=llm, summarize_after=30 * DAY, summary_batch_size=2, pause=0)
+    stats = compactor.compact_user("u1")
+
+    # Two batches of two; the lone fifth interaction waits for the next run
+    assert stats["summaries"] == 2 and stats["summarized"] == 4
+    assert len(llm.prompts) == 2
+    summaries = [m for m in memory.iter_memories(user_id="u1") if m["metadata"]["interaction_type"] == "summary"]
+    assert [m["metadata"]["summarized_count"] for m in summaries] == [2, 2]
+    assert summaries[0]["text"].endswith("Wants an evening data science course.")
+    assert "User: yesterday's question" in _texts(memory, "u1")
+
+
+def test_dry_run_counts_without_writing(memory):
+    _add(memory, "u1", "User: very old question", 400)
+    memory.flush()
+
+    stats = MemoryCompactor(memory, max_age=365 * DAY, pause=0, dry_run=True).run()
+
+    assert stats["expired"] == 1
+    assert memory.count_memories() == 1
+
+
+def test_runs_resume_from_the_checkpoint(memory, tmp_path):
+    for user_id in ("alice", "bob", "carol"):
+        _add(memory, user_id, "User: very old question", 400)
+    memory.flush()
+    checkpoint = str(tmp_path / "compaction.json")
+
+    compactor = MemoryCompactor(memory, max_age=365 * DAY, max_users_per_run=2, pause=0, checkpoint_path=checkpoint)
+    first = compactor.run()
+    assert (first["users"], first["complete"]) == (2, False)
+    assert _texts(memory, "carol") == ["User: very old question"]
+
+    second = MemoryCompactor(memory, max_age=365 * DAY, max_users_per_run=2, pause=0, checkpoint_path=checkpoint).run()
+    assert (second["users"], second["complete"]) == (1, True)
+    assert memory.count_memories() == 0
+
+
+def test_routine_passes_only_visit_users_with_new_memories(memory, tmp_path):
+    for user_id in ("alice", "bob"):
+        _add(memory, user_id, "User: an old question", 10)
+    memory.flush()
+    checkpoint = str(tmp_path / "compaction.json")
+
+    def compactor(**kwargs):
+        return MemoryCompactor(memory, pause=0, checkpoint_path=checkpoint, **kwargs)
+
+    first = compactor().run()
+    assert (first["users"], first["full_scan"]) == (2, True)
+
+    _add(memory, "bob", "User: a new question", 0)
+    memory.flush()
+    second = compactor().run()
+    assert (second["users"], second["full_scan"], second["complete"]) == (1, False, True)
+
+    # A full scan is due again once the interval has passed
+    third = compactor(full_scan_interval=0.001).run()
+    assert (third["users"], third["full_scan"]) == (2, True)
+
+
+def test_query_vectors_are_not_used_to_merge_different_answers(memory):
+    question = memory.embed_batch(["User: how much is the bootcamp?"])[0]
+    for days_ago, answer in ((2, "It is $4,999."), (1, "The DevOps course is $3,999.")):
+        memory.add_memory(f"User: how much is the bootcamp?\nAgent: {answer}",
+                          {"interaction_type": "conversation", "created_at": NOW - days_ago * DAY},
+                          user_id="u1", embedding=question)
+    memory.flush()
+
+    assert MemoryCompactor(memory, dedup_embed_text=True, dry_run=True).compact_user("u1")["merged"] == 0
+    assert MemoryCompactor(memory, dry_run=True).compact_user("u1")["merged"] == 1
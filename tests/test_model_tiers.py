@@ -0,0 +1,43 @@
+from agents.help_agent import HelpAgent
+from tests.fakes import FakeLLM, FakeMemory
+from utils.model_tiers import ModelTierPolicy, parse_mapping
+
+TIERS = {"small": "llama3-8b-8192", "large": "llama3-70b-8192"}
+
+
+def _policy(**routes):
+    return ModelTierPolicy(TIERS, routes, simple_max_words=6, simple_max_history=2)
+
+
+def test_parse_mapping_reads_env_style_pairs():
+    assert parse_mapping("router=small, SalesAgent = large,junk") == {"router": "small", "SalesAgent": "large"}
+    assert parse_mapping(None) == {}
+
+
+def test_first_routed_target_wins():
+    policy = _policy(router="small", HelpAgent="mixtral-8x7b-32768")
+
+    assert policy.select("router") == "llama3-8b-8192"
+    assert policy.select("help", "HelpAgent") == "mixtral-8x7b-32768"
+    assert policy.select("sales", "SalesAgent") is None
+
+
+def test_auto_sends_only_short_early_questions_to_the_small_tier():
+    policy = _policy(help="auto")
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+
+    assert policy.select("help", message="How do I log in?") == "llama3-8b-8192"
+    assert policy.select("help", message="How do I log in?", history=history + history) == "llama3-70b-8192"
+    assert policy.select("help", message="Why? And how?") == "llama3-70b-8192"
+    assert policy.select("help", message="Please walk me through setting up my development environment") == "llama3-70b-8192"
+    assert policy.select("help", message=None) == "llama3-70b-8192"
+
+
+def test_agents_call_the_model_chosen_for_their_class():
+    llm = FakeLLM()
+    agent = HelpAgent(llm_manager=llm, memory=FakeMemory(), model_policy=_policy(HelpAgent="auto"))
+
+    agent.process_message("How do I log in?", user_id="u1")
+    agent.process_message("My project build fails with a strange linker error on Windows", user_id="u1")
+
+    assert llm.models == ["llama3-8b-8192", "llama3-70b-8192"]
@@ -0,0 +1,77 @@
+import pytest
+
+from tests.fakes import FakeEncoder
+from utils import response_cache
+from utils.embedded_memory import EmbeddedMemory
+from utils.response_cache import RESPONSE_CACHE_INDEXES, SemanticResponseCache
+
+SYSTEM = {"role": "system", "content": "You help."}
+
+
+def _messages(question, previous=None):
+    messages = [SYSTEM]
+    if previous:
+        messages += [{"role": "user", "content": "earlier"}, {"role": "assistant", "content": previous}]
+    return messages + [{"role": "user", "content": question}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    memory = EmbeddedMemory(path=str(tmp_path), collection_name="llm_response_cache",
+                            encoder=FakeEncoder(), payload_indexes=RESPONSE_CACHE_INDEXES)
+    yield SemanticResponseCache(memory, similarity_threshold=0.95, ttl=60, max_entries=2, prune_interval=3600)
+    memory.close()
+
+
+def test_exact_requests_hit_in_process(cache):
+    cache.store(_messages("How do I reset my password?"), "small", "Use the reset link.", temperature=0.7)
+
+    assert cache.lookup(_messages("How do I reset my password?"), "small", temperature=0.7) == "Use the reset link."
+    assert cache.lookup(_messages("How do I reset my password?"), "small", temperature=0.2) is None
+    assert cache.lookup(_messages("How do I reset my password?"), "large", temperature=0.7) is None
+
+
+def test_similar_questions_hit_within_the_same_scope(cache):
+    cache.store(_messages("How do I reset my password?"), "small", "Use the reset link.", scope="help")
+
+    assert cache.lookup(_messages("how do i reset my password?"), "small", scope="help") == "Use the reset link."
+    assert cache.lookup(_messages("how do i reset my password?"), "small", scope="sales") is None
+    assert cache.lookup(_messages("What does the bootcamp cost?"), "small", scope="help") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_follow_ups_only_match_after_a_similar_reply(cache):
+    cache.store(_messages("Tell me more", previous="The bootcamp lasts 12 weeks."), "small", "It is full time.", scope="sales")
+
+    assert cache.lookup(_messages("Tell me more", previous="Refunds take 5 days."), "small", scope="sales") is None
+
+
+def test_expired_entries_miss_and_are_pruned(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    for n in range(3):
+        cache.store(_messages(f"question {n}"), "small", f"answer {n}", scope="help")
+        now[0] += 1
+    cache.memory.flush()
+
+    cache.prune()
+    assert cache.memory.count_memories() == 2
+
+    now[0] += 60
+    assert cache.lookup(_messages("question 2"), "small", scope="help") is None
+    cache.prune()
+    assert cache.memory.count_memories() == 0
+
+
+def test_users_never_share_answers_built_from_their_memories(cache):
+    alice = [SYSTEM, {"role": "system", "content": "Additional context: Previous relevant interactions:\n1. Alice is enrolled in the bootcamp\n"},
+             {"role": "user", "content": "When does my course start?"}]
+    bob = [SYSTEM, {"role": "system", "content": "Additional context: Previous relevant interactions:\n1. Bob asked about DevOps\n"},
+           {"role": "user", "content": "When does my course start?"}]
+    cache.store(alice, "small", "Your bootcamp starts Monday.", scope="help", user_id="alice")
+
+    assert cache.lookup(bob, "small", scope="help", user_id="bob") is None
+    # Same memories under another user ID, or another memory context for the same user
+    assert cache.lookup(alice, "small", scope="help", user_id="bob") is None
+    assert cache.lookup(bob, "small", scope="help", user_id="alice") is None
+    assert cache.lookup(alice, "small", scope="help", user_id="alice") == "Your bootcamp starts Monday."
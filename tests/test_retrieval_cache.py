@@ -0,0 +1,103 @@
+import pytest
+
+from tests.fakes import FakeEncoder, embed_text
+from utils.retrieval_cache import RetrievalCache
+
+TEXTS = [f"note {n} about course {n % 3} and topic {n}" for n in range(12)]
+
+
+def _candidates(query, texts, limit):
+    """What a remote search returns: the `limit` nearest points, best first."""
+    scored = sorted(enumerate(texts), key=lambda item: -float(embed_text(item[1]) @ query))
+    return [(str(i), embed_text(text), {"text": text, "user_id": "u1"}) for i, text in scored[:limit]]
+
+
+def test_complete_entry_answers_any_query_exactly():
+    cache = RetrievalCache(candidate_limit=32)
+    query = embed_text("course 1")
+    cache.store("u1", None, query, _candidates(query, TEXTS, 32), cache.version("u1"))
+
+    other = embed_text("topic 7")
+    hits = cache.lookup("u1", None, other, 3)
+    expected = [float(c[1] @ other) for c in _candidates(other, TEXTS, 3)]
+    assert [hit["score"] for hit in hits] == pytest.approx(expected, abs=1e-5)
+    assert hits[0]["metadata"] == {"user_id": "u1"}
+    assert cache.stats() == {"hits": 1, "misses": 0, "size": 1}
+
+
+def test_partial_entry_misses_when_the_query_drifts():
+    cache = RetrievalCache(candidate_limit=4)
+    query = embed_text("note 1 about course 1")
+    cache.store("u1", None, query, _candidates(query, TEXTS, 4), cache.version("u1"))
+
+    assert cache.lookup("u1", None, query, 2) is not None
+    assert cache.lookup("u1", None, -query, 2) is None
+    assert cache.lookup("u1", None, query, 5) is None
+
+
+def test_entries_are_keyed_by_user_and_filters():
+    cache = RetrievalCache()
+    query = embed_text("course 1")
+    cache.store("u1", {"agent": "help"}, query, _candidates(query, TEXTS, 32), cache.version("u1"))
+
+    assert cache.lookup("u1", None, query, 3) is None
+    assert cache.lookup("u2", {"agent": "help"}, query, 3) is None
+    assert cache.lookup("u1", {"agent": "help"}, query, 3) is not None
+
+
+def test_writes_go_through_and_stale_stores_are_dropped():
+    cache = RetrievalCache()
+    query = embed_text("course 1")
+    version = cache.version("u1")
+    cache.store("u1", None, query, _candidates(query, TEXTS, 32), version)
+
+    cache.add("u1", "new", query, {"text": "fresh memory", "user_id": "u1"})
+    assert cache.lookup("u1", None, query, 1)[0]["text"] == "fresh memory"
+
+    # A search started before the write must not overwrite the entry
+    cache.store("u1", None, query, _candidates(query, TEXTS, 32), version)
+    assert cache.lookup("u1", None, query, 1)[0]["text"] == "fresh memory"
+
+    cache.discard(ids=["new"])
+    assert cache.lookup("u1", None, query, 1)[0]["text"] != "fresh memory"
+    cache.discard(user_id="u1")
+    assert cache.lookup("u1", None, query, 1) is None
+
+
+def test_entries_expire_and_least_recent_users_are_evicted(monkeypatch):
+    from utils import retrieval_cache
+    now = [100.0]
+    monkeypatch.setattr(retrieval_cache.time, "monotonic", lambda: now[0])
+    cache = RetrievalCache(max_users=1, ttl=10)
+    query = embed_text("course 1")
+    for user_id in ("u1", "u2"):
+        cache.store(user_id, None, query, _candidates(query, TEXTS, 32), cache.version(user_id))
+
+    assert cache.lookup("u1", None, query, 1) is None
+    assert cache.lookup("u2", None, query, 1) is not None
+    now[0] += 11
+    assert cache.lookup("u2", None, query, 1) is None
+
+
+def test_cached_qdrant_search_matches_the_uncached_one():
+    pytest.importorskip("qdrant_client")
+    from utils.memory import LOCAL_URL, QdrantMemory
+
+    plain = QdrantMemory(url=LOCAL_URL, collection_name="plain", encoder=FakeEncoder())
+    cached = QdrantMemory(url=LOCAL_URL, collection_name="cached", encoder=FakeEncoder(),
+                          retrieval_cache=RetrievalCache(candidate_limit=4))
+    try:
+        for memory in (plain, cached):
+            for text in TEXTS[:8]:
+                memory.add_memory(text, {"interaction_type": "conversation"}, user_id="u1")
+
+        for query in ("course 1", "course 1", "topic 3", "topic 3"):
+            expected = [hit["score"] for hit in plain.search_memories(query, user_id="u1", limit=2)]
+            scores = [hit["score"] for hit in cached.search_memories(query, user_id="u1", limit=2)]
+            assert scores == pytest.approx(expected, abs=1e-5)
+            for memory in (plain, cached):
+                memory.add_memory(f"{query} again", {"interaction_type": "conversation"}, user_id="u1")
+        assert cached.retrieval_cache.hits > 0
+    finally:
+        plain.close()
+        cached.close()
@@ -0,0 +1,50 @@
+"""Request batching shared by the Flask and FastAPI apps (/chat/batch)."""
+import os
+
+# Limits for /chat/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+
+def parse_batch(data, agents, max_items: int = BATCH_MAX_ITEMS, max_concurrency: int = BATCH_MAX_CONCURRENCY):
+    """
+    Validate a batch request and group its items by agent.
+
+    Items are {"message", "user_id", "agent_id"} objects or plain strings;
+    `agent_id` defaults to the request's own. Every item is checked up front,
+    so a malformed one is a 400 rather than a failure partway through the stream.
+
+    Returns:
+        ({agent_id: [(index, message, user_id), ...]}, concurrency, None), or
+        (None, None, (error, status)) for an invalid request
+    """
+    items = data.get('messages')
+    if not isinstance(items, list) or not items:
+        return None, None, ("messages must be a non-empty list", 400)
+    if len(items) > max_items:
+        return None, None, (f"At most {max_items} messages per batch", 413)
+
+    try:
+        concurrency = int(data.get('concurrency', max_concurrency))
+    except (TypeError, ValueError):
+        return None, None, ("concurrency must be an integer", 400)
+
+    groups = {}
+    default_agent = data.get('agent_id', 'help')
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"message": item}
+        if not isinstance(item, dict):
+            return None, None, (f"messages[{index}] must be a string or an object", 400)
+        message = item.get('message')
+        if not isinstance(message, str) or not message.strip():
+            return None, None, (f"messages[{index}].message must be a non-empty string", 400)
+        user_id = item.get('user_id')
+        if user_id is not None and not isinstance(user_id, str):
+            return None, None, (f"messages[{index}].user_id must be a string", 400)
+        agent_id = item.get('agent_id', default_agent)
+        if agent_id not in agents:
+            return None, None, (f"Invalid agent ID: {agent_id}", 400)
+        groups.setdefault(agent_id, []).append((index, message, user_id))
+
+    return groups, max(1, min(concurrency, max_concurrency)), None
@@ -0,0 +1,175 @@
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_WORD = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for Llama-family tokenizers.
+
+    Takes the larger of a characters/4 and a words*4/3 estimate, which stays
+    conservative for both English and non-Latin scripts such as Sinhala.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), math.ceil(len(_WORD.findall(text)) * 4 / 3))
+
+
+class ContextBuilder:
+    def __init__(self,
+                 max_prompt_tokens: int = 3000,
+                 max_memory_tokens: int = 800,
+                 max_memory_item_tokens: int = 200,
+                 dedup_threshold: float = 0.8,
+                 message_overhead: int = 4,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        """
+        Assemble LLM prompts that fit a token budget.
+
+        The system prompt and the current message are always kept. Retrieved
+        memories are deduplicated (against each other and the recent
+        history), truncated and added in score order up to
+        `max_memory_tokens`. The remaining budget is filled with the most
+        recent history messages.
+
+        Args:
+            max_prompt_tokens: Total token budget for the prompt
+            max_memory_tokens: Budget for retrieved memories
+            max_memory_item_tokens: Maximum tokens of a single memory
+            dedup_threshold: Word-set Jaccard similarity above which two texts
+                are treated as duplicates
+            message_overhead: Tokens charged per message for chat formatting
+            token_counter: Callable returning the token count of a text
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_memory_tokens = max_memory_tokens
+        self.max_memory_item_tokens = max_memory_item_tokens
+        self.dedup_threshold = dedup_threshold
+        self.message_overhead = message_overhead
+        self.count_tokens = token_counter or estimate_tokens
+
+    def build(self,
+              system_message: Optional[str],
+              history: List[Dict[str, str]],
+              memories: List[Dict[str, Any]],
+              message: str,
+              reference: Optional[str] = None) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        Build the message list for one turn.
+
+        Args:
+            reference: Knowledge snippets for the turn, kept after the system prompt
+
+        Returns:
+            The messages and stats describing the assembled prompt
+        """
+        head = [{"role": "system", "content": system_message}] if system_message else []
+        if reference:
+            head.append({"role": "system", "content": reference})
+        tail = [{"role": "user", "content": message}]
+        used = sum(self._message_tokens(m) for m in head + tail)
+        available = max(self.max_prompt_tokens - used, 0)
+
+        # Memories: dedupe, truncate and take by score within their budget
+        memory_lines, memory_stats = self._select_memories(memories, history, min(self.max_memory_tokens, available))
+        context_messages = []
+        if memory_lines:
+            context = "Previous relevant interactions:\n" + "".join(
+                f"{i}. {line}\n" for i, line in enumerate(memory_lines, 1)
+            )
+            context_messages.append({"role": "system", "content": f"Additional context: {context}"})
+        available -= sum(self._message_tokens(m) for m in context_messages)
+
+        # History: newest first, until the budget runs out
+        kept_history = []
+        for entry in reversed(history):
+            cost = self._message_tokens(entry)
+            if cost > available:
+                break
+            kept_history.insert(0, entry)
+            available -= cost
+        # Don't open the history with an orphaned assistant reply
+        if kept_history and kept_history[0]["role"] == "assistant":
+            available += self._message_tokens(kept_history.pop(0))
+
+        messages = head + kept_history + context_messages + tail
+        stats = {
+            "prompt_tokens": sum(self._message_tokens(m) for m in messages),
+            "history_messages": len(kept_history),
+            "history_dropped": len(history) - len(kept_history),
+            **memory_stats
+        }
+        return messages, stats
+
+    def _select_memories(self, memories, history, budget):
+        history_sets = [_word_set(entry["content"]) for entry in history]
+        seen = list(history_sets)
+        lines = []
+        duplicates = truncated = dropped = 0
+
+        for memory in sorted(memories, key=lambda m: m.get("score") or 0, reverse=True):
+            text = memory.get("text") or ""
+            words = _word_set(text)
+            if any(_jaccard(words, other) >= self.dedup_threshold for other in seen) or \
+                    _covered_by_history(words, history_sets, self.dedup_threshold):
+                duplicates += 1
+                continue
+
+            if self.count_tokens(text) > self.max_memory_item_tokens:
+                text = self._truncate(text, self.max_memory_item_tokens)
+                truncated += 1
+
+            cost = self.count_tokens(text) + 2
+            if cost > budget:
+                dropped += 1
+                continue
+
+            lines.append(text)
+            seen.append(words)
+            budget -= cost
+
+        return lines, {
+            "memories": len(lines),
+            "memories_duplicate": duplicates,
+            "memories_truncated": truncated,
+            "memories_dropped": dropped
+        }
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to roughly `max_tokens`, on a word boundary."""
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(text[:mid]) + 1 <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        cut = text[:low]
+        if " " in cut:
+            cut = cut.rsplit(" ", 1)[0]
+        return cut + "…"
+
+    def _message_tokens(self, message: Dict[str, str]) -> int:
+        return self.count_tokens(message["content"]) + self.message_overhead
+
+
+def _word_set(text: str) -> frozenset:
+    return frozenset(word.lower() for word in _WORD.findall(text) if word.isalnum())
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _covered_by_history(words: frozenset, history_sets: List[frozenset], threshold: float) -> bool:
+    """True when a "User/Agent" memory repeats an exchange already in the history."""
+    if not words or len(history_sets) < 2:
+        return False
+    for question, answer in zip(history_sets, history_sets[1:]):
+        if _jaccard(words, question | answer) >= threshold:
+            return True
+    return False
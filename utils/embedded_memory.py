@@ -0,0 +1,152 @@
+"""
+Agent memory stored inside the process (see utils.embedded_store).
+
+A drop-in alternative to QdrantMemory for single-process deployments that do
+not want to run a Qdrant server: each collection is a store directory under
+`path`.
+"""
+import os
+from typing import Any, Dict, Iterable, Optional
+
+from utils.embedded_store import EmbeddedVectorStore
+from utils.embedding_backends import DEFAULT_BACKEND
+from utils.memory_backend import MemoryBackend, canonical_id
+
+# Payload fields answered from the inverted index
+DEFAULT_INDEXED_FIELDS = ("user_id", "interaction_type")
+
+
+class EmbeddedMemory(MemoryBackend):
+    def __init__(self,
+                 path: str,
+                 collection_name: str,
+                 embedding_model: str = "all-MiniLM-L6-v2",
+                 embedding_cache=None,
+                 encoder=None,
+                 embedding_backend: str = DEFAULT_BACKEND,
+                 backend_options: Optional[Dict[str, Any]] = None,
+                 write_behind: bool = False,
+                 write_batch_size: int = 64,
+                 write_flush_interval: float = 0.5,
+                 write_queue_size: int = 10000,
+                 vector_dtype: str = "float32",
+                 fsync: bool = False,
+                 ann_threshold: int = 20000,
+                 nprobe: int = 8,
+                 payload_indexes: Iterable[str] = DEFAULT_INDEXED_FIELDS):
+        """
+        Open (or create) the collection's store under `path`.
+
+        Args:
+            path: Directory holding one store directory per collection
+            collection_name: Name of the collection
+            vector_dtype: "float32" or "int8" (4x smaller, for new collections)
+            fsync: fsync every write instead of relying on the OS page cache
+            ann_threshold: Candidate count above which searches use the IVF index
+            nprobe: IVF lists scored per query
+            payload_indexes: Payload fields to index (names, or a Qdrant-style
+                {field: schema} mapping)
+
+        The remaining arguments are those of MemoryBackend.
+        """
+        super().__init__(
+            collection_name,
+            embedding_model=embedding_model,
+            embedding_cache=embedding_cache,
+            encoder=encoder,
+            embedding_backend=embedding_backend,
+            backend_options=backend_options,
+            write_behind=write_behind,
+            write_batch_size=write_batch_size,
+            write_flush_interval=write_flush_interval,
+            write_queue_size=write_queue_size
+        )
+        self.path = os.path.join(path, collection_name)
+
+        # Take the dimension from an existing store so the model can stay unloaded
+        manifest = EmbeddedVectorStore.read_manifest(self.path)
+        if manifest is not None:
+            self._vector_size = manifest["dimension"]
+
+        self.store = EmbeddedVectorStore(
+            self.path,
+            dimension=self.vector_size,
+            dtype=vector_dtype,
+            indexed_fields=list(payload_indexes or ()),
+            fsync=fsync,
+            ann_threshold=ann_threshold,
+            nprobe=nprobe
+        )
+        self._start_write_behind()
+
+    def reset_connections(self):
+        """Reload the store in a worker forked from the process that opened it."""
+        self.store.reload()
+
+    def ping(self):
+        """The store is in-process; fail only if it has been closed."""
+        if self.store.closed:
+            raise RuntimeError(f"Memory store {self.path} is closed")
+
+    def close(self, timeout=None):
+        """Flush buffered memories, then sync and close the store."""
+        flushed = super().close(timeout)
+        self.store.close()
+        return flushed
+
+    def _filters(self, user_id=None, filters=None):
+        combined = dict(filters or {})
+        if user_id:
+            combined["user_id"] = user_id
+        return combined
+
+    def _upsert(self, records):
+        self.store.upsert([(canonical_id(record_id), vector, payload) for record_id, vector, payload in records])
+
+    def _search(self, vector, limit, user_id, filters):
+        return [
+            {
+                "text": payload.get("text"),
+                "metadata": {k: v for k, v in payload.items() if k != "text"},
+                "score": score
+            }
+            for _, score, payload in self.store.search(vector, limit, self._filters(user_id, filters))
+        ]
+
+    def count_memories(self, user_id=None, filters=None):
+        """Count stored memories, optionally restricted by user or payload fields."""
+        return self.store.count(self._filters(user_id, filters))
+
+    def iter_memories(self, user_id=None, filters=None, with_vectors=False, batch_size=256, payload_fields=None):
+        """Stream stored memories with their IDs (and vectors if requested)."""
+        scan = self.store.scan(self._filters(user_id, filters), with_vectors, batch_size, fields=payload_fields)
+        for record_id, payload, vector in scan:
+            yield {
+                "id": record_id,
+                "text": payload.get("text"),
+                "metadata": {k: v for k, v in payload.items() if k != "text"},
+                "vector": vector.tolist() if vector is not None else None
+            }
+
+    def user_ids(self, created_after=None):
+        """Distinct users with stored memories, read from the store's inverted index."""
+        if created_after is not None or "user_id" not in self.store.indexed_fields:
+            return super().user_ids(created_after)
+        return sorted(user for user in self.store.values("user_id") if isinstance(user, str) and user)
+
+    def delete_memories(self, ids=None, user_id=None, filters=None, created_before=None):
+        """Delete memories by ID, or every memory matching the given filter."""
+        if ids is None:
+            memory_filter = self._filters(user_id, filters)
+            if not memory_filter and created_before is None:
+                raise ValueError("Refusing to delete without ids or a filter")
+            ids = self.store.ids(memory_filter, created_before)
+        else:
+            ids = [canonical_id(record_id) for record_id in ids]
+
+        self.store.delete(ids)
+
+    def compact(self):
+        """Rewrite the store without deleted and replaced records."""
+        self.store.compact()
+
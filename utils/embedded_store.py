@@ -0,0 +1,561 @@
+"""
+Single-process vector store kept in local files.
+
+A store directory holds one generation of data files:
+
+    manifest.json        current generation, dimension and vector dtype
+    vectors-<n>.f32/.i8  fixed-size rows, memory-mapped (int8 rows carry a scale)
+    log-<n>.jsonl        append-only record log: {"op": "add", "id", "row", "payload"}
+                         and {"op": "delete", "ids"}
+
+A row becomes visible once its log line is written, so a crash can at most
+lose the line being written; a torn last line is dropped on open. Replaced and
+deleted rows stay in place until compaction writes the live rows into the
+next generation, fsyncs it and switches `manifest.json` atomically; files of
+any other generation are removed on open, so an interrupted compaction leaves
+the previous generation intact.
+
+Filters on indexed payload fields are answered from an inverted index
+(value -> rows). Vectors are L2-normalized on write, so scores are cosine
+similarities. Scans over more than `ann_threshold` rows use an IVF index
+(k-means centroids over the vectors; only the `nprobe` nearest lists are
+scored), smaller candidate sets are scored exactly.
+
+Only one process may open a store: the directory is locked with flock
+(a worker forked from that process may take over with `reload`).
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DTYPES = {"float32": "f32", "int8": "i8"}
+MANIFEST = "manifest.json"
+
+# Scored in blocks so a full scan never decodes the whole file at once
+SCAN_BLOCK_ROWS = 65536
+
+# A search result: (record ID, score, payload)
+Hit = Tuple[str, float, Dict[str, Any]]
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _index_keys(value):
+    """Hashable keys a payload value is indexed under (lists by element)."""
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if isinstance(v, (str, int, bool)) and not isinstance(v, float)]
+
+
+def _select(payload, fields):
+    if fields is None:
+        return dict(payload)
+    return {field: payload[field] for field in fields if field in payload}
+
+
+def _matches(payload, filters, created_before):
+    for key, expected in filters.items():
+        value = payload.get(key)
+        if value != expected and not (isinstance(value, list) and expected in value):
+            return False
+    if created_before is not None:
+        created_at = payload.get("created_at")
+        if not isinstance(created_at, (int, float)) or created_at >= created_before:
+            return False
+    return True
+
+
+class EmbeddedVectorStore:
+    def __init__(self,
+                 path: str,
+                 dimension: int,
+                 dtype: str = "float32",
+                 indexed_fields: Iterable[str] = ("user_id",),
+                 fsync: bool = False,
+                 ann_threshold: int = 20000,
+                 nprobe: int = 8,
+                 compact_ratio: float = 0.3,
+                 compact_min_rows: int = 1024,
+                 initial_capacity: int = 1024):
+        """
+        Open (or create) a store directory.
+
+        Args:
+            path: Store directory
+            dimension: Vector dimension; must match an existing store
+            dtype: "float32" or "int8" for new stores (existing stores keep theirs)
+            indexed_fields: Payload fields kept in the inverted index
+            fsync: fsync the vector file and log after every write (survives
+                power loss, not just process crashes)
+            ann_threshold: Candidate count above which searches use the IVF index
+            nprobe: IVF lists scored per query
+            compact_ratio: Compact once this fraction of rows is dead
+            compact_min_rows: Never compact stores with fewer rows than this
+            initial_capacity: Rows allocated in a new vector file
+        """
+        self.path = path
+        self.indexed_fields = tuple(indexed_fields)
+        self.fsync = fsync
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        self._lock = threading.RLock()
+
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, "lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(f"Memory store {path} is already open in another process")
+
+        manifest = self.read_manifest(path)
+        if manifest is None:
+            if dtype not in VECTOR_DTYPES:
+                raise ValueError(f"Unsupported vector dtype: {dtype}")
+            manifest = {"generation": 0, "dimension": dimension, "dtype": dtype}
+            self._write_generation(0, dimension, dtype, np.empty((0, dimension), dtype=np.float32), [],
+                                   initial_capacity)
+            self._write_manifest(manifest)
+        elif manifest["dimension"] != dimension:
+            raise ValueError(
+                f"Memory store {path} holds {manifest['dimension']}-dim vectors, the model produces {dimension}"
+            )
+
+        self.generation = manifest["generation"]
+        self.dimension = manifest["dimension"]
+        self.dtype = manifest["dtype"]
+        self._row_dtype = self._make_row_dtype(self.dimension, self.dtype)
+        self._remove_stale_files()
+        self._open_generation()
+
+    # Files
+
+    @staticmethod
+    def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+        """Manifest of the store at `path`, or None if there is no store yet."""
+        try:
+            with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _make_row_dtype(dimension, dtype):
+        if dtype == "int8":
+            return np.dtype([("q", np.int8, (dimension,)), ("scale", np.float32)])
+        return np.dtype((np.float32, (dimension,)))
+
+    def _vector_path(self, generation, dtype=None):
+        return os.path.join(self.path, f"vectors-{generation}.{VECTOR_DTYPES[dtype or self.dtype]}")
+
+    def _log_path(self, generation):
+        return os.path.join(self.path, f"log-{generation}.jsonl")
+
+    def _write_manifest(self, manifest):
+        tmp_path = os.path.join(self.path, MANIFEST + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+        _fsync_dir(self.path)
+
+    def _remove_stale_files(self):
+        """Delete files of other generations (leftovers of an interrupted or finished compaction)."""
+        current = {
+            os.path.basename(self._vector_path(self.generation)),
+            os.path.basename(self._log_path(self.generation))
+        }
+        for name in os.listdir(self.path):
+            if name.startswith(("vectors-", "log-")) and name not in current:
+                os.remove(os.path.join(self.path, name))
+
+    def _write_generation(self, generation, dimension, dtype, vectors, records, capacity):
+        """Write a complete generation (vector file and log) and fsync it."""
+        row_dtype = self._make_row_dtype(dimension, dtype)
+        capacity = max(capacity, len(vectors), 1)
+        with open(self._vector_path(generation, dtype), "wb") as f:
+            f.truncate(capacity * row_dtype.itemsize)
+            f.seek(0)
+            f.write(self._encode_rows(vectors, dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self._log_path(generation), "w", encoding="utf-8") as f:
+            for row, (record_id, payload) in enumerate(records):
+                f.write(json.dumps({"op": "add", "id": record_id, "row": row, "payload": payload}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _open_generation(self):
+        """Map the vector file and rebuild the in-memory state from the log."""
+        self._map(os.path.getsize(self._vector_path(self.generation)) // self._row_dtype.itemsize)
+        self._rows = {}
+        self._ids = []
+        self._payloads = []
+        self._index = {field: {} for field in self.indexed_fields}
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._ann = None
+
+        log_path = self._log_path(self.generation)
+        good_bytes = 0
+        with open(log_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    entry = json.loads(line)
+                except ValueError:
+                    # Only the last line can be torn; anything after it is not trusted
+                    logger.warning("Dropping torn record at byte %d of %s", good_bytes, log_path)
+                    break
+                self._apply(entry)
+                good_bytes += len(line)
+
+        if good_bytes != os.path.getsize(log_path):
+            with open(log_path, "r+b") as f:
+                f.truncate(good_bytes)
+        self._log = open(log_path, "ab")
+
+    def _map(self, capacity):
+        self._capacity = capacity
+        self._vectors = np.memmap(self._vector_path(self.generation), dtype=self._row_dtype, mode="r+",
+                                  shape=(capacity,))
+
+    def _grow(self, needed):
+        """Extend the vector file (doubling) and remap it."""
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._vectors.flush()
+        del self._vectors
+        with open(self._vector_path(self.generation), "r+b") as f:
+            f.truncate(capacity * self._row_dtype.itemsize)
+        self._map(capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    # Encoding
+
+    @staticmethod
+    def _encode_rows(vectors, dtype):
+        vectors = _normalize(vectors)
+        if dtype != "int8":
+            return vectors
+        rows = np.empty(len(vectors), dtype=np.dtype([("q", np.int8, (vectors.shape[1],)), ("scale", np.float32)]))
+        scales = np.maximum(np.abs(vectors).max(axis=1, initial=0.0), 1e-12) / 127.0
+        rows["q"] = np.clip(np.rint(vectors / scales[:, None]), -127, 127)
+        rows["scale"] = scales
+        return rows
+
+    def _decode(self, rows):
+        """float32 vectors for a row array or slice."""
+        data = self._vectors[rows]
+        if self.dtype != "int8":
+            return np.asarray(data, dtype=np.float32)
+        return data["q"].astype(np.float32) * data["scale"][:, None]
+
+    # In-memory state
+
+    def _apply(self, entry):
+        if entry["op"] == "add":
+            self._remove(entry["id"])
+            row = entry["row"]
+            if row >= len(self._ids):
+                self._ids.extend([None] * (row + 1 - len(self._ids)))
+                self._payloads.extend([None] * (row + 1 - len(self._payloads)))
+            self._ids[row] = entry["id"]
+            self._payloads[row] = entry["payload"]
+            self._rows[entry["id"]] = row
+            self._alive[row] = True
+            for field in self.indexed_fields:
+                for key in _index_keys(entry["payload"].get(field)):
+                    self._index[field].setdefault(key, set()).add(row)
+        else:
+            for record_id in entry["ids"]:
+                self._remove(record_id)
+
+    def _remove(self, record_id):
+        row = self._rows.pop(record_id, None)
+        if row is None:
+            return
+        payload = self._payloads[row]
+        for field in self.indexed_fields:
+            for key in _index_keys(payload.get(field)):
+                rows = self._index[field].get(key)
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del self._index[field][key]
+        self._ids[row] = None
+        self._payloads[row] = None
+        self._alive[row] = False
+
+    def _append_log(self, entries):
+        self._log.write("".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    # Writes
+
+    def upsert(self, records: List[Tuple[str, np.ndarray, Dict[str, Any]]]) -> None:
+        """Insert or replace (id, vector, payload) records."""
+        if not records:
+            return
+        with self._lock:
+            start = len(self._ids)
+            if start + len(records) > self._capacity:
+                self._grow(start + len(records))
+
+            # Vectors first: a row only becomes visible through its log entry
+            self._vectors[start:start + len(records)] = self._encode_rows(
+                np.stack([vector for _, vector, _ in records]), self.dtype
+            )
+            if self.fsync:
+                self._vectors.flush()
+
+            entries = [
+                {"op": "add", "id": str(record_id), "row": start + i, "payload": payload}
+                for i, (record_id, _, payload) in enumerate(records)
+            ]
+            self._append_log(entries)
+            for entry in entries:
+                self._apply(entry)
+
+            self._maybe_compact()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Delete records by ID; returns how many existed."""
+        with self._lock:
+            ids = [str(record_id) for record_id in ids if str(record_id) in self._rows]
+            if ids:
+                entry = {"op": "delete", "ids": ids}
+                self._append_log([entry])
+                self._apply(entry)
+                self._maybe_compact()
+            return len(ids)
+
+    def _maybe_compact(self):
+        dead = len(self._ids) - len(self._rows)
+        if len(self._ids) >= self.compact_min_rows and dead > self.compact_ratio * len(self._ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the live rows into a new generation and drop the old one."""
+        with self._lock:
+            rows = np.flatnonzero(self._alive[:len(self._ids)])
+            generation = self.generation + 1
+            self._write_generation(
+                generation, self.dimension, self.dtype,
+                self._decode(rows) if len(rows) else np.empty((0, self.dimension), dtype=np.float32),
+                [(self._ids[row], self._payloads[row]) for row in rows],
+                max(len(rows) * 2, 1024)
+            )
+            # The manifest switch is the commit point of the compaction
+            self._write_manifest({"generation": generation, "dimension": self.dimension, "dtype": self.dtype})
+
+            self._log.close()
+            del self._vectors
+            self.generation = generation
+            self._remove_stale_files()
+            self._open_generation()
+            logger.info("Compacted %s to %d rows (generation %d)", self.path, len(rows), generation)
+
+    def reload(self) -> None:
+        """
+        Re-read the store from disk, keeping the directory lock.
+
+        Used in a worker forked from the process that opened the store: the
+        state inherited from the parent may be older than the files.
+        """
+        with self._lock:
+            self._log.close()
+            del self._vectors
+            self.generation = self.read_manifest(self.path)["generation"]
+            self._remove_stale_files()
+            self._open_generation()
+
+    def flush(self) -> None:
+        """fsync pending vector and log writes."""
+        with self._lock:
+            self._vectors.flush()
+            os.fsync(self._log.fileno())
+
+    @property
+    def closed(self) -> bool:
+        return self._log.closed
+
+    def close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.flush()
+            self._log.close()
+            self._lock_file.close()
+
+    # Reads
+
+    def __len__(self):
+        return len(self._rows)
+
+    def candidates(self, filters: Optional[Dict[str, Any]] = None, created_before: Optional[float] = None):
+        """Rows matching the filters, or None when every live row matches."""
+        filters = dict(filters or {})
+        with self._lock:
+            indexed = [(field, filters.pop(field)) for field in list(filters) if field in self._index]
+            if not indexed and not filters and created_before is None:
+                return None
+
+            if indexed:
+                # Intersect the posting sets, smallest first
+                postings = sorted((self._index[field].get(value, set()) for field, value in indexed), key=len)
+                rows = set(postings[0])
+                for posting in postings[1:]:
+                    rows &= posting
+            else:
+                rows = np.flatnonzero(self._alive[:len(self._ids)]).tolist()
+
+            if filters or created_before is not None:
+                rows = [row for row in rows if _matches(self._payloads[row], filters, created_before)]
+            return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def count(self, filters=None, created_before=None) -> int:
+        with self._lock:
+            rows = self.candidates(filters, created_before)
+            return len(self._rows) if rows is None else len(rows)
+
+    def ids(self, filters=None, created_before=None) -> List[str]:
+        with self._lock:
+            rows = self.candidates(filters, created_before)
+            if rows is None:
+                return list(self._rows)
+            return [self._ids[row] for row in rows]
+
+    def scan(self, filters=None, with_vectors=False, batch_size=256,
+             fields: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Dict[str, Any], Optional[np.ndarray]]]:
+        """
+        Yield (id, payload, vector) for matching records, reading a batch at a time.
+
+        With `fields`, only those payload fields are copied.
+
+        The matching IDs are taken up front and resolved to rows per batch,
+        since a compaction between batches renumbers the rows. Records deleted
+        meanwhile are skipped; replaced ones are yielded as they are now.
+        """
+        with self._lock:
+            rows = self.candidates(filters)
+            if rows is None:
+                ids = list(self._rows)
+            else:
+                ids = [self._ids[row] for row in rows]
+
+        for start in range(0, len(ids), batch_size):
+            with self._lock:
+                batch = [self._rows[record_id] for record_id in ids[start:start + batch_size] if record_id in self._rows]
+                if filters:
+                    batch = [row for row in batch if _matches(self._payloads[row], filters, None)]
+                vectors = self._decode(np.asarray(batch, dtype=np.int64)) if with_vectors and batch else None
+                items = [(self._ids[row], _select(self._payloads[row], fields)) for row in batch]
+            for i, (record_id, payload) in enumerate(items):
+                yield record_id, payload, vectors[i] if vectors is not None else None
+
+    def values(self, field: str) -> List[Any]:
+        """Distinct values of an indexed payload field (list values by element)."""
+        with self._lock:
+            return list(self._index[field])
+
+    def search(self, vector, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Nearest records by cosine similarity, best first."""
+        query = _normalize(vector)
+        with self._lock:
+            rows = self.candidates(filters)
+            total = len(self._rows) if rows is None else len(rows)
+            if total == 0 or limit <= 0:
+                return []
+
+            if total > self.ann_threshold:
+                probed = self._probe(query, rows)
+                if len(probed) >= limit:
+                    rows = probed
+
+            if rows is None:
+                scores, rows = self._scan_all(query)
+            else:
+                scores = self._decode(rows) @ query
+
+            top = np.argsort(-scores)[:limit] if len(scores) > limit else np.argsort(-scores)
+            return [(self._ids[rows[i]], float(scores[i]), dict(self._payloads[rows[i]])) for i in top]
+
+    def _scan_all(self, query):
+        """Exact scores of every live row, scored block by block."""
+        end = len(self._ids)
+        scores = []
+        for start in range(0, end, SCAN_BLOCK_ROWS):
+            scores.append(self._decode(slice(start, min(end, start + SCAN_BLOCK_ROWS))) @ query)
+        scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+        rows = np.flatnonzero(self._alive[:end])
+        return scores[rows], rows
+
+    # IVF index
+
+    def _probe(self, query, rows):
+        """Candidate rows in the `nprobe` IVF lists nearest to the query, plus rows added since the build."""
+        self._ensure_ann()
+        centroids, order, offsets, built_rows = self._ann
+        lists = np.argsort(-(centroids @ query))[:self.nprobe]
+        probed = np.concatenate(
+            [order[offsets[i]:offsets[i + 1]] for i in lists] + [np.arange(built_rows, len(self._ids))]
+        )
+        probed = probed[self._alive[probed]]
+        if rows is not None:
+            probed = np.intersect1d(probed, rows, assume_unique=True)
+        return np.sort(probed)
+
+    def _ensure_ann(self):
+        """Build the IVF index, or rebuild it once as many rows were added as it covers."""
+        if self._ann is not None and len(self._ids) - self._ann[3] <= self._ann[3]:
+            return
+
+        rows = np.flatnonzero(self._alive[:len(self._ids)])
+        nlist = max(1, int(np.sqrt(len(rows))))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(rows, size=min(len(rows), nlist * 64), replace=False))
+        data = self._decode(sample)
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+        for _ in range(10):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        # Rows grouped by nearest centroid: list i is order[offsets[i]:offsets[i + 1]]
+        assignments = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+            block = rows[start:start + SCAN_BLOCK_ROWS]
+            assignments[start:start + len(block)] = np.argmax(self._decode(block) @ centroids.T, axis=1)
+        order = rows[np.argsort(assignments, kind="stable")]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+
+        self._ann = (centroids, order, offsets, len(self._ids))
+        logger.info("Built IVF index over %d rows with %d lists", len(rows), nlist)
@@ -0,0 +1,209 @@
+"""
+Pluggable embedding backends.
+
+Every backend exposes the SentenceTransformer interface
+(`encode`, `get_sentence_embedding_dimension`), so QdrantMemory, the
+micro-batcher and the embedding sidecar accept any of them. Select one by
+name with `load_backend` (or EMBEDDING_BACKEND):
+
+- "sentence-transformers": PyTorch fp32, the reference implementation
+- "onnx": ONNX Runtime fp32 export of the same model
+- "onnx-int8": ONNX Runtime export with int8 dynamically quantized weights
+
+Before switching a deployment to a faster backend, compare it with the
+fp32 baseline:
+
+    python -m utils.embedding_backends --backend onnx-int8 --min-recall 0.95
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+DEFAULT_BACKEND = "sentence-transformers"
+
+
+class EmbeddingBackend(ABC):
+    """Encodes texts into float32 sentence embeddings."""
+
+    name = None
+
+    @abstractmethod
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Embed one text (returns a vector) or a list of texts (returns a matrix)."""
+
+    @abstractmethod
+    def get_sentence_embedding_dimension(self) -> int:
+        """Size of the embedding vectors."""
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str, device: str = "cpu"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        return np.asarray(self.model.encode(sentences, batch_size=batch_size, **kwargs), dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+
+class OnnxBackend(EmbeddingBackend):
+    name = "onnx"
+    quantized = False
+
+    def __init__(self, model_name: str, cache_dir: Optional[str] = None, intra_op_threads: Optional[int] = None):
+        """
+        Run the model with ONNX Runtime, exporting it to `cache_dir` on first use.
+
+        Args:
+            model_name: SentenceTransformer model name or path
+            cache_dir: ONNX export cache (defaults to ~/.cache/agentic-onnx)
+            intra_op_threads: ONNX Runtime threads per call (None for its default)
+        """
+        from utils.onnx_encoder import OnnxEncoder, export_onnx
+
+        path = export_onnx(model_name, cache_dir, quantize=self.quantized)
+        self.encoder = OnnxEncoder(path, quantized=self.quantized, intra_op_threads=intra_op_threads)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        return self.encoder.encode(sentences, batch_size=batch_size)
+
+    def get_sentence_embedding_dimension(self):
+        return self.encoder.get_sentence_embedding_dimension()
+
+
+class QuantizedOnnxBackend(OnnxBackend):
+    name = "onnx-int8"
+    quantized = True
+
+
+EMBEDDING_BACKENDS = {
+    backend.name: backend
+    for backend in (SentenceTransformerBackend, OnnxBackend, QuantizedOnnxBackend)
+}
+
+
+def load_backend(name: str, model_name: str, **options) -> EmbeddingBackend:
+    """Instantiate the backend registered under `name`."""
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name} (choose from {', '.join(EMBEDDING_BACKENDS)})")
+    return EMBEDDING_BACKENDS[name](model_name, **options)
+
+
+def cache_namespace(model_name: str, backend: str = DEFAULT_BACKEND) -> str:
+    """Embedding cache namespace; quantized vectors must not mix with fp32 ones."""
+    return model_name if backend == DEFAULT_BACKEND else f"{model_name}@{backend}"
+
+
+def check_recall(candidate,
+                 baseline,
+                 corpus: List[str],
+                 queries: Optional[List[str]] = None,
+                 k: int = 5) -> Dict[str, Any]:
+    """
+    Compare a backend against the fp32 baseline on a sample set.
+
+    Both encoders embed `corpus` and `queries` (the corpus itself when not
+    given, excluding each query's own entry). Recall@k is the share of the
+    baseline's top-k neighbours that the candidate also returns.
+
+    Returns:
+        recall_at_k, mean and minimum cosine between paired vectors, and
+        encoding throughput for both encoders
+    """
+    self_queries = queries is None
+    queries = corpus if self_queries else queries
+    k = min(k, len(corpus) - (1 if self_queries else 0))
+
+    timings = {}
+    vectors = {}
+    for label, encoder in (("baseline", baseline), ("candidate", candidate)):
+        encoder.encode(corpus[:1])
+        start = time.perf_counter()
+        corpus_vectors = _normalize(encoder.encode(corpus))
+        timings[label] = len(corpus) / (time.perf_counter() - start)
+        query_vectors = corpus_vectors if self_queries else _normalize(encoder.encode(queries))
+        vectors[label] = (corpus_vectors, query_vectors)
+
+    hits = 0
+    for label in ("baseline", "candidate"):
+        corpus_vectors, query_vectors = vectors[label]
+        scores = query_vectors @ corpus_vectors.T
+        if self_queries:
+            np.fill_diagonal(scores, -np.inf)
+        vectors[label] += (np.argsort(-scores, axis=1)[:, :k],)
+    for expected, found in zip(vectors["baseline"][2], vectors["candidate"][2]):
+        hits += len(set(expected) & set(found))
+
+    paired = (vectors["baseline"][0] * vectors["candidate"][0]).sum(axis=1)
+    return {
+        "k": k,
+        "recall_at_k": hits / (len(queries) * k) if k else 1.0,
+        "mean_cosine": float(paired.mean()),
+        "min_cosine": float(paired.min()),
+        "baseline_texts_per_second": timings["baseline"],
+        "candidate_texts_per_second": timings["candidate"],
+        "speedup": timings["candidate"] / timings["baseline"]
+    }
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _sample_texts(path):
+    """Texts from a plain-text (one per line) or JSONL file with a "text" field."""
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            texts.append(json.loads(line)["text"] if line.startswith("{") else line)
+    return texts
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare an embedding backend with the fp32 baseline")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "onnx-int8"))
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    parser.add_argument("--cache-dir", default=os.getenv("EMBEDDING_ONNX_CACHE") or None)
+    parser.add_argument("--sample", help="Text or JSONL file of sample texts (defaults to the router prototypes)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--min-recall", type=float, default=None, help="Exit with status 1 below this recall")
+    args = parser.parse_args(argv)
+
+    if args.sample:
+        corpus = _sample_texts(args.sample)
+    else:
+        from langgraph_setup.intent_router import DEFAULT_PROTOTYPES
+        corpus = [text for texts in DEFAULT_PROTOTYPES.values() for text in texts]
+
+    options = {"cache_dir": args.cache_dir} if args.backend != DEFAULT_BACKEND else {}
+    report = check_recall(
+        load_backend(args.backend, args.model, **options),
+        load_backend(DEFAULT_BACKEND, args.model),
+        corpus,
+        k=args.k
+    )
+    report["backend"] = args.backend
+    print(json.dumps(report, indent=2))
+
+    if args.min_recall is not None and report["recall_at_k"] < args.min_recall:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self,
+                 model_name: str,
+                 max_size: int = 10000,
+                 ttl: Optional[float] = None,
+                 disk_path: Optional[str] = None,
+                 casefold: bool = False,
+                 max_disk_entries: Optional[int] = 100000,
+                 disk_prune_interval: float = 300):
+        """
+        Bounded embedding cache with LRU and TTL eviction.
+
+        Entries are keyed by normalized text plus the model name, so switching
+        models never serves stale vectors. An optional SQLite file acts as a
+        second tier that survives restarts and is shared by several worker
+        processes; each thread of each process opens its own connection to it,
+        and it is read and written outside the lock that guards the LRU.
+
+        Args:
+            model_name: Name of the embedding model the vectors belong to
+            max_size: Maximum number of entries kept in memory
+            ttl: Seconds an entry stays valid (None disables expiry)
+            disk_path: Optional SQLite file for the on-disk tier
+            casefold: Also fold case when normalizing (only for uncased models)
+            max_disk_entries: Maximum number of rows in the disk tier; the
+                oldest are deleted beyond it (None for no limit)
+            disk_prune_interval: Minimum seconds between disk tier prune passes,
+                run on write
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.casefold = casefold
+        self.max_disk_entries = max_disk_entries
+        self.disk_prune_interval = disk_prune_interval
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk_path = disk_path
+        self._local = threading.local()
+        self._last_disk_prune = time.time()
+        if disk_path:
+            disk = self._disk()
+            disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            disk.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created_at)")
+            disk.commit()
+            self.prune_disk()
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        """
+        Connection to the disk tier for this thread and process (None without one).
+
+        A connection opened before a fork is never reused by the child.
+        """
+        if not self.disk_path:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.disk_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def prune_disk(self) -> int:
+        """Delete expired disk entries, then the oldest beyond `max_disk_entries`; returns rows deleted."""
+        disk = self._disk()
+        self._last_disk_prune = time.time()
+        if disk is None:
+            return 0
+
+        deleted = 0
+        with disk:
+            if self.ttl is not None:
+                deleted += disk.execute(
+                    "DELETE FROM embeddings WHERE created_at < ?", (self._last_disk_prune - self.ttl,)
+                ).rowcount
+            if self.max_disk_entries is not None:
+                deleted += disk.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                ).rowcount
+        return deleted
+
+    def _normalize(self, text: str) -> str:
+        """Collapse whitespace (and optionally case) so trivial variants share an entry."""
+        normalized = " ".join(text.split())
+        return normalized.casefold() if self.casefold else normalized
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.model_name}\0{self._normalize(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _store(self, key: str, vector: np.ndarray, created_at: float):
+        """Insert into the in-memory tier, evicting least recently used entries."""
+        self._entries[key] = (vector, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for the text, or None on a miss."""
+        key = self._key(text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, created_at = entry
+                if not self._expired(created_at, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+                self.evictions += 1
+
+        # The disk tier is read outside the lock so a slow or busy SQLite file
+        # never stalls in-memory hits on other threads
+        disk = self._disk()
+        row = None
+        if disk is not None:
+            row = disk.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+
+        with self._lock:
+            if row is not None and not self._expired(row[1], now):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # Written by another thread meanwhile; it is at least as fresh
+                    self._entries.move_to_end(key)
+                    vector = entry[0]
+                else:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._store(key, vector, row[1])
+                self.disk_hits += 1
+                return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, embedding) -> None:
+        """Cache an embedding for the text."""
+        self.put_many([text], [embedding])
+
+    def put_many(self, texts: List[str], embeddings) -> None:
+        """Cache several embeddings at once (one disk transaction)."""
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            vector = np.array(embedding, dtype=np.float32)
+            vector.setflags(write=False)
+            rows.append((self._key(text), vector))
+
+        with self._lock:
+            for key, vector in rows:
+                self._store(key, vector, now)
+            prune = self.disk_path is not None and now - self._last_disk_prune >= self.disk_prune_interval
+            if prune:
+                # Claimed under the lock so concurrent writers prune once
+                self._last_disk_prune = now
+
+        disk = self._disk()
+        if disk is not None and rows:
+            with disk:
+                disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                    [(key, vector.tobytes(), now) for key, vector in rows]
+                )
+            if prune:
+                self.prune_disk()
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+        disk = self._disk()
+        if disk is not None:
+            with disk:
+                disk.execute("DELETE FROM embeddings")
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current in-memory size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries)
+            }
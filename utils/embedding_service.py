@@ -0,0 +1,336 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from utils.embedding_backends import DEFAULT_BACKEND, EMBEDDING_BACKENDS, load_backend
+
+# Wire format (both directions): 4-byte big-endian length followed by the body.
+# Requests are JSON objects; responses start with a one-byte status.
+_LENGTH = struct.Struct(">I")
+_STATUS_OK = b"\x00"
+_STATUS_ERROR = b"\x01"
+
+
+class LazyEncoder:
+    def __init__(self, factory: Callable[[], object]):
+        """
+        Encoder built on first use.
+
+        Defers importing torch and loading model weights until something
+        is actually embedded, so processes start quickly and workers forked
+        from a warmed-up master reuse the loaded model.
+
+        Args:
+            factory: Callable returning a SentenceTransformer-compatible encoder
+        """
+        self.factory = factory
+        self.load_seconds = None
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._encoder is not None
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            with self._lock:
+                if self._encoder is None:
+                    start = time.perf_counter()
+                    self._encoder = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+        return self._encoder
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.encoder.get_sentence_embedding_dimension()
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        return self.encoder.encode(texts, **kwargs)
+
+
+class MicroBatchEncoder:
+    def __init__(self, encoder, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Queue concurrent encode calls and flush them as one batch.
+
+        A batch is flushed when it reaches `max_batch_size` texts or when the
+        oldest queued request has waited `max_wait_ms`, whichever comes first.
+        Exposes the same `encode`/`get_sentence_embedding_dimension` interface
+        as SentenceTransformer so it can be handed to QdrantMemory directly.
+
+        Args:
+            encoder: Object with a SentenceTransformer-style `encode` method
+            max_batch_size: Maximum number of texts per flushed batch
+            max_wait_ms: Maximum time a request waits for more work to batch with
+        """
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.encoder.get_sentence_embedding_dimension()
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        """Encode texts, batching them with any concurrent callers."""
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((batch, future))
+        vectors = future.result()
+        return vectors[0] if single else vectors
+
+    def pending(self) -> int:
+        """Number of encode calls waiting to be batched."""
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        """Start the flush thread lazily, and again after a fork."""
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            self._flush(pending)
+
+    def _flush(self, pending):
+        texts = [text for batch, _ in pending for text in batch]
+        try:
+            vectors = np.asarray(self.encoder.encode(texts), dtype=np.float32)
+        except Exception as exc:
+            for _, future in pending:
+                future.set_exception(exc)
+            return
+
+        offset = 0
+        for batch, future in pending:
+            future.set_result(vectors[offset:offset + len(batch)])
+            offset += len(batch)
+
+
+def _send_frame(sock, body: bytes):
+    sock.sendall(_LENGTH.pack(len(body)) + body)
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(sock) -> bytes:
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, socket_path: str, encoder):
+        """
+        Serve embeddings to local processes over a Unix socket.
+
+        Every connection is handled on its own thread and all of them feed
+        one MicroBatchEncoder, so requests from different workers are
+        batched together against a single model instance.
+        """
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.encoder = encoder
+        super().__init__(socket_path, _EmbeddingRequestHandler)
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = json.loads(_recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                if request.get("op") == "dim":
+                    dim = self.server.encoder.get_sentence_embedding_dimension()
+                    body = _STATUS_OK + json.dumps({"dim": dim}).encode("utf-8")
+                else:
+                    vectors = self.server.encoder.encode(request["texts"])
+                    body = _STATUS_OK + np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+            except Exception as exc:
+                body = _STATUS_ERROR + str(exc).encode("utf-8")
+
+            _send_frame(self.request, body)
+
+
+class RemoteEmbeddingClient:
+    def __init__(self, socket_path: str, timeout: float = 30.0, connect_timeout: float = 60.0):
+        """
+        SentenceTransformer-compatible client for an EmbeddingServer sidecar.
+
+        Args:
+            socket_path: Path of the sidecar's Unix socket
+            timeout: Seconds to wait for a single encode response
+            connect_timeout: Seconds to keep retrying while the sidecar starts
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+        self._dim = None
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError, BlockingIOError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _request(self, payload: dict) -> bytes:
+        # One connection per thread; reconnect once if the sidecar restarted
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            if sock is None or getattr(self._local, "pid", None) != os.getpid():
+                sock = self._local.sock = self._connect()
+                self._local.pid = os.getpid()
+            try:
+                _send_frame(sock, json.dumps(payload).encode("utf-8"))
+                response = _recv_frame(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+
+        if response[:1] != _STATUS_OK:
+            raise RuntimeError(f"Embedding service error: {response[1:].decode('utf-8')}")
+        return response[1:]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dim is None:
+            self._dim = json.loads(self._request({"op": "dim"}))["dim"]
+        return self._dim
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        dim = self.get_sentence_embedding_dimension()
+        if not batch:
+            return np.empty((0, dim), dtype=np.float32)
+
+        body = self._request({"op": "encode", "texts": batch})
+        vectors = np.frombuffer(body, dtype=np.float32).reshape(len(batch), dim)
+        return vectors[0] if single else vectors
+
+
+def create_encoder(model_name: str,
+                   socket_path: Optional[str] = None,
+                   batching: bool = False,
+                   max_batch_size: int = 32,
+                   max_wait_ms: float = 5.0,
+                   backend: str = DEFAULT_BACKEND,
+                   cache_dir: Optional[str] = None):
+    """
+    Build the encoder QdrantMemory should use.
+
+    Returns a sidecar client when `socket_path` is set. Otherwise returns the
+    named embedding backend (see utils.embedding_backends), loaded lazily and
+    optionally wrapped in a MicroBatchEncoder. ONNX backends export the model
+    into `cache_dir` on first use.
+    """
+    if socket_path:
+        return RemoteEmbeddingClient(socket_path)
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    options = {} if backend == DEFAULT_BACKEND else {"cache_dir": cache_dir}
+
+    encoder = LazyEncoder(lambda: load_backend(backend, model_name, **options))
+    if batching:
+        encoder = MicroBatchEncoder(encoder, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    return encoder
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Shared embedding sidecar")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SERVICE_SOCKET", "/tmp/embedding.sock"))
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    parser.add_argument("--max-batch-size", type=int, default=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32")))
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")))
+    args = parser.parse_args(argv)
+
+    encoder = create_encoder(
+        args.model,
+        batching=True,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        backend=os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND),
+        cache_dir=os.getenv("EMBEDDING_ONNX_CACHE") or None
+    )
+    # Load the model before accepting connections
+    encoder.get_sentence_embedding_dimension()
+    server = EmbeddingServer(args.socket, encoder)
+    print(f"Embedding service for {args.model} listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
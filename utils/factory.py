@@ -0,0 +1,376 @@
+"""
+Build the serving components from environment variables.
+
+app.py (Flask), asgi.py (FastAPI) and chainlit_app.py share one
+configuration, documented in the README. `Components` wires up
+everything a serving process needs. Scripts that only need part of it,
+such as `python -m utils.memory_compaction`, call the individual builders
+instead, so they don't load agents or LLM clients they never use.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from agents.help_agent import HelpAgent
+from agents.manage_agent import ManageAgent
+from agents.marketing_agent import MarketingAgent
+from agents.sales_agent import SalesAgent
+from utils import metrics
+from utils.context_builder import ContextBuilder
+from utils.embedded_memory import EmbeddedMemory
+from utils.embedding_backends import cache_namespace
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_service import create_encoder
+from utils.history_store import InMemoryHistoryStore, SQLiteHistoryStore
+from utils.knowledge_index import DEFAULT_KNOWLEDGE_DIR, KnowledgeIndex
+from utils.lifecycle import ServiceLifecycle
+from utils.llm_manager import GroqLLMManager
+from utils.memory import QdrantMemory
+from utils.memory_backend import MemoryBackend
+from utils.memory_compaction import DAY, MemoryCompactor
+from utils.model_tiers import ModelTierPolicy, parse_mapping
+from utils.response_cache import RESPONSE_CACHE_INDEXES, SemanticResponseCache
+from utils.retrieval_cache import RetrievalCache
+from utils.startup import StartupTimer
+
+AGENT_CLASSES = {
+    "sales": SalesAgent,
+    "help": HelpAgent,
+    "manage": ManageAgent,
+    "marketing": MarketingAgent
+}
+
+
+def _flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+
+def _optional(name: str, convert=float):
+    value = os.getenv(name)
+    return convert(value) if value else None
+
+
+def _embedding_model() -> str:
+    return os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+
+def _model_key() -> str:
+    return cache_namespace(_embedding_model(), os.getenv("EMBEDDING_BACKEND", "sentence-transformers"))
+
+
+def build_embedding_cache() -> Optional[EmbeddingCache]:
+    """Embedding cache (set EMBEDDING_CACHE_SIZE=0 to disable)."""
+    if int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")) <= 0:
+        return None
+    return EmbeddingCache(
+        model_name=_model_key(),
+        max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+        ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "0")) or None,
+        disk_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+        max_disk_entries=int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000")) or None
+    )
+
+
+def build_encoder():
+    """Embedding encoder: shared sidecar, in-process micro-batching or plain model."""
+    return create_encoder(
+        _embedding_model(),
+        socket_path=os.getenv("EMBEDDING_SERVICE_SOCKET") or None,
+        batching=_flag("EMBEDDING_BATCHING"),
+        max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32")),
+        max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")),
+        backend=os.getenv("EMBEDDING_BACKEND", "sentence-transformers"),
+        cache_dir=os.getenv("EMBEDDING_ONNX_CACHE") or None
+    )
+
+
+def build_memory(embedding_cache=None, encoder=None) -> MemoryBackend:
+    """
+    The agents' vector memory: a Qdrant server, or files embedded in this
+    process (MEMORY_BACKEND=embedded, single worker only).
+
+    Args:
+        embedding_cache: Shared embedding cache (None to build none)
+        encoder: Shared encoder (None to build one)
+    """
+    encoder = encoder if encoder is not None else build_encoder()
+    options = {
+        "collection_name": "agent_memory",
+        "embedding_model": _embedding_model(),
+        "embedding_cache": embedding_cache,
+        "encoder": encoder,
+        "write_behind": _flag("MEMORY_WRITE_BEHIND"),
+        "write_batch_size": int(os.getenv("MEMORY_WRITE_BATCH_SIZE", "64")),
+        "write_flush_interval": float(os.getenv("MEMORY_WRITE_FLUSH_INTERVAL", "0.5")),
+        "write_queue_size": int(os.getenv("MEMORY_WRITE_QUEUE_SIZE", "10000"))
+    }
+    if os.getenv("MEMORY_BACKEND", "qdrant") == "embedded":
+        return EmbeddedMemory(
+            path=os.getenv("MEMORY_PATH", "memory_store"),
+            vector_dtype=os.getenv("MEMORY_VECTOR_DTYPE", "float32"),
+            fsync=_flag("MEMORY_FSYNC"),
+            ann_threshold=int(os.getenv("MEMORY_ANN_THRESHOLD", "20000")),
+            nprobe=int(os.getenv("MEMORY_ANN_NPROBE", "8")),
+            **options
+        )
+    return QdrantMemory(
+        url=os.getenv("QDRANT_URL", "http://localhost:6333"),
+        hnsw_m=_optional("QDRANT_HNSW_M", int),
+        hnsw_ef_construct=_optional("QDRANT_HNSW_EF_CONSTRUCT", int),
+        search_ef=_optional("QDRANT_SEARCH_EF", int),
+        quantization=os.getenv("QDRANT_QUANTIZATION") or None,
+        on_disk=_flag("QDRANT_ON_DISK") if os.getenv("QDRANT_ON_DISK") else None,
+        retrieval_cache=RetrievalCache(
+            max_users=int(os.getenv("RETRIEVAL_CACHE_SIZE", "1000")),
+            candidate_limit=int(os.getenv("RETRIEVAL_CACHE_CANDIDATES", "32")),
+            ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "60")) or None
+        ) if _flag("RETRIEVAL_CACHE") else None,
+        **options
+    )
+
+
+def build_response_cache(embedding_cache=None, encoder=None) -> Optional[SemanticResponseCache]:
+    """Semantic LLM response cache in its own memory collection (off by default)."""
+    if not _flag("RESPONSE_CACHE"):
+        return None
+    options = {
+        "collection_name": os.getenv("RESPONSE_CACHE_COLLECTION", "llm_response_cache"),
+        "embedding_model": _embedding_model(),
+        "embedding_cache": embedding_cache,
+        "encoder": encoder,
+        "write_behind": True,
+        "payload_indexes": RESPONSE_CACHE_INDEXES
+    }
+    if os.getenv("MEMORY_BACKEND", "qdrant") == "embedded":
+        cache_memory = EmbeddedMemory(path=os.getenv("MEMORY_PATH", "memory_store"), **options)
+    else:
+        cache_memory = QdrantMemory(url=os.getenv("QDRANT_URL", "http://localhost:6333"), **options)
+    return SemanticResponseCache(
+        memory=cache_memory,
+        similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")) or None,
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+    )
+
+
+def build_llm_manager(response_cache=None) -> GroqLLMManager:
+    return GroqLLMManager(
+        api_key=os.getenv("GROQ_API_KEY"),
+        model=os.getenv("GROQ_MODEL", "llama3-70b-8192"),
+        response_cache=response_cache,
+        timeout=float(os.getenv("GROQ_TIMEOUT", "30")),
+        max_retries=int(os.getenv("GROQ_MAX_RETRIES", "3")),
+        max_connections=int(os.getenv("GROQ_MAX_CONNECTIONS", "100")),
+        requests_per_minute=_optional("GROQ_REQUESTS_PER_MINUTE"),
+        tokens_per_minute=_optional("GROQ_TOKENS_PER_MINUTE"),
+        fallback_model=os.getenv("GROQ_FALLBACK_MODEL") or None,
+        hedge_after=_optional("GROQ_HEDGE_AFTER"),
+        max_hedges=int(os.getenv("GROQ_MAX_HEDGES", "4"))
+    )
+
+
+def build_history_store():
+    """Conversation history: per-process ring buffers, or a SQLite file shared by all workers."""
+    options = {
+        "capacity": int(os.getenv("HISTORY_CAPACITY", "10")),
+        "idle_ttl": float(os.getenv("HISTORY_IDLE_TTL", "3600"))
+    }
+    if os.getenv("HISTORY_BACKEND", "memory") == "sqlite":
+        return SQLiteHistoryStore(path=os.getenv("HISTORY_PATH", "history.db"), **options)
+    return InMemoryHistoryStore(**options)
+
+
+def build_context_builder() -> Optional[ContextBuilder]:
+    """Token-budgeted prompt assembly (off unless PROMPT_TOKEN_BUDGET is set)."""
+    budget = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+    if budget <= 0:
+        return None
+    return ContextBuilder(
+        max_prompt_tokens=budget,
+        max_memory_tokens=int(os.getenv("PROMPT_MEMORY_TOKENS", "800")),
+        max_memory_item_tokens=int(os.getenv("PROMPT_MEMORY_ITEM_TOKENS", "200"))
+    )
+
+
+def build_knowledge_index(memory: MemoryBackend) -> Optional[KnowledgeIndex]:
+    """
+    Hybrid BM25 + dense index over knowledge/ (FAQs, catalog), queried per
+    turn; with KNOWLEDGE_INDEX=false agents keep their inline reference text
+    in the system prompt instead.
+    """
+    if not _flag("KNOWLEDGE_INDEX"):
+        return None
+    return KnowledgeIndex(
+        embed=memory.embed_batch,
+        source_dir=os.getenv("KNOWLEDGE_DIR") or DEFAULT_KNOWLEDGE_DIR,
+        index_path=os.getenv("KNOWLEDGE_INDEX_PATH", "knowledge_index.npz") or None,
+        model_key=_model_key(),
+        top_k=int(os.getenv("KNOWLEDGE_TOP_K", "3")),
+        min_similarity=float(os.getenv("KNOWLEDGE_MIN_SIMILARITY", "0.3")),
+        refresh_interval=float(os.getenv("KNOWLEDGE_REFRESH_INTERVAL", "30")) or None
+    )
+
+
+def build_model_policy() -> Optional[ModelTierPolicy]:
+    """Model tiering: which model serves the router, each graph node and each agent class."""
+    if not os.getenv("MODEL_ROUTES"):
+        return None
+    return ModelTierPolicy(
+        tiers={
+            "small": "llama3-8b-8192",
+            "large": os.getenv("GROQ_MODEL", "llama3-70b-8192"),
+            **parse_mapping(os.getenv("MODEL_TIERS"))
+        },
+        routes=parse_mapping(os.getenv("MODEL_ROUTES")),
+        simple_max_words=int(os.getenv("MODEL_SIMPLE_MAX_WORDS", "12"))
+    )
+
+
+def build_memory_compactor(memory: MemoryBackend, llm_manager: Optional[GroqLLMManager] = None) -> MemoryCompactor:
+    """
+    Memory compaction and retention: merges near-duplicates, rolls old
+    conversations into summaries (with an `llm_manager`) and enforces
+    age/count limits.
+    """
+    return MemoryCompactor(
+        memory=memory,
+        llm_manager=llm_manager,
+        dedup_threshold=float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.95")) or None,
+        # Under the query policy stored vectors only encode the user's question
+        dedup_embed_text=os.getenv("MEMORY_VECTOR_POLICY", "transcript") == "query",
+        summarize_after=float(os.getenv("MEMORY_SUMMARIZE_AFTER_DAYS", "30")) * DAY or None,
+        summary_batch_size=int(os.getenv("MEMORY_SUMMARY_BATCH_SIZE", "20")),
+        summary_model=os.getenv("MEMORY_SUMMARY_MODEL") or None,
+        max_age=float(os.getenv("MEMORY_MAX_AGE_DAYS", "0")) * DAY or None,
+        max_per_user=int(os.getenv("MEMORY_MAX_PER_USER", "0")) or None,
+        max_users_per_run=int(os.getenv("MEMORY_COMPACTION_USERS_PER_RUN", "500")),
+        full_scan_interval=float(os.getenv("MEMORY_COMPACTION_FULL_SCAN_DAYS", "1")) * DAY or None,
+        checkpoint_path=os.getenv("MEMORY_COMPACTION_CHECKPOINT", "memory_compaction.json")
+    )
+
+
+class Components:
+    def __init__(self, startup: Optional[StartupTimer] = None):
+        """
+        Every component of a serving process, built from the environment.
+
+        Args:
+            startup: Timer whose phases ("memory", "llm", "agents") are marked
+                as the components are built
+        """
+        startup = startup or StartupTimer()
+        self.embedding_cache = build_embedding_cache()
+        self.encoder = build_encoder()
+        self.agent_memory = build_memory(self.embedding_cache, self.encoder)
+        startup.mark("memory")
+
+        self.response_cache = build_response_cache(self.embedding_cache, self.encoder)
+        self.llm_manager = build_llm_manager(self.response_cache)
+        startup.mark("llm")
+
+        self.history_store = build_history_store()
+        self.context_builder = build_context_builder()
+        self.knowledge_index = build_knowledge_index(self.agent_memory)
+        self.model_policy = build_model_policy()
+
+        # Options shared by every agent instance
+        self.agent_options = {
+            "memory_vector_policy": os.getenv("MEMORY_VECTOR_POLICY", "transcript"),
+            "concurrent_retrieval": _flag("CONCURRENT_RETRIEVAL"),
+            "history_store": self.history_store,
+            "history_limit": int(os.getenv("HISTORY_CAPACITY", "10")),
+            "context_builder": self.context_builder,
+            "model_policy": self.model_policy,
+            "knowledge": self.knowledge_index,
+            "knowledge_dir": os.getenv("KNOWLEDGE_DIR") or DEFAULT_KNOWLEDGE_DIR
+        }
+        self.agents = {
+            name: agent_class(llm_manager=self.llm_manager, memory=self.agent_memory, **self.agent_options)
+            for name, agent_class in AGENT_CLASSES.items()
+        }
+        startup.mark("agents")
+
+        # Warm-up, readiness and graceful shutdown
+        self.lifecycle = ServiceLifecycle(
+            memories=[self.agent_memory, self.response_cache.memory if self.response_cache else None],
+            llm_manager=self.llm_manager,
+            knowledge=self.knowledge_index
+        )
+        # Runs on a timer in serving processes (MEMORY_COMPACTION_INTERVAL
+        # seconds, 0 disables) or once with `python -m utils.memory_compaction`
+        self.memory_compactor = build_memory_compactor(self.agent_memory, self.llm_manager)
+        self.compaction_interval = float(os.getenv("MEMORY_COMPACTION_INTERVAL", "0"))
+
+    def build_agent_graph(self):
+        """
+        Agent graph over this process's agents, with the local fast-path
+        router (LOCAL_ROUTER) in front of the LLM router.
+        """
+        # Imported here so processes without a graph don't load langgraph
+        from langgraph_setup.agent_graph import AgentGraph
+        from langgraph_setup.intent_router import IntentClassifier
+
+        intent_classifier = None
+        if _flag("LOCAL_ROUTER", "true"):
+            intent_classifier = IntentClassifier(
+                memory=self.agent_memory,
+                threshold=float(os.getenv("LOCAL_ROUTER_THRESHOLD", "0.5")),
+                margin=float(os.getenv("LOCAL_ROUTER_MARGIN", "0.05"))
+            )
+        return AgentGraph(
+            llm_manager=self.llm_manager,
+            memory=self.agent_memory,
+            agent_options=self.agent_options,
+            intent_classifier=intent_classifier,
+            agents=self.agents
+        )
+
+    def start_background_jobs(self) -> None:
+        """Start periodic jobs in this process; cheap enough to call per request."""
+        if self.compaction_interval > 0:
+            self.memory_compactor.ensure_running(self.compaction_interval)
+
+    def register_metrics(self) -> None:
+        """Expose queue depths, cache sizes and LLM transport events read at scrape time."""
+        metrics.REGISTRY.register_collector(
+            "agentic_queue_depth", "Items waiting in background queues", "gauge", self._queue_depths
+        )
+        metrics.REGISTRY.register_collector(
+            "agentic_cache_entries", "Entries held in process-local caches", "gauge", self._cache_entries
+        )
+        metrics.REGISTRY.register_collector(
+            "agentic_llm_transport_events_total", "LLM retries, fallbacks and hedged requests", "counter",
+            lambda: metrics.labelled(self.llm_manager.transport_stats, "event")
+        )
+
+    def _queue_depths(self) -> Dict[Any, float]:
+        depths = {
+            "memory_writes": self.agent_memory.write_queue.pending() if self.agent_memory.write_queue else 0,
+            "embedding_batch": self.encoder.pending() if hasattr(self.encoder, "pending") else 0
+        }
+        if self.response_cache is not None and self.response_cache.memory.write_queue is not None:
+            depths["response_cache_writes"] = self.response_cache.memory.write_queue.pending()
+        return metrics.labelled(depths, "queue")
+
+    def _cache_entries(self) -> Dict[Any, float]:
+        entries = {}
+        if self.embedding_cache is not None:
+            entries["embedding"] = self.embedding_cache.stats()["size"]
+        if self.response_cache is not None:
+            entries["response"] = self.response_cache.stats()["local_size"]
+        if getattr(self.agent_memory, "retrieval_cache", None) is not None:
+            entries["retrieval"] = self.agent_memory.retrieval_cache.stats()["size"]
+        return metrics.labelled(entries, "cache")
+
+    def warm_up_on_start(self, startup: Optional[StartupTimer] = None) -> None:
+        """
+        Apply WARMUP_ON_START: "true" warms up before serving (required for
+        sharing the model with preloaded gunicorn workers), "background"
+        serves /healthz immediately.
+        """
+        warmup_mode = os.getenv("WARMUP_ON_START", "true").lower()
+        if warmup_mode == "true":
+            self.lifecycle.warm_up()
+            if startup is not None:
+                startup.mark("warm-up")
+        elif warmup_mode == "background":
+            self.lifecycle.warm_up_in_background()
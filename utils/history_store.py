@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+# Messages are kept as (role code, content) tuples instead of dicts
+ROLES = ("system", "user", "assistant")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+
+class HistoryStore(ABC):
+    """Per-user conversation history, namespaced by agent."""
+
+    @abstractmethod
+    def get(self, namespace: str, user_id: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Return the most recent messages (oldest first), at most `limit` of them."""
+
+    @abstractmethod
+    def append(self, namespace: str, user_id: str, messages: List[Dict[str, str]]) -> None:
+        """Append messages to the user's history, dropping the oldest beyond capacity."""
+
+    @abstractmethod
+    def clear(self, namespace: str, user_id: str) -> None:
+        """Forget the user's history."""
+
+    @abstractmethod
+    def evict_idle(self) -> int:
+        """Drop sessions that have been idle too long; returns how many were dropped."""
+
+
+class InMemoryHistoryStore(HistoryStore):
+    def __init__(self, capacity: int = 10, idle_ttl: Optional[float] = 3600, max_sessions: int = 100000):
+        """
+        Process-local history store with a fixed-size ring buffer per user.
+
+        Args:
+            capacity: Maximum number of messages kept per user
+            idle_ttl: Seconds after which an untouched session is evicted
+                (None keeps sessions until `max_sessions` is reached)
+            max_sessions: Maximum number of sessions; least recently used go first
+        """
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, user_id, limit=None):
+        with self._lock:
+            self._evict_idle_locked(time.time())
+            session = self._sessions.get((namespace, user_id))
+            if session is None:
+                return []
+            messages = list(session[0])
+
+        if limit is not None:
+            messages = messages[-limit:] if limit else []
+        return [{"role": ROLES[code], "content": content} for code, content in messages]
+
+    def append(self, namespace, user_id, messages):
+        key = (namespace, user_id)
+        now = time.time()
+
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            buffer = session[0] if session else deque(maxlen=self.capacity)
+            buffer.extend((_ROLE_CODES[message["role"]], message["content"]) for message in messages)
+            # Re-inserting keeps the OrderedDict sorted by last activity
+            self._sessions[key] = (buffer, now)
+
+            self._evict_idle_locked(now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, namespace, user_id):
+        with self._lock:
+            self._sessions.pop((namespace, user_id), None)
+
+    def evict_idle(self):
+        with self._lock:
+            return self._evict_idle_locked(time.time())
+
+    def _evict_idle_locked(self, now):
+        if self.idle_ttl is None:
+            return 0
+
+        evicted = 0
+        cutoff = now - self.idle_ttl
+        while self._sessions:
+            key, (_, last_active) = next(iter(self._sessions.items()))
+            if last_active >= cutoff:
+                break
+            del self._sessions[key]
+            evicted += 1
+        return evicted
+
+
+class SQLiteHistoryStore(HistoryStore):
+    def __init__(self,
+                 path: str,
+                 capacity: int = 10,
+                 idle_ttl: Optional[float] = 3600,
+                 mmap_size: int = 64 * 1024 * 1024,
+                 eviction_interval: float = 60.0):
+        """
+        History store backed by a local SQLite file shared by all worker processes.
+
+        Uses WAL mode and memory-mapped I/O so concurrent readers in
+        different processes see the same history cheaply.
+
+        Args:
+            path: SQLite database file
+            capacity: Maximum number of messages kept per user
+            idle_ttl: Seconds after which an untouched session is evicted
+            mmap_size: Bytes of the database file to memory-map
+            eviction_interval: Minimum seconds between idle-session sweeps
+        """
+        self.path = path
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self.mmap_size = mmap_size
+        self.eviction_interval = eviction_interval
+        self._local = threading.local()
+        self._last_eviction = 0.0
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "namespace TEXT NOT NULL, user_id TEXT NOT NULL, "
+            "role INTEGER NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS history_session ON history (namespace, user_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_created ON history (created_at)")
+        conn.commit()
+
+    def _connection(self):
+        """One connection per thread and process; SQLite handles cross-process locking."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, user_id, limit=None):
+        limit = self.capacity if limit is None else min(limit, self.capacity)
+        rows = self._connection().execute(
+            "SELECT role, content FROM history WHERE namespace = ? AND user_id = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (namespace, user_id, limit)
+        ).fetchall()
+        return [{"role": ROLES[code], "content": content} for code, content in reversed(rows)]
+
+    def append(self, namespace, user_id, messages):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO history (namespace, user_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, user_id, _ROLE_CODES[m["role"]], m["content"], now) for m in messages]
+            )
+            # Trim the session to its ring-buffer capacity
+            conn.execute(
+                "DELETE FROM history WHERE namespace = ? AND user_id = ? AND id <= ("
+                "SELECT id FROM history WHERE namespace = ? AND user_id = ? "
+                "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (namespace, user_id, namespace, user_id, self.capacity)
+            )
+
+        if now - self._last_eviction >= self.eviction_interval:
+            self.evict_idle()
+
+    def clear(self, namespace, user_id):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM history WHERE namespace = ? AND user_id = ?", (namespace, user_id))
+
+    def evict_idle(self):
+        self._last_eviction = time.time()
+        if self.idle_ttl is None:
+            return 0
+
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM history WHERE (namespace, user_id) IN ("
+                "SELECT namespace, user_id FROM history GROUP BY namespace, user_id "
+                "HAVING MAX(created_at) < ?)",
+                (self._last_eviction - self.idle_ttl,)
+            )
+        return cursor.rowcount
@@ -0,0 +1,401 @@
+"""
+Static knowledge (FAQs, course catalog) retrieved per turn.
+
+Source files live under a knowledge directory, one subdirectory per agent
+scope (`sales/`, `help/`); files at the top level are shared by every scope.
+Markdown files are split into one snippet per `##` section, text files into
+paragraphs. Each snippet is indexed twice:
+
+- BM25 over word tokens, so exact terms like course names and prices match
+- Dense vectors from the embedding model, for paraphrases
+
+The two rankings are merged with reciprocal rank fusion. Vectors are
+precomputed and saved next to the sources; when a file changes only its new
+or edited snippets are embedded again.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Repository knowledge directory, also used for the full-file fallback
+DEFAULT_KNOWLEDGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge")
+SOURCE_SUFFIXES = (".md", ".txt")
+
+# Prices and numbers ("$4,999" -> "4999") or words, including Sinhala vowel signs
+_TOKEN = re.compile(r"\d[\d,]*(?:\.\d+)?|[\w\u0D80-\u0DFF]+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "so that the this to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = (token.replace(",", "").lower() for token in _TOKEN.findall(text))
+    return [_stem(token) for token in tokens if token not in _STOPWORDS]
+
+
+def _stem(token: str) -> str:
+    """Fold plurals ("prices" -> "price"), enough for FAQ and catalog wording."""
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def split_snippets(text: str, markdown: bool = True) -> List[Dict[str, str]]:
+    """
+    Split a source file into snippets.
+
+    Markdown is cut at `##` headings, each snippet titled by the document's
+    `#` heading and its own; text before the first section is kept as a
+    snippet of its own when it has content.
+    """
+    if not markdown:
+        return [{"title": "", "text": part.strip()} for part in re.split(r"\n\s*\n", text) if part.strip()]
+
+    document = ""
+    snippets = []
+    title, lines = "", []
+    for line in text.splitlines() + ["## "]:
+        if line.startswith("# "):
+            document = line[2:].strip()
+        elif line.startswith("## "):
+            body = "\n".join(lines).strip()
+            if body:
+                snippets.append({"title": " > ".join(part for part in (document, title) if part), "text": body})
+            title, lines = line[3:].strip(), []
+        else:
+            lines.append(line)
+    return snippets
+
+
+def load_sections(scope: str, source_dir: str = DEFAULT_KNOWLEDGE_DIR) -> List[Dict[str, str]]:
+    """Snippets of a scope's knowledge files, in file order, cut as the index cuts them."""
+    snippets = []
+    for relpath in _source_files(source_dir):
+        if _scope_of(relpath) == scope:
+            with open(os.path.join(source_dir, relpath), encoding="utf-8") as f:
+                snippets.extend(split_snippets(f.read(), markdown=relpath.endswith(".md")))
+    return snippets
+
+
+def _source_files(source_dir: str) -> List[str]:
+    """Source file paths relative to `source_dir`, sorted."""
+    files = []
+    for root, dirs, names in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in names:
+            if name.endswith(SOURCE_SUFFIXES) and not name.startswith("."):
+                files.append(os.path.relpath(os.path.join(root, name), source_dir))
+    return sorted(files)
+
+
+def _scope_of(relpath: str) -> Optional[str]:
+    parts = relpath.replace(os.sep, "/").split("/")
+    return parts[0] if len(parts) > 1 else None
+
+
+def _snippet_key(snippet: Dict[str, Any]) -> str:
+    raw = f"{snippet['title']}\0{snippet['text']}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class _Snapshot:
+    """An immutable built index; searches read one snapshot while a refresh builds the next."""
+
+    def __init__(self, files, snippets, vectors, k1, b):
+        self.files = files
+        self.snippets = snippets
+        self.vectors = vectors
+        self.scopes = np.array([s["scope"] or "" for s in snippets], dtype=object)
+        self.postings = self._bm25(k1, b)
+
+    def _bm25(self, k1, b):
+        """Per term, the snippets containing it and their precomputed BM25 weights."""
+        counts = [Counter(tokenize(f"{s['title']}\n{s['text']}")) for s in self.snippets]
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        if not counts:
+            return {}
+        norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0))
+
+        postings = {}
+        for doc, counter in enumerate(counts):
+            for term, tf in counter.items():
+                postings.setdefault(term, []).append((doc, tf))
+        n = len(counts)
+        for term, entries in postings.items():
+            docs = np.array([doc for doc, _ in entries])
+            tf = np.array([tf for _, tf in entries], dtype=np.float32)
+            idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            postings[term] = (docs, idf * tf * (k1 + 1) / (tf + norm[docs]))
+        return postings
+
+
+class KnowledgeIndex:
+    def __init__(self,
+                 embed: Callable[[List[str]], np.ndarray],
+                 source_dir: str = DEFAULT_KNOWLEDGE_DIR,
+                 index_path: Optional[str] = "knowledge_index.npz",
+                 model_key: str = "",
+                 top_k: int = 3,
+                 candidates: int = 20,
+                 min_similarity: float = 0.3,
+                 rrf_k: int = 60,
+                 refresh_interval: Optional[float] = 30,
+                 k1: float = 1.2,
+                 b: float = 0.75):
+        """
+        Hybrid BM25 and dense index over the knowledge files.
+
+        Args:
+            embed: Callable embedding a list of texts (the agent memory's `embed_batch`)
+            source_dir: Directory holding the knowledge files
+            index_path: Where the built index is saved (None keeps it in memory only)
+            model_key: Embedding model identifier; saved vectors from another model are discarded
+            top_k: Snippets returned per query
+            candidates: Snippets taken from each ranking before fusion
+            min_similarity: Minimum cosine similarity for a dense-only match
+            rrf_k: Reciprocal rank fusion constant
+            refresh_interval: Minimum seconds between checks for changed files
+                (None only rebuilds on `refresh`)
+            k1, b: BM25 parameters
+        """
+        self.embed = embed
+        self.source_dir = source_dir
+        self.index_path = index_path
+        self.model_key = model_key
+        self.top_k = top_k
+        self.candidates = candidates
+        self.min_similarity = min_similarity
+        self.rrf_k = rrf_k
+        self.refresh_interval = refresh_interval
+        self.k1 = k1
+        self.b = b
+
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._refreshing = False
+
+    def load(self) -> bool:
+        """Load the saved index; returns False when there is none for this model."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                manifest = json.loads(str(data["manifest"]))
+                vectors = data["vectors"]
+        except (OSError, ValueError, KeyError):
+            logger.warning("Ignoring unreadable knowledge index %s", self.index_path, exc_info=True)
+            return False
+        if manifest.get("model_key") != self.model_key:
+            return False
+
+        self._snapshot = _Snapshot(manifest["files"], manifest["snippets"], vectors, self.k1, self.b)
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the index if source files were added, changed or removed.
+
+        Unchanged files keep their snippets, and snippets whose text is
+        unchanged keep their vectors, so only edited snippets are embedded.
+
+        Returns:
+            True if the index was rebuilt
+        """
+        with self._lock:
+            self._last_check = time.monotonic()
+            files = self._scan()
+            previous = self._snapshot
+            if previous is not None and previous.files == files:
+                return False
+
+            old_files = previous.files if previous is not None else {}
+            old_snippets = previous.snippets if previous is not None else []
+            kept = {}
+            for snippet in old_snippets:
+                kept.setdefault(snippet["source"], []).append(snippet)
+
+            snippets = []
+            for relpath in files:
+                if old_files.get(relpath) == files[relpath] and relpath in kept:
+                    snippets.extend(kept[relpath])
+                    continue
+                with open(os.path.join(self.source_dir, relpath), encoding="utf-8") as f:
+                    parts = split_snippets(f.read(), markdown=relpath.endswith(".md"))
+                for part in parts:
+                    part.update(source=relpath, scope=_scope_of(relpath))
+                    part["key"] = _snippet_key(part)
+                    snippets.append(part)
+
+            known = {s["key"]: previous.vectors[i] for i, s in enumerate(old_snippets)}
+            missing = [s for s in snippets if s["key"] not in known]
+            if missing:
+                embedded = self.embed([f"{s['title']}\n{s['text']}" for s in missing])
+                known.update(zip((s["key"] for s in missing), embedded))
+            vectors = np.asarray([known[s["key"]] for s in snippets], dtype=np.float32)
+            if len(vectors):
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+            self._snapshot = _Snapshot(files, snippets, vectors, self.k1, self.b)
+            self._save()
+            logger.info(
+                "Knowledge index rebuilt: %d snippets from %d files (%d embedded)",
+                len(snippets), len(files), len(missing)
+            )
+            return True
+
+    def ensure_built(self) -> None:
+        """
+        Load the saved index and bring it up to date with the source files.
+
+        Called during warm-up, so no request has to embed the whole knowledge base.
+        """
+        if self._snapshot is None:
+            self.load()
+        self.refresh()
+
+    def search(self,
+               query: str,
+               scope: Optional[str] = None,
+               limit: Optional[int] = None,
+               query_embedding: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Snippets relevant to a query.
+
+        Args:
+            query: Query text
+            scope: Agent scope; shared snippets are always included
+            limit: Maximum number of snippets (defaults to `top_k`)
+            query_embedding: Precomputed query vector from the same model
+
+        Returns:
+            {"title", "text", "source", "score"} per snippet, best first
+        """
+        self._maybe_refresh()
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot.snippets:
+            return []
+        limit = limit or self.top_k
+        allowed = (snapshot.scopes == "") | (snapshot.scopes == (scope or ""))
+
+        # Sparse ranking
+        sparse = np.zeros(len(snapshot.snippets), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in snapshot.postings:
+                docs, weights = snapshot.postings[term]
+                sparse[docs] += weights
+        sparse_rank = [i for i in np.argsort(-sparse)[:self.candidates] if sparse[i] > 0 and allowed[i]]
+
+        # Dense ranking
+        if query_embedding is None:
+            query_embedding = self.embed([query])[0]
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        dense = snapshot.vectors @ (query_vector / max(float(np.linalg.norm(query_vector)), 1e-12))
+        dense_rank = [
+            i for i in np.argsort(-dense)[:self.candidates] if dense[i] >= self.min_similarity and allowed[i]
+        ]
+
+        fused = {}
+        for ranking in (sparse_rank, dense_rank):
+            for rank, i in enumerate(ranking, 1):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (self.rrf_k + rank)
+
+        return [
+            {
+                "title": snapshot.snippets[i]["title"],
+                "text": snapshot.snippets[i]["text"],
+                "source": snapshot.snippets[i]["source"],
+                "score": score
+            }
+            for i, score in sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"files": 0, "snippets": 0}
+        return {"files": len(snapshot.files), "snippets": len(snapshot.snippets)}
+
+    def _maybe_refresh(self):
+        """Build the index on first use; afterwards pick up changed files in the background."""
+        if self._snapshot is None:
+            # Only without a warm-up: build in the calling thread
+            try:
+                self.ensure_built()
+            except Exception:
+                logger.exception("Knowledge index build failed")
+            return
+        if self.refresh_interval is None or self._refreshing:
+            return
+        if time.monotonic() - self._last_check < self.refresh_interval:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name="knowledge-refresh", daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Knowledge index refresh failed")
+        finally:
+            self._refreshing = False
+
+    def _scan(self) -> Dict[str, List[int]]:
+        """Size and modification time of every source file."""
+        if not os.path.isdir(self.source_dir):
+            logger.warning("Knowledge directory %s not found", self.source_dir)
+            return {}
+        files = {}
+        for relpath in _source_files(self.source_dir):
+            stat = os.stat(os.path.join(self.source_dir, relpath))
+            files[relpath] = [stat.st_mtime_ns, stat.st_size]
+        return files
+
+    def _save(self):
+        if not self.index_path:
+            return
+        snapshot = self._snapshot
+        manifest = {"model_key": self.model_key, "files": snapshot.files, "snippets": snapshot.snippets}
+        tmp_path = f"{self.index_path}.tmp.npz"
+        try:
+            np.savez(tmp_path, manifest=np.array(json.dumps(manifest, ensure_ascii=False)), vectors=snapshot.vectors)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            logger.warning("Could not save knowledge index to %s", self.index_path, exc_info=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update the knowledge index")
+    parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # Same configuration as the app (KNOWLEDGE_* and EMBEDDING_* variables)
+    from dotenv import load_dotenv
+    from utils.factory import build_embedding_cache, build_knowledge_index, build_memory
+
+    load_dotenv()
+    memory = build_memory(build_embedding_cache())
+    knowledge_index = build_knowledge_index(memory)
+    if knowledge_index is None:
+        raise SystemExit("KNOWLEDGE_INDEX is disabled")
+    knowledge_index.load()
+    knowledge_index.refresh()
+    print(json.dumps(knowledge_index.stats()))
+    memory.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.knowledge_index import KnowledgeIndex
+from utils.llm_manager import GroqLLMManager
+from utils.memory_backend import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEXT = "warm up"
+
+
+class ServiceLifecycle:
+    def __init__(self,
+                 memories: List[MemoryBackend],
+                 llm_manager: Optional[GroqLLMManager] = None,
+                 knowledge: Optional[KnowledgeIndex] = None):
+        """
+        Warm-up, readiness and shutdown for a serving process.
+
+        The process only reports ready once the embedding model has encoded
+        a text, the memory stores have answered and the knowledge index is
+        built. In a preloaded gunicorn master the model is warmed once before
+        forking, so workers share its memory copy-on-write and only need
+        fresh connections.
+
+        Args:
+            memories: Memory stores used by the process (their writes are flushed on shutdown)
+            llm_manager: LLM manager whose connections are reset after a fork
+            knowledge: Knowledge index loaded or built during warm-up
+        """
+        self.memories = [memory for memory in memories if memory is not None]
+        self.llm_manager = llm_manager
+        self.knowledge = knowledge
+        self.warmup_seconds = None
+        self.startup_report = None
+        self.error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self._pid == os.getpid()
+
+    def warm_up(self) -> bool:
+        """Load and exercise the embedding model and check the memory stores; returns readiness."""
+        with self._lock:
+            if self.ready:
+                return True
+            start = time.perf_counter()
+            try:
+                for memory in self.memories:
+                    memory.embed_batch([WARMUP_TEXT])
+                    memory.ping()
+                if self.knowledge is not None:
+                    self.knowledge.ensure_built()
+            except Exception as e:
+                self.error = str(e)
+                logger.exception("Warm-up failed")
+                return False
+
+            self.warmup_seconds = time.perf_counter() - start
+            self.error = None
+            self._pid = os.getpid()
+            self._ready.set()
+            logger.info("Warm-up finished in %.2fs", self.warmup_seconds)
+            return True
+
+    def warm_up_in_background(self) -> None:
+        """Start a warm-up thread unless one is already running."""
+        if self._lock.locked():
+            return
+        threading.Thread(target=self.warm_up, name="warm-up", daemon=True).start()
+
+    def after_fork(self) -> None:
+        """Give a forked worker its own connections, then re-check readiness."""
+        self._ready.clear()
+        # A lock held by a master thread at fork time would stay locked here
+        self._lock = threading.Lock()
+        for memory in self.memories:
+            memory.reset_connections()
+        if self.llm_manager is not None:
+            self.llm_manager.reset_connections()
+        self.warm_up_in_background()
+
+    def shutdown(self, timeout: Optional[float] = 30) -> bool:
+        """Stop reporting ready and flush pending memory writes; False if writes were left."""
+        flushed = self._close_memories(timeout)
+        if self.llm_manager is not None:
+            self.llm_manager.close()
+        return flushed
+
+    async def ashutdown(self, timeout: Optional[float] = 30) -> bool:
+        """Async variant of `shutdown`, closing the LLM clients on the running loop."""
+        flushed = self._close_memories(timeout)
+        if self.llm_manager is not None:
+            await self.llm_manager.aclose()
+        return flushed
+
+    def _close_memories(self, timeout: Optional[float]) -> bool:
+        self._ready.clear()
+        flushed = True
+        for memory in self.memories:
+            flushed = memory.close(timeout) and flushed
+        if not flushed:
+            logger.warning("Shutdown timed out with memory writes still pending")
+        return flushed
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+            "startup": self.startup_report,
+            "pending_writes": sum(
+                memory.write_queue.pending() for memory in self.memories if memory.write_queue is not None
+            )
+        }
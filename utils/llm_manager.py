@@ -1,28 +1,102 @@
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
 import groq
-from typing import List, Dict, Optional, Any, Union
+import httpx
+from typing import List, Dict, Optional, Any, Union, Iterator, AsyncIterator
+from utils.context_builder import estimate_tokens
+from utils.llm_transport import RETRYABLE_ERRORS, RetryPolicy, TokenBucket
+from utils.metrics import count_cache, count_tokens, record, span
 
 class GroqLLMManager:
-    def __init__(self, api_key: Optional[str] = None, model: str = "llama3-70b-8192"):
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 model: str = "llama3-70b-8192",
+                 response_cache=None,
+                 timeout: float = 30.0,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 8.0,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 fallback_model: Optional[str] = None,
+                 hedge_after: Optional[float] = None,
+                 max_hedges: int = 4):
         """
         Initialize the Groq LLM Manager.
         
         Args:
             api_key: Groq API key (will use environment variable if not provided)
             model: The model name to use
+            response_cache: Optional SemanticResponseCache consulted before the API
+            timeout: Per-request timeout in seconds
+            max_retries: Retries on rate limits, timeouts, connection errors and 5xx
+            backoff_base: First backoff delay ceiling in seconds, doubled per retry
+            backoff_max: Maximum backoff delay in seconds
+            max_connections: Size of the HTTP connection pool
+            max_keepalive_connections: Idle connections kept open for reuse
+            requests_per_minute: Client-side request quota (None for no limit)
+            tokens_per_minute: Client-side token quota (None for no limit)
+            fallback_model: Model used when the primary one keeps failing or is too slow
+            hedge_after: Seconds after which a request is also sent to the
+                fallback model; the first answer wins (None disables hedging)
+            max_hedges: Hedged requests in flight at once; beyond that a slow
+                request just waits for its primary model
         """
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
         if not self.api_key:
             raise ValueError("Groq API key is required")
         
         self.model = model
-        self.client = groq.Client(api_key=self.api_key)
+        self.fallback_model = fallback_model
+        self.hedge_after = hedge_after
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 5.0))
+        self.retry_policy = RetryPolicy(max_retries, backoff_base, backoff_max)
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.transport_stats = {"retries": 0, "fallbacks": 0, "hedged": 0, "hedge_wins": 0, "hedge_skipped": 0}
+        self._stats_lock = threading.Lock()
+        # Hedges get their own executor, so they never queue behind primary requests
+        self.max_hedges = max_hedges
+        self._hedge_slots = threading.BoundedSemaphore(max_hedges)
+        
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.response_cache = response_cache
+        self._primary_pool = None
+        self._hedge_pool = None
+        self.reset_connections()
+    
+    def reset_connections(self) -> None:
+        """
+        Create fresh pooled clients, e.g. in a worker forked from a preloaded master.
+        
+        Retries are handled by this manager, so the SDK's own retry loop is disabled.
+        """
+        self.client = groq.Client(
+            api_key=self.api_key,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=httpx.Client(limits=self.limits, timeout=self.timeout)
+        )
+        self.async_client = groq.AsyncGroq(
+            api_key=self.api_key,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        )
+        self._primary_pool = None
+        self._hedge_pool = None
     
     def generate(self, 
                 prompt: str, 
                 system_message: Optional[str] = None,
                 temperature: float = 0.7,
-                max_tokens: int = 1024) -> str:
+                max_tokens: int = 1024,
+                model: Optional[str] = None) -> str:
         """
         Generate a response from the LLM.
         
@@ -31,10 +105,28 @@ class GroqLLMManager:
             system_message: Optional system message to guide the model
             temperature: Sampling temperature
             max_tokens: Maximum number of tokens to generate
+            model: Model for this call (defaults to the manager's model)
             
         Returns:
             Generated text response
         """
+        messages = self._prompt_messages(prompt, system_message)
+        
+        return self.generate_with_history(messages, temperature=temperature, max_tokens=max_tokens, model=model)
+    
+    async def agenerate(self,
+                        prompt: str,
+                        system_message: Optional[str] = None,
+                        temperature: float = 0.7,
+                        max_tokens: int = 1024,
+                        model: Optional[str] = None) -> str:
+        """Async variant of `generate`."""
+        messages = self._prompt_messages(prompt, system_message)
+        
+        return await self.agenerate_with_history(messages, temperature=temperature, max_tokens=max_tokens, model=model)
+    
+    def _prompt_messages(self, prompt: str, system_message: Optional[str] = None) -> List[Dict[str, str]]:
+        """Build the message list for a single prompt."""
         messages = []
         
         if system_message:
@@ -42,19 +134,15 @@ class GroqLLMManager:
             
         messages.append({"role": "user", "content": prompt})
         
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        
-        return response.choices[0].message.content
+        return messages
     
     def generate_with_history(self,
                              messages: List[Dict[str, str]],
                              temperature: float = 0.7,
-                             max_tokens: int = 1024) -> str:
+                             max_tokens: int = 1024,
+                             cache_scope: Optional[str] = None,
+                             cache_user: Optional[str] = None,
+                             model: Optional[str] = None) -> str:
         """
         Generate a response with conversation history.
         
@@ -62,15 +150,352 @@ class GroqLLMManager:
             messages: List of message dictionaries with 'role' and 'content'
             temperature: Sampling temperature
             max_tokens: Maximum number of tokens to generate
+            cache_scope: Scope (e.g. agent name) enabling semantic cache hits
+            cache_user: User the prompt's memories and history belong to;
+                cached responses are never shared between users
+            model: Model for this call (defaults to the manager's model)
             
         Returns:
             Generated text response
         """
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        model = model or self.model
+        params = {"temperature": temperature, "max_tokens": max_tokens}
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(messages, model, cache_scope, cache_user, **params)
+            count_cache("response", hits=cached is not None, misses=cached is None)
+            if cached is not None:
+                return cached
+        
+        with span("llm.generate"):
+            response = self._complete(model, messages, temperature=temperature, max_tokens=max_tokens)
+        content = response.choices[0].message.content
+        
+        if self.response_cache is not None:
+            self.response_cache.store(messages, model, content, cache_scope, cache_user, **params)
+        
+        return content
+    
+    async def agenerate_with_history(self,
+                                     messages: List[Dict[str, str]],
+                                     temperature: float = 0.7,
+                                     max_tokens: int = 1024,
+                                     cache_scope: Optional[str] = None,
+                                     cache_user: Optional[str] = None,
+                                     model: Optional[str] = None) -> str:
+        """Async variant of `generate_with_history`."""
+        model = model or self.model
+        params = {"temperature": temperature, "max_tokens": max_tokens}
+        if self.response_cache is not None:
+            cached = await self.response_cache.alookup(messages, model, cache_scope, cache_user, **params)
+            count_cache("response", hits=cached is not None, misses=cached is None)
+            if cached is not None:
+                return cached
+        
+        with span("llm.generate"):
+            response = await self._acomplete(model, messages, temperature=temperature, max_tokens=max_tokens)
+        content = response.choices[0].message.content
+        
+        if self.response_cache is not None:
+            await self.response_cache.astore(messages, model, content, cache_scope, cache_user, **params)
+        
+        return content
+    
+    def stream_with_history(self,
+                            messages: List[Dict[str, str]],
+                            temperature: float = 0.7,
+                            max_tokens: int = 1024,
+                            cache_scope: Optional[str] = None,
+                            cache_user: Optional[str] = None,
+                            model: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream a response with conversation history, token by token.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            cache_scope: Scope (e.g. agent name) enabling semantic cache hits
+            cache_user: User the prompt's memories and history belong to;
+                cached responses are never shared between users
+            model: Model for this call (defaults to the manager's model)
+            
+        Yields:
+            Text chunks as they are generated (a cache hit arrives as one chunk)
+        """
+        model = model or self.model
+        params = {"temperature": temperature, "max_tokens": max_tokens}
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(messages, model, cache_scope, cache_user, **params)
+            count_cache("response", hits=cached is not None, misses=cached is None)
+            if cached is not None:
+                yield cached
+                return
+        
+        chunks = []
+        start = time.perf_counter()
+        # Retries and fallback apply to opening the stream, before the first token
+        stream = self._with_fallback(self._create, model, messages, temperature=temperature, max_tokens=max_tokens, stream=True)
+        
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if not chunks:
+                        record("llm.first_token", time.perf_counter() - start)
+                    chunks.append(content)
+                    yield content
+        finally:
+            # Also settles the quota of a stream abandoned by the consumer
+            self._count_stream(model, messages, chunks, start, max_tokens)
+        
+        if self.response_cache is not None:
+            self.response_cache.store(messages, model, "".join(chunks), cache_scope, cache_user, **params)
+    
+    async def astream_with_history(self,
+                                   messages: List[Dict[str, str]],
+                                   temperature: float = 0.7,
+                                   max_tokens: int = 1024,
+                                   cache_scope: Optional[str] = None,
+                                   cache_user: Optional[str] = None,
+                                   model: Optional[str] = None) -> AsyncIterator[str]:
+        """Async variant of `stream_with_history`."""
+        model = model or self.model
+        params = {"temperature": temperature, "max_tokens": max_tokens}
+        if self.response_cache is not None:
+            cached = await self.response_cache.alookup(messages, model, cache_scope, cache_user, **params)
+            count_cache("response", hits=cached is not None, misses=cached is None)
+            if cached is not None:
+                yield cached
+                return
         
-        return response.choices[0].message.content
+        chunks = []
+        start = time.perf_counter()
+        stream = await self._awith_fallback(self._acreate, model, messages, temperature=temperature, max_tokens=max_tokens, stream=True)
+        
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if not chunks:
+                        record("llm.first_token", time.perf_counter() - start)
+                    chunks.append(content)
+                    yield content
+        finally:
+            self._count_stream(model, messages, chunks, start, max_tokens)
+        
+        if self.response_cache is not None:
+            await self.response_cache.astore(messages, model, "".join(chunks), cache_scope, cache_user, **params)
+    
+    def _count_stream(self, model, messages, chunks, start, max_tokens):
+        """
+        Record a finished stream and settle its token reservation.
+        
+        Streamed responses carry no usage, so tokens are estimated.
+        """
+        record("llm.stream", time.perf_counter() - start)
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        completion_tokens = estimate_tokens("".join(chunks))
+        count_tokens(model, prompt_tokens, completion_tokens)
+        if self.token_bucket is not None:
+            self.token_bucket.adjust(self._quota_cost(messages, max_tokens) - prompt_tokens - completion_tokens)
+    
+    def close(self) -> None:
+        """
+        Release pooled HTTP connections.
+        
+        From inside a running event loop prefer `aclose`; here the async
+        client's close is only scheduled on that loop.
+        """
+        self._close_sync()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.async_client.close())
+        else:
+            loop.create_task(self.async_client.close())
+    
+    async def aclose(self) -> None:
+        """Async variant of `close`."""
+        self._close_sync()
+        await self.async_client.close()
+    
+    def _close_sync(self) -> None:
+        self.client.close()
+        for pool in (self._primary_pool, self._hedge_pool):
+            if pool is not None:
+                pool.shutdown(wait=False)
+    
+    def _count_event(self, event: str) -> None:
+        """Count a transport event; called from request threads and the executors."""
+        with self._stats_lock:
+            self.transport_stats[event] += 1
+    
+    def _create(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        """Send one completion request with client-side rate limiting and retries."""
+        reserved = self._reserve_quota(messages, kwargs.get("max_tokens"))
+        attempt = 0
+        while True:
+            try:
+                response = self.client.chat.completions.create(
+                    model=model, messages=messages, timeout=self.timeout, **kwargs
+                )
+                break
+            except Exception as e:
+                if not self.retry_policy.should_retry(e, attempt):
+                    raise
+                self._count_event("retries")
+                time.sleep(self.retry_policy.delay(e, attempt))
+                attempt += 1
+        
+        self._settle_quota(reserved, response)
+        self._count_usage(model, response)
+        return response
+    
+    async def _acreate(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        """Async variant of `_create`."""
+        reserved = await self._areserve_quota(messages, kwargs.get("max_tokens"))
+        attempt = 0
+        while True:
+            try:
+                response = await self.async_client.chat.completions.create(
+                    model=model, messages=messages, timeout=self.timeout, **kwargs
+                )
+                break
+            except Exception as e:
+                if not self.retry_policy.should_retry(e, attempt):
+                    raise
+                self._count_event("retries")
+                await asyncio.sleep(self.retry_policy.delay(e, attempt))
+                attempt += 1
+        
+        self._settle_quota(reserved, response)
+        self._count_usage(model, response)
+        return response
+    
+    def _with_fallback(self, create, model, messages, **kwargs):
+        """Call `model`; switch to the fallback model once its retries are exhausted."""
+        try:
+            return create(model, messages, **kwargs)
+        except RETRYABLE_ERRORS:
+            if not self.fallback_model or model == self.fallback_model:
+                raise
+        self._count_event("fallbacks")
+        return create(self.fallback_model, messages, **kwargs)
+    
+    async def _awith_fallback(self, acreate, model, messages, **kwargs):
+        """Async variant of `_with_fallback`."""
+        try:
+            return await acreate(model, messages, **kwargs)
+        except RETRYABLE_ERRORS:
+            if not self.fallback_model or model == self.fallback_model:
+                raise
+        self._count_event("fallbacks")
+        return await acreate(self.fallback_model, messages, **kwargs)
+    
+    def _complete(self, model, messages, **kwargs):
+        """
+        Non-streaming completion, hedged when configured.
+        
+        If `model` has not answered within `hedge_after` seconds, the same
+        request is also sent to the fallback model and whichever succeeds
+        first is returned. Primaries run on an executor sized like the
+        connection pool; hedges run on a separate one with `max_hedges`
+        slots, and are skipped while all of them are busy.
+        """
+        if not self.fallback_model or self.hedge_after is None or model == self.fallback_model:
+            return self._with_fallback(self._create, model, messages, **kwargs)
+        
+        if self._primary_pool is None:
+            self._primary_pool = ThreadPoolExecutor(max_workers=self.limits.max_connections, thread_name_prefix="llm-primary")
+            self._hedge_pool = ThreadPoolExecutor(max_workers=self.max_hedges, thread_name_prefix="llm-hedge")
+        
+        primary = self._primary_pool.submit(self._create, model, messages, **kwargs)
+        try:
+            return primary.result(timeout=self.hedge_after)
+        except FutureTimeout:
+            pass
+        except RETRYABLE_ERRORS:
+            self._count_event("fallbacks")
+            return self._create(self.fallback_model, messages, **kwargs)
+        
+        if not self._hedge_slots.acquire(blocking=False):
+            self._count_event("hedge_skipped")
+            return primary.result()
+        self._count_event("hedged")
+        hedge = self._hedge_pool.submit(self._create, self.fallback_model, messages, **kwargs)
+        hedge.add_done_callback(lambda _: self._hedge_slots.release())
+        for future in as_completed([primary, hedge]):
+            if future.exception() is None:
+                if future is hedge:
+                    self._count_event("hedge_wins")
+                return future.result()
+        # Both failed: surface the primary model's error
+        return primary.result()
+    
+    async def _acomplete(self, model, messages, **kwargs):
+        """Async variant of `_complete`; the losing request is cancelled."""
+        if not self.fallback_model or self.hedge_after is None or model == self.fallback_model:
+            return await self._awith_fallback(self._acreate, model, messages, **kwargs)
+        
+        primary = asyncio.ensure_future(self._acreate(model, messages, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            try:
+                return primary.result()
+            except RETRYABLE_ERRORS:
+                self._count_event("fallbacks")
+                return await self._acreate(self.fallback_model, messages, **kwargs)
+        
+        self._count_event("hedged")
+        hedge = asyncio.ensure_future(self._acreate(self.fallback_model, messages, **kwargs))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count_event("hedge_wins")
+                        return task.result()
+            # Both failed: surface the primary model's error
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _quota_cost(self, messages, max_tokens):
+        """Tokens charged against the quota up front: prompt estimate plus the completion limit."""
+        return sum(estimate_tokens(m["content"]) for m in messages) + (max_tokens or 0)
+    
+    def _reserve_quota(self, messages, max_tokens):
+        if self.request_bucket is not None:
+            self.request_bucket.acquire()
+        if self.token_bucket is None:
+            return 0
+        cost = self._quota_cost(messages, max_tokens)
+        self.token_bucket.acquire(cost)
+        return cost
+    
+    async def _areserve_quota(self, messages, max_tokens):
+        if self.request_bucket is not None:
+            await self.request_bucket.aacquire()
+        if self.token_bucket is None:
+            return 0
+        cost = self._quota_cost(messages, max_tokens)
+        await self.token_bucket.aacquire(cost)
+        return cost
+    
+    def _count_usage(self, model, response):
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            count_tokens(model, usage.prompt_tokens, usage.completion_tokens)
+    
+    def _settle_quota(self, reserved, response):
+        """Give back the part of the token reservation the response did not use."""
+        usage = getattr(response, "usage", None)
+        if self.token_bucket is not None and usage is not None and usage.total_tokens is not None:
+            self.token_bucket.adjust(reserved - usage.total_tokens)
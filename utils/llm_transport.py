@@ -0,0 +1,95 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Optional
+
+import groq
+
+# Errors worth retrying: throttling, timeouts, dropped connections and 5xx
+RETRYABLE_ERRORS = (
+    groq.RateLimitError,
+    groq.APIConnectionError,
+    groq.InternalServerError
+)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+        Callers reserve what they need up front and are told how long to
+        wait, so the same bucket works for threads and coroutines.
+
+        Args:
+            rate_per_minute: Units added per minute (requests or LLM tokens)
+            capacity: Maximum burst size (defaults to one minute's worth)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Take `amount` units and return the seconds to wait before using them."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+            self._updated = now
+            self._available -= amount
+            if self._available >= 0:
+                return 0.0
+            return -self._available / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """Correct an earlier reservation (positive gives units back)."""
+        with self._lock:
+            self._available = min(self.capacity, self._available + amount)
+
+    def acquire(self, amount: float = 1) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, amount: float = 1) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        """
+        Exponential backoff with full jitter.
+
+        Args:
+            max_retries: Retries after the first attempt
+            base_delay: Delay ceiling of the first retry, doubled per attempt
+            max_delay: Upper bound of any single delay
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        return attempt < self.max_retries and isinstance(error, RETRYABLE_ERRORS)
+
+    def delay(self, error: Exception, attempt: int) -> float:
+        """Seconds to wait before retry number `attempt + 1`; honours Retry-After."""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -1,22 +1,106 @@
-import os
-from qdrant_client import QdrantClient
+import asyncio
+import functools
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
-import numpy as np
-from sentence_transformers import SentenceTransformer
-import uuid
+from utils.embedding_backends import DEFAULT_BACKEND
+from utils.memory_backend import MemoryBackend
 
-class QdrantMemory:
-    def __init__(self, url, collection_name, embedding_model="all-MiniLM-L6-v2"):
-        self.client = QdrantClient(url=url)
-        self.collection_name = collection_name
-        self.embedding_model = SentenceTransformer(embedding_model)
-        self.vector_size = self.embedding_model.get_sentence_embedding_dimension()
-        
-        # Create collection if it doesn't exist
-        self._create_collection()
-    
-    def _create_collection(self):
-        """Create a collection if it doesn't exist."""
+# Payload fields that are filtered on and therefore indexed
+DEFAULT_PAYLOAD_INDEXES = {
+    "user_id": models.PayloadSchemaType.KEYWORD,
+    "interaction_type": models.PayloadSchemaType.KEYWORD,
+    "created_at": models.PayloadSchemaType.FLOAT
+}
+
+# QDRANT_URL value selecting qdrant-client's in-process local mode (no server;
+# contents are lost on exit), e.g. for tests and benchmarks
+LOCAL_URL = ":memory:"
+
+class QdrantMemory(MemoryBackend):
+    def __init__(self, url, collection_name, embedding_model="all-MiniLM-L6-v2", embedding_cache=None, encoder=None,
+                 embedding_backend=DEFAULT_BACKEND, backend_options=None,
+                 write_behind=False, write_batch_size=64, write_flush_interval=0.5, write_queue_size=10000,
+                 hnsw_m=None, hnsw_ef_construct=None, search_ef=None, quantization=None, on_disk=None,
+                 payload_indexes=DEFAULT_PAYLOAD_INDEXES, retrieval_cache=None):
+        super().__init__(
+            collection_name,
+            embedding_model=embedding_model,
+            embedding_cache=embedding_cache,
+            encoder=encoder,
+            embedding_backend=embedding_backend,
+            backend_options=backend_options,
+            write_behind=write_behind,
+            write_batch_size=write_batch_size,
+            write_flush_interval=write_flush_interval,
+            write_queue_size=write_queue_size
+        )
+        self.url = url
+        self.client = QdrantClient(location=url) if url == LOCAL_URL else QdrantClient(url=url)
+        self._async_client = None
+        # Optional per-user RetrievalCache: candidates re-ranked locally, updated on writes
+        self.retrieval_cache = retrieval_cache
+        
+        # Collection schema; settings left as None keep Qdrant's defaults
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.search_ef = search_ef
+        self.quantization = quantization
+        self.on_disk = on_disk
+        self.payload_indexes = payload_indexes or {}
+        if quantization not in (None, "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        
+        # Create the collection if it doesn't exist and migrate its schema
+        self._ensure_collection()
+        
+        # Optionally buffer add_memory calls and upsert them in background batches
+        self._start_write_behind()
+    
+    @property
+    def async_client(self):
+        """Async Qdrant client, created on first use inside the running event loop."""
+        if self._async_client is None:
+            if self.url == LOCAL_URL:
+                # A second local client would be a separate, empty store
+                self._async_client = _LocalAsyncClient(self.client)
+            else:
+                self._async_client = AsyncQdrantClient(url=self.url)
+        return self._async_client
+    
+    def reset_connections(self):
+        """Open fresh Qdrant connections, e.g. in a worker forked from a preloaded master."""
+        if self.url != LOCAL_URL:
+            self.client = QdrantClient(url=self.url)
+        self._async_client = None
+    
+    def ping(self):
+        """Raise if Qdrant or the collection is unreachable."""
+        self.client.get_collection(self.collection_name)
+    
+    def _hnsw_config(self):
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+    
+    def _quantization_config(self):
+        if self.quantization != "int8":
+            return None
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    
+    def _ensure_collection(self):
+        """
+        Create the collection if it doesn't exist and bring its schema up to date.
+        
+        Safe to run on every startup: payload indexes are only created when
+        missing and collection parameters are only updated when they differ
+        from the configured values.
+        """
         collections = self.client.get_collections().collections
         collection_names = [collection.name for collection in collections]
         
@@ -25,60 +109,162 @@ class QdrantMemory:
                 collection_name=self.collection_name,
                 vectors_config=models.VectorParams(
                     size=self.vector_size,
-                    distance=models.Distance.COSINE
-                )
+                    distance=models.Distance.COSINE,
+                    on_disk=self.on_disk
+                ),
+                hnsw_config=self._hnsw_config(),
+                quantization_config=self._quantization_config()
             )
+            payload_schema = {}
+        else:
+            info = self.client.get_collection(self.collection_name)
+            if isinstance(info.config.params.vectors, models.VectorParams):
+                self._vector_size = info.config.params.vectors.size
+            self._migrate_collection(info.config)
+            payload_schema = info.payload_schema or {}
+        
+        for field_name, field_schema in self.payload_indexes.items():
+            if field_name not in payload_schema:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
     
-    def _get_embedding(self, text):
-        """Generate an embedding for the given text."""
-        return self.embedding_model.encode(text)
-    
-    def add_memory(self, text, metadata=None, user_id=None):
-        """Add a memory to the vector database."""
-        if metadata is None:
-            metadata = {}
+    def _migrate_collection(self, config):
+        """Update HNSW, on-disk and quantization settings that differ from the configuration."""
+        changes = {}
         
-        if user_id:
-            metadata["user_id"] = user_id
-            
-        embedding = self._get_embedding(text)
+        hnsw = config.hnsw_config
+        if (self.hnsw_m is not None and hnsw.m != self.hnsw_m) or \
+                (self.hnsw_ef_construct is not None and hnsw.ef_construct != self.hnsw_ef_construct):
+            changes["hnsw_config"] = self._hnsw_config()
         
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=[
-                models.PointStruct(
-                    id=uuid.uuid4().hex,
-                    vector=embedding.tolist(),
-                    payload={
-                        "text": text,
-                        **metadata
-                    }
-                )
-            ]
+        vectors = config.params.vectors
+        if self.on_disk is not None and isinstance(vectors, models.VectorParams) and \
+                bool(vectors.on_disk) != self.on_disk:
+            changes["vectors_config"] = {"": models.VectorParamsDiff(on_disk=self.on_disk)}
+        
+        if self.quantization == "int8" and not isinstance(config.quantization_config, models.ScalarQuantization):
+            changes["quantization_config"] = self._quantization_config()
+        
+        if changes:
+            self.client.update_collection(collection_name=self.collection_name, **changes)
+    
+    def _search_params(self):
+        if self.search_ef is None and self.quantization is None:
+            return None
+        return models.SearchParams(
+            hnsw_ef=self.search_ef,
+            quantization=models.QuantizationSearchParams(rescore=True) if self.quantization else None
         )
     
-    def search_memories(self, query, limit=5, user_id=None):
-        """Search for similar memories."""
-        query_embedding = self._get_embedding(query)
+    def _point(self, record):
+        point_id, vector, payload = record
+        return models.PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+    
+    def _upsert(self, records):
+        self.client.upsert(collection_name=self.collection_name, points=[self._point(r) for r in records], wait=True)
+        self._write_through(records)
+    
+    async def _aupsert(self, records):
+        await self.async_client.upsert(collection_name=self.collection_name, points=[self._point(r) for r in records])
+        self._write_through(records)
+    
+    def _write_through(self, records):
+        """Add stored points to the retrieval cache entries of their users."""
+        if self.retrieval_cache is None:
+            return
+        for point_id, vector, payload in records:
+            if payload.get("user_id"):
+                self.retrieval_cache.add(payload["user_id"], point_id, vector, payload)
+    
+    def _build_filter(self, user_id=None, filters=None, created_before=None, created_after=None):
+        """
+        Build a payload filter from a user ID, exact-match fields and age cutoffs.
+        
+        Returns None when there is nothing to filter on.
+        """
+        conditions = []
         
-        filter_condition = None
         if user_id:
-            filter_condition = models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="user_id",
-                        match=models.MatchValue(value=user_id)
-                    )
-                ]
+            conditions.append(
+                models.FieldCondition(
+                    key="user_id",
+                    match=models.MatchValue(value=user_id)
+                )
             )
         
-        results = self.client.search(
+        for key, value in (filters or {}).items():
+            conditions.append(models.FieldCondition(key=key, match=models.MatchValue(value=value)))
+        
+        if created_before is not None:
+            conditions.append(models.FieldCondition(key="created_at", range=models.Range(lt=created_before)))
+        
+        if created_after is not None:
+            conditions.append(models.FieldCondition(key="created_at", range=models.Range(gte=created_after)))
+        
+        return models.Filter(must=conditions) if conditions else None
+    
+    def count_memories(self, user_id=None, filters=None):
+        """Count stored memories, optionally restricted by user or payload fields."""
+        return self.client.count(
             collection_name=self.collection_name,
-            query_vector=query_embedding.tolist(),
-            limit=limit,
-            query_filter=filter_condition
-        )
+            count_filter=self._build_filter(user_id, filters),
+            exact=True
+        ).count
+    
+    def iter_memories(self, user_id=None, filters=None, with_vectors=False, batch_size=256, payload_fields=None):
+        """Stream stored memories page by page, with their IDs (and vectors if requested)."""
+        return self._scroll(self._build_filter(user_id, filters), with_vectors, batch_size, payload_fields)
+    
+    def user_ids(self, created_after=None):
+        """Distinct users with stored memories, sorted; `created_after` is filtered in Qdrant."""
+        if created_after is None:
+            return super().user_ids()
+        users = {
+            memory["metadata"].get("user_id")
+            for memory in self._scroll(self._build_filter(created_after=created_after), False, 1024, ["user_id"])
+        }
+        return sorted(user for user in users if user)
+    
+    def _scroll(self, scroll_filter, with_vectors, batch_size, payload_fields):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                # A list of keys makes Qdrant return only those payload fields
+                with_payload=list(payload_fields) if payload_fields is not None else True,
+                with_vectors=with_vectors
+            )
+            for point in points:
+                yield {
+                    "id": point.id,
+                    "text": point.payload.get("text"),
+                    "metadata": {k: v for k, v in point.payload.items() if k != "text"},
+                    "vector": point.vector if with_vectors else None
+                }
+            if offset is None:
+                break
+    
+    def delete_memories(self, ids=None, user_id=None, filters=None, created_before=None):
+        """Delete memories by ID, or every memory matching the given filter."""
+        if ids is not None:
+            selector = models.PointIdsList(points=list(ids))
+        else:
+            memory_filter = self._build_filter(user_id, filters, created_before)
+            if memory_filter is None:
+                raise ValueError("Refusing to delete without ids or a filter")
+            selector = models.FilterSelector(filter=memory_filter)
         
+        self.client.delete(collection_name=self.collection_name, points_selector=selector)
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.discard(ids=ids, user_id=user_id)
+    
+    def _format_hits(self, results):
         return [
             {
                 "text": hit.payload.get("text"),
@@ -87,3 +273,101 @@ class QdrantMemory:
             } 
             for hit in results
         ]
+    
+    def _cache_lookup(self, vector, limit, user_id, filters):
+        """
+        Hits answered from the retrieval cache, else None and the cache version
+        to store the remote result under (None when it should not be cached).
+        """
+        if self.retrieval_cache is None or not user_id or limit > self.retrieval_cache.candidate_limit:
+            return None, None
+        version = self.retrieval_cache.version(user_id)
+        return self.retrieval_cache.lookup(user_id, filters, vector, limit), version
+    
+    def _cache_results(self, results, vector, limit, user_id, filters, version):
+        """Store a candidate search in the retrieval cache and return the top `limit` hits."""
+        if version is not None:
+            self.retrieval_cache.store(
+                user_id, filters, vector, [(hit.id, hit.vector, hit.payload) for hit in results], version
+            )
+        return self._format_hits(results[:limit])
+    
+    def _search_kwargs(self, vector, limit, user_id, filters, version):
+        # Cacheable searches fetch the full candidate set with vectors
+        return {
+            "collection_name": self.collection_name,
+            "query_vector": vector.tolist(),
+            "limit": limit if version is None else self.retrieval_cache.candidate_limit,
+            "query_filter": self._build_filter(user_id, filters),
+            "search_params": self._search_params(),
+            "with_vectors": version is not None
+        }
+    
+    def _search(self, vector, limit, user_id, filters):
+        hits, version = self._cache_lookup(vector, limit, user_id, filters)
+        if hits is not None:
+            return hits
+        results = self.client.search(**self._search_kwargs(vector, limit, user_id, filters, version))
+        return self._cache_results(results, vector, limit, user_id, filters, version)
+    
+    async def _asearch(self, vector, limit, user_id, filters):
+        hits, version = self._cache_lookup(vector, limit, user_id, filters)
+        if hits is not None:
+            return hits
+        results = await self.async_client.search(**self._search_kwargs(vector, limit, user_id, filters, version))
+        return self._cache_results(results, vector, limit, user_id, filters, version)
+    
+    def _batch_lookup(self, vectors, limit, user_ids, filters):
+        """Per-query cached hits (None where missed), cache versions and the search requests for the misses."""
+        hits, versions, requests = [], [], []
+        for vector, user_id in zip(vectors, user_ids):
+            cached, version = self._cache_lookup(vector, limit, user_id, filters)
+            hits.append(cached)
+            versions.append(version)
+            if cached is None:
+                requests.append(models.SearchRequest(
+                    vector=vector.tolist(),
+                    filter=self._build_filter(user_id, filters),
+                    limit=limit if version is None else self.retrieval_cache.candidate_limit,
+                    params=self._search_params(),
+                    with_payload=True,
+                    with_vector=version is not None
+                ))
+        return hits, versions, requests
+    
+    def _merge_batch(self, hits, versions, results, vectors, limit, user_ids, filters):
+        results = iter(results)
+        return [
+            cached if cached is not None else
+            self._cache_results(next(results), vector, limit, user_id, filters, version)
+            for cached, version, vector, user_id in zip(hits, versions, vectors, user_ids)
+        ]
+    
+    def _search_batch(self, vectors, limit, user_ids, filters):
+        hits, versions, requests = self._batch_lookup(vectors, limit, user_ids, filters)
+        results = []
+        if requests:
+            results = self.client.search_batch(collection_name=self.collection_name, requests=requests)
+        return self._merge_batch(hits, versions, results, vectors, limit, user_ids, filters)
+    
+    async def _asearch_batch(self, vectors, limit, user_ids, filters):
+        hits, versions, requests = self._batch_lookup(vectors, limit, user_ids, filters)
+        results = []
+        if requests:
+            results = await self.async_client.search_batch(collection_name=self.collection_name, requests=requests)
+        return self._merge_batch(hits, versions, results, vectors, limit, user_ids, filters)
+
+class _LocalAsyncClient:
+    """Async facade over a local-mode client; calls run in the default executor."""
+    
+    def __init__(self, client):
+        self._client = client
+    
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(method, *args, **kwargs))
+        
+        return call
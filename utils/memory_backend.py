@@ -0,0 +1,435 @@
+"""
+Storage-independent part of the agents' vector memory.
+
+`MemoryBackend` implements everything the agents call (embedding, search,
+add, bulk ingestion, write-behind) on top of a few storage primitives.
+Backends implement the primitives: `QdrantMemory` (utils.memory) talks to a
+Qdrant server, `EmbeddedMemory` (utils.embedded_memory) keeps the vectors in
+local files inside the process.
+"""
+import atexit
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from utils.embedding_backends import DEFAULT_BACKEND, load_backend
+from utils.embedding_service import LazyEncoder
+from utils.metrics import count_cache, run_in_executor, span
+from utils.write_behind import WriteBehindQueue
+
+# Namespace for deterministic point IDs used by bulk ingestion
+MEMORY_ID_NAMESPACE = uuid.UUID("6f1c0a52-3b8e-4d7a-9c1e-5a2b7d9e4f10")
+
+# A stored memory: (point ID, vector, payload)
+MemoryRecord = Tuple[str, np.ndarray, Dict[str, Any]]
+
+
+class MemoryBackend(ABC):
+    def __init__(self,
+                 collection_name: str,
+                 embedding_model: str = "all-MiniLM-L6-v2",
+                 embedding_cache=None,
+                 encoder=None,
+                 embedding_backend: str = DEFAULT_BACKEND,
+                 backend_options: Optional[Dict[str, Any]] = None,
+                 write_behind: bool = False,
+                 write_batch_size: int = 64,
+                 write_flush_interval: float = 0.5,
+                 write_queue_size: int = 10000):
+        """
+        Vector memory shared by the agents.
+
+        Args:
+            collection_name: Name of the memory collection
+            embedding_model: Model name for the embedding backend
+            embedding_cache: Optional EmbeddingCache in front of the encoder
+            encoder: Any SentenceTransformer-compatible encoder (e.g. a
+                batching or sidecar client); otherwise the named backend is
+                only loaded when something is first embedded
+            embedding_backend: Embedding backend name (see utils.embedding_backends)
+            backend_options: Extra arguments for the embedding backend
+            write_behind: Buffer `add_memory` calls and write them in background batches
+            write_batch_size: Maximum memories per background write
+            write_flush_interval: Seconds to wait for a background batch to fill up
+            write_queue_size: Maximum number of buffered memories
+        """
+        self.collection_name = collection_name
+        self.embedding_model_name = embedding_model
+        self.embedding_model = encoder or LazyEncoder(
+            lambda: load_backend(embedding_backend, embedding_model, **(backend_options or {}))
+        )
+        self.embedding_cache = embedding_cache
+        self._vector_size = None
+        self._write_options = (write_behind, write_batch_size, write_flush_interval, write_queue_size)
+        self.write_queue = None
+
+    def _start_write_behind(self):
+        """Create the write-behind queue; call once the storage is ready."""
+        write_behind, batch_size, flush_interval, queue_size = self._write_options
+        if write_behind:
+            self.write_queue = WriteBehindQueue(
+                self._write_batch,
+                max_batch_size=batch_size,
+                flush_interval=flush_interval,
+                max_pending=queue_size
+            )
+            atexit.register(self.close)
+
+    @property
+    def vector_size(self) -> int:
+        """Embedding dimension, taken from existing storage when possible so the model can stay unloaded."""
+        if self._vector_size is None:
+            self._vector_size = self.embedding_model.get_sentence_embedding_dimension()
+        return self._vector_size
+
+    # Storage primitives
+
+    @abstractmethod
+    def _upsert(self, records: List[MemoryRecord]) -> None:
+        """Insert or replace records."""
+
+    @abstractmethod
+    def _search(self, vector, limit: int, user_id: Optional[str], filters: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Nearest memories as {"text", "metadata", "score"} dicts, best first."""
+
+    def _search_batch(self, vectors, limit, user_ids, filters) -> List[List[Dict[str, Any]]]:
+        return [self._search(vector, limit, user_id, filters) for vector, user_id in zip(vectors, user_ids)]
+
+    async def _aupsert(self, records: List[MemoryRecord]) -> None:
+        await self._in_executor(self._upsert, records)
+
+    async def _asearch(self, vector, limit, user_id, filters):
+        return await self._in_executor(self._search, vector, limit, user_id, filters)
+
+    async def _asearch_batch(self, vectors, limit, user_ids, filters):
+        return await self._in_executor(self._search_batch, vectors, limit, user_ids, filters)
+
+    @abstractmethod
+    def count_memories(self, user_id: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> int:
+        """Count stored memories, optionally restricted by user or payload fields."""
+
+    @abstractmethod
+    def iter_memories(self, user_id=None, filters=None, with_vectors=False, batch_size=256,
+                      payload_fields=None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream stored memories as {"id", "text", "metadata", "vector"} dicts.
+
+        With `payload_fields`, only those payload fields are read and returned
+        (`text` is None unless listed).
+        """
+
+    def user_ids(self, created_after: Optional[float] = None) -> List[str]:
+        """
+        Distinct users with stored memories, sorted.
+
+        With `created_after`, only users with a memory created at or after
+        that time. This implementation still reads every point; backends
+        that can filter in storage override it.
+        """
+        fields = ["user_id"] if created_after is None else ["user_id", "created_at"]
+        users = {
+            memory["metadata"].get("user_id")
+            for memory in self.iter_memories(batch_size=1024, payload_fields=fields)
+            if created_after is None or _created_at(memory["metadata"]) >= created_after
+        }
+        return sorted(user for user in users if user)
+
+    @abstractmethod
+    def delete_memories(self, ids=None, user_id=None, filters=None, created_before=None) -> None:
+        """Delete memories by ID, or every memory matching the given filter."""
+
+    @abstractmethod
+    def ping(self) -> None:
+        """Raise if the storage is unreachable."""
+
+    def reset_connections(self) -> None:
+        """Open fresh connections, e.g. in a worker forked from a preloaded master."""
+
+    async def _in_executor(self, func, *args):
+        return await run_in_executor(func, *args)
+
+    # Embedding
+
+    def embed_batch(self, texts):
+        """Generate embeddings for a batch of texts in a single encode pass."""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.vector_size), dtype=np.float32)
+
+        with span("memory.embed"):
+            return self._embed_batch(texts)
+
+    def _embed_batch(self, texts):
+        if self.embedding_cache is None:
+            return self._encode(texts)
+
+        # Serve cached vectors and encode only the misses, in one pass
+        vectors = [self.embedding_cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        count_cache("embedding", hits=len(texts) - len(missing), misses=len(missing))
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = self._encode(missing_texts)
+            self.embedding_cache.put_many(missing_texts, encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+
+        return np.vstack(vectors)
+
+    def _encode(self, texts):
+        """Run the embedding model over a list of texts."""
+        return np.asarray(self.embedding_model.encode(texts), dtype=np.float32)
+
+    def _get_embedding(self, text):
+        """Generate an embedding for the given text."""
+        return self.embed_batch([text])[0]
+
+    async def aembed_batch(self, texts):
+        """Async variant of `embed_batch`; encoding runs in the default executor."""
+        return await self._in_executor(self.embed_batch, list(texts))
+
+    # Writes
+
+    def _build_record(self, text, metadata=None, user_id=None, embedding=None, point_id=None) -> MemoryRecord:
+        """Build the record for a memory; the embedding must already be computed."""
+        if metadata is None:
+            metadata = {}
+
+        if user_id:
+            metadata["user_id"] = user_id
+
+        return (
+            point_id or uuid.uuid4().hex,
+            np.asarray(embedding, dtype=np.float32),
+            {"text": text, **metadata}
+        )
+
+    def add_memory(self, text, metadata=None, user_id=None, embedding=None):
+        """
+        Add a memory.
+
+        A precomputed embedding can be passed to skip the encode pass, e.g.
+        when the vector was already produced by `embed_batch` for this turn.
+        With write-behind enabled the call only enqueues the memory.
+        """
+        with span("memory.add"):
+            if self.write_queue is not None:
+                self.write_queue.put((text, metadata, user_id, embedding))
+                return
+
+            if embedding is None:
+                embedding = self._get_embedding(text)
+
+            self._upsert([self._build_record(text, metadata, user_id, embedding)])
+
+    async def aadd_memory(self, text, metadata=None, user_id=None, embedding=None):
+        """Async variant of `add_memory`."""
+        with span("memory.add"):
+            if self.write_queue is not None and self.write_queue.put((text, metadata, user_id, embedding), block=False):
+                return
+
+            if embedding is None:
+                embedding = (await self.aembed_batch([text]))[0]
+
+            await self._aupsert([self._build_record(text, metadata, user_id, embedding)])
+
+    def add_memories(self, records, batch_size=256, upsert_batch_size=64, concurrency=4, checkpoint_path=None):
+        """
+        Bulk-ingest memories from an iterable of records or a JSONL file.
+
+        Records are dicts with "text" and optional "metadata", "user_id" and
+        "id". They are streamed in batches of `batch_size`, embedded in one
+        pass per batch and upserted in chunks of `upsert_batch_size` on up to
+        `concurrency` threads, so memory use does not depend on input size.
+        Point IDs are derived deterministically from the record (its "id", or
+        user and text), which makes re-runs idempotent. With `checkpoint_path`
+        the number of committed records is persisted after every batch and a
+        re-run resumes from there.
+
+        Returns:
+            Number of records ingested by this call
+        """
+        if isinstance(records, (str, os.PathLike)):
+            records = _iter_jsonl(records)
+
+        offset = _read_checkpoint(checkpoint_path)
+        records = iter(records)
+        if offset:
+            # Skip records committed by a previous run
+            for _ in islice(records, offset):
+                pass
+
+        ingested = 0
+        in_flight = deque()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="memory-ingest") as pool:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+
+                embeddings = self.embed_batch([record["text"] for record in batch])
+                points = [
+                    self._build_record(
+                        record["text"],
+                        dict(record.get("metadata") or {}),
+                        record.get("user_id"),
+                        embedding,
+                        point_id=_record_id(record)
+                    )
+                    for record, embedding in zip(batch, embeddings)
+                ]
+                futures = [
+                    pool.submit(self._upsert, points[i:i + upsert_batch_size])
+                    for i in range(0, len(points), upsert_batch_size)
+                ]
+                ingested += len(batch)
+                in_flight.append((offset + ingested, futures))
+
+                # Bound the number of batches held in memory; commit in order
+                while len(in_flight) > concurrency:
+                    self._commit_ingest_batch(in_flight.popleft(), checkpoint_path)
+
+            while in_flight:
+                self._commit_ingest_batch(in_flight.popleft(), checkpoint_path)
+
+        return ingested
+
+    def _commit_ingest_batch(self, entry, checkpoint_path):
+        """Wait for a batch's upserts, then advance the checkpoint past it."""
+        committed, futures = entry
+        for future in futures:
+            future.result()
+        if checkpoint_path:
+            _write_checkpoint(checkpoint_path, committed)
+
+    def _write_batch(self, items):
+        """Embed (in one pass) and upsert a batch of queued memories."""
+        missing = [i for i, item in enumerate(items) if item[3] is None]
+        vectors = self.embed_batch([items[i][0] for i in missing])
+        embeddings = [item[3] for item in items]
+        for i, vector in zip(missing, vectors):
+            embeddings[i] = vector
+
+        with span("memory.write_batch"):
+            self._upsert([
+                self._build_record(text, metadata, user_id, embedding)
+                for (text, metadata, user_id, _), embedding in zip(items, embeddings)
+            ])
+
+    def flush(self, timeout=None):
+        """Wait until all buffered memories have been written."""
+        if self.write_queue is None:
+            return True
+        return self.write_queue.flush(timeout)
+
+    def close(self, timeout=None):
+        """Flush buffered memories and stop the background writer."""
+        if self.write_queue is None:
+            return True
+        return self.write_queue.close(timeout)
+
+    # Search
+
+    def search_memories(self, query, limit=5, user_id=None, query_embedding=None, filters=None):
+        """
+        Search for similar memories, optionally with a precomputed query vector.
+
+        `filters` adds exact-match conditions on other payload fields.
+        """
+        if query_embedding is None:
+            query_embedding = self._get_embedding(query)
+
+        with span("memory.search"):
+            return self._search(np.asarray(query_embedding, dtype=np.float32), limit, user_id, filters)
+
+    async def asearch_memories(self, query, limit=5, user_id=None, query_embedding=None, filters=None):
+        """Async variant of `search_memories`."""
+        if query_embedding is None:
+            query_embedding = (await self.aembed_batch([query]))[0]
+
+        with span("memory.search"):
+            return await self._asearch(np.asarray(query_embedding, dtype=np.float32), limit, user_id, filters)
+
+    def search_memories_batch(self, queries, limit=5, user_ids=None, query_embeddings=None, filters=None):
+        """
+        Search for several queries in one round trip.
+
+        Queries missing from `query_embeddings` are embedded in a single batch.
+
+        Returns:
+            One list of hits per query, in order
+        """
+        if not queries:
+            return []
+        if query_embeddings is None:
+            query_embeddings = self.embed_batch(queries)
+        if user_ids is None:
+            user_ids = [None] * len(queries)
+
+        with span("memory.search"):
+            return self._search_batch(np.asarray(query_embeddings, dtype=np.float32), limit, user_ids, filters)
+
+    async def asearch_memories_batch(self, queries, limit=5, user_ids=None, query_embeddings=None, filters=None):
+        """Async variant of `search_memories_batch`."""
+        if not queries:
+            return []
+        if query_embeddings is None:
+            query_embeddings = await self.aembed_batch(queries)
+        if user_ids is None:
+            user_ids = [None] * len(queries)
+
+        with span("memory.search"):
+            return await self._asearch_batch(np.asarray(query_embeddings, dtype=np.float32), limit, user_ids, filters)
+
+
+def _created_at(payload) -> float:
+    created_at = payload.get("created_at")
+    return created_at if isinstance(created_at, (int, float)) else 0.0
+
+
+def canonical_id(point_id) -> str:
+    """Point ID as a string, with UUIDs in dashed form whatever notation they came in (as Qdrant returns them)."""
+    try:
+        return str(uuid.UUID(str(point_id)))
+    except ValueError:
+        return str(point_id)
+
+
+def _iter_jsonl(path):
+    """Stream records from a JSONL file, skipping blank lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _record_id(record):
+    """Deterministic point ID for a bulk-ingested record."""
+    if record.get("id") is not None:
+        key = str(record["id"])
+    else:
+        key = f"{record.get('user_id') or ''}\0{record['text']}"
+    return str(uuid.uuid5(MEMORY_ID_NAMESPACE, key))
+
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("offset", 0)
+
+
+def _write_checkpoint(path, offset):
+    """Atomically record how many input records have been committed."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"offset": offset}, f)
+    os.replace(tmp_path, path)
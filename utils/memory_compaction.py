@@ -0,0 +1,434 @@
+"""
+Background compaction and retention for the agent memory collection.
+
+Every turn stores a "User: ... Agent: ..." memory, so heavy users accumulate
+thousands of points. `MemoryCompactor` walks the collection one user at a
+time and:
+
+1. deletes memories older than `max_age`,
+2. merges near-duplicates (cosine similarity of the stored vectors at or
+   above `dedup_threshold`), keeping the most recent copy,
+3. rolls conversations older than `summarize_after` into summary memories,
+   `summary_batch_size` interactions per LLM call, with calls for a user
+   running concurrently,
+4. deletes the oldest memories beyond `max_per_user`.
+
+Progress is checkpointed after every user, and a run stops after
+`max_users_per_run` users, so a large collection is compacted over several
+runs. The users of a pass are listed once, when it starts. Only every
+`full_scan_interval` does a pass list every user; the others list the users
+with memories created since the previous pass began, so routine runs cost
+in proportion to new memories rather than to the whole collection. Pauses
+between users keep the extra load on the store low.
+
+Run it periodically in-process (MEMORY_COMPACTION_INTERVAL) or from cron:
+
+    python -m utils.memory_compaction --dry-run
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.llm_manager import GroqLLMManager
+from utils.memory_backend import MemoryBackend
+from utils.metrics import REGISTRY, span
+
+logger = logging.getLogger(__name__)
+
+COMPACTED_MEMORIES = REGISTRY.counter(
+    "agentic_memory_compacted_total", "Memories removed by compaction, by reason", ["reason"]
+)
+
+SUMMARY_SYSTEM_MESSAGE = (
+    "You maintain long-term memory for an education platform's assistants. "
+    "Summarize the conversations below into a short list of facts about the user: "
+    "their goals, background, courses or products they asked about, decisions made and "
+    "open questions. Do not invent anything. Reply with the summary only."
+)
+
+DAY = 86400.0
+
+# Rows per similarity block when looking for duplicates
+DEDUP_BLOCK_ROWS = 512
+
+# Seconds an incremental pass looks back before the previous pass started,
+# covering memories queued by write-behind and clock skew between hosts
+SINCE_MARGIN = 300.0
+
+
+class MemoryCompactor:
+    def __init__(self,
+                 memory: MemoryBackend,
+                 llm_manager: Optional[GroqLLMManager] = None,
+                 dedup_threshold: Optional[float] = 0.95,
+                 dedup_embed_text: bool = False,
+                 summarize_after: Optional[float] = 30 * DAY,
+                 summary_batch_size: int = 20,
+                 summary_concurrency: int = 4,
+                 summary_model: Optional[str] = None,
+                 max_age: Optional[float] = None,
+                 max_per_user: Optional[int] = None,
+                 max_users_per_run: int = 500,
+                 full_scan_interval: Optional[float] = DAY,
+                 pause: float = 0.05,
+                 checkpoint_path: Optional[str] = None,
+                 dry_run: bool = False):
+        """
+        Compaction job for a memory collection.
+
+        Args:
+            memory: Memory backend holding the agents' interactions
+            llm_manager: LLM used for summaries (None disables summarization)
+            dedup_threshold: Cosine similarity at which two memories are
+                duplicates (None disables merging)
+            dedup_embed_text: Compare embeddings of the stored texts instead
+                of the stored vectors, which under MEMORY_VECTOR_POLICY=query
+                only encode the user's question
+            summarize_after: Seconds after which conversations are rolled into
+                summaries (None disables summarization)
+            summary_batch_size: Interactions summarized per LLM call
+            summary_concurrency: Concurrent summary calls per user
+            summary_model: Model for summaries (defaults to the manager's model)
+            max_age: Seconds after which memories are deleted (None keeps them)
+            max_per_user: Memories kept per user, newest first (None keeps all)
+            max_users_per_run: Users processed before a run stops
+            full_scan_interval: Seconds between passes over every user; other
+                passes only visit users with new memories (None lists every
+                user on every pass)
+            pause: Seconds to sleep between users
+            checkpoint_path: JSON file recording the last compacted user, so
+                the next run continues after it (the pass's user list is kept
+                next to it)
+            dry_run: Count what would change without writing anything
+        """
+        self.memory = memory
+        self.llm_manager = llm_manager
+        self.dedup_threshold = dedup_threshold
+        self.dedup_embed_text = dedup_embed_text
+        self.summarize_after = summarize_after if llm_manager is not None else None
+        self.summary_batch_size = max(2, summary_batch_size)
+        self.summary_concurrency = summary_concurrency
+        self.summary_model = summary_model
+        self.max_age = max_age
+        self.max_per_user = max_per_user
+        self.max_users_per_run = max_users_per_run
+        self.full_scan_interval = full_scan_interval
+        self.pause = pause
+        self.checkpoint_path = checkpoint_path
+        self.dry_run = dry_run
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._checkpoint = None
+        self._users = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Compact up to `max_users_per_run` users, continuing from the checkpoint.
+
+        Returns:
+            Counts of users processed and memories expired, merged,
+            summarized and trimmed, and whether the collection was completed
+        """
+        stats = {"users": 0, "expired": 0, "merged": 0, "summarized": 0, "summaries": 0, "trimmed": 0}
+        start = time.perf_counter()
+        checkpoint = self._read_checkpoint()
+        users = [user for user in self._pass_users(checkpoint) if user > checkpoint["last_user"]]
+
+        for user_id in users[:self.max_users_per_run]:
+            if self._stopping.is_set():
+                break
+            for key, value in self.compact_user(user_id).items():
+                stats[key] += value
+            stats["users"] += 1
+            checkpoint.update(last_user=user_id, updated_at=time.time())
+            self._write_checkpoint(checkpoint)
+            if self.pause:
+                time.sleep(self.pause)
+
+        stats["complete"] = stats["users"] == len(users)
+        stats["full_scan"] = checkpoint["full_scan"]
+        if stats["complete"]:
+            # The next pass starts from the first user and, unless a full scan
+            # is due, only lists users written to since this pass began
+            self._write_checkpoint({
+                "last_user": "",
+                "updated_at": time.time(),
+                "since": checkpoint["pass_started"] - SINCE_MARGIN,
+                "full_scan_at": checkpoint["pass_started"] if checkpoint["full_scan"] else checkpoint.get("full_scan_at")
+            })
+            self._write_users(None)
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        self.last_run = stats
+        logger.info("Memory compaction: %s", stats)
+        return stats
+
+    def _pass_users(self, checkpoint) -> List[str]:
+        """Users of the current pass; listed (and saved) when a new pass starts."""
+        if "pass_started" in checkpoint:
+            users = self._read_users()
+            if users is not None:
+                return users
+
+        started = time.time()
+        since = checkpoint.get("since")
+        full_scan = (
+            since is None
+            or self.full_scan_interval is None
+            or started - (checkpoint.get("full_scan_at") or 0) >= self.full_scan_interval
+        )
+        users = self.memory.user_ids() if full_scan else self.memory.user_ids(created_after=since)
+        checkpoint.update(last_user="", pass_started=started, full_scan=full_scan, updated_at=started)
+        self._write_users(users)
+        self._write_checkpoint(checkpoint)
+        return users
+
+    def compact_user(self, user_id: str) -> Dict[str, int]:
+        """Apply retention, merging and summarization to one user's memories."""
+        stats = {"expired": 0, "merged": 0, "summarized": 0, "summaries": 0, "trimmed": 0}
+        now = time.time()
+        with span("memory.compact"):
+            with_vectors = self.dedup_threshold is not None and not self.dedup_embed_text
+            memories = list(self.memory.iter_memories(user_id=user_id, with_vectors=with_vectors))
+            # Oldest first; memories stored before timestamps were recorded count as oldest
+            memories.sort(key=_created_at)
+
+            if self.max_age is not None:
+                # Memories of unknown age are left to the count limit
+                expired = [m for m in memories if 0 < _created_at(m) < now - self.max_age]
+                memories = self._delete(memories, expired, "expired", stats)
+
+            if self.dedup_threshold is not None:
+                memories = self._delete(memories, self._duplicates(memories), "merged", stats)
+
+            if self.summarize_after is not None:
+                memories = self._summarize(user_id, memories, now - self.summarize_after, stats)
+
+            if self.max_per_user is not None and len(memories) > self.max_per_user:
+                self._delete(memories, memories[:len(memories) - self.max_per_user], "trimmed", stats)
+
+        return stats
+
+    def _duplicates(self, memories):
+        """
+        Memories (oldest first) whose vector is near-identical to a newer one's.
+
+        The newest copy of each group survives. Similarities are computed a
+        block of rows at a time against all newer memories.
+        """
+        if len(memories) < 2:
+            return []
+        if self.dedup_embed_text:
+            vectors = np.asarray(self.memory.embed_batch([m["text"] or "" for m in memories]), dtype=np.float32)
+        else:
+            vectors = np.asarray([m["vector"] for m in memories], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        duplicates = []
+        for start in range(0, len(memories) - 1, DEDUP_BLOCK_ROWS):
+            block = vectors[start:start + DEDUP_BLOCK_ROWS]
+            similarities = block @ vectors.T
+            # Only compare against newer memories
+            rows = start + np.arange(len(block))
+            similarities[np.arange(len(memories))[None, :] <= rows[:, None]] = -1.0
+            duplicates.extend(
+                memories[start + i] for i in np.flatnonzero(similarities.max(axis=1) >= self.dedup_threshold)
+            )
+        return duplicates
+
+    def _summarize(self, user_id, memories, cutoff, stats):
+        """Replace old conversations with summaries; returns the memories left, oldest first."""
+        old = [m for m in memories if m["metadata"].get("interaction_type") == "conversation" and _created_at(m) < cutoff]
+        batches = [old[i:i + self.summary_batch_size] for i in range(0, len(old), self.summary_batch_size)]
+        # A lone leftover interaction waits for the next run
+        batches = [batch for batch in batches if len(batch) > 1]
+        if not batches:
+            return memories
+
+        if self.dry_run:
+            stats["summaries"] += len(batches)
+            return self._delete(memories, [m for batch in batches for m in batch], "summarized", stats)
+
+        with ThreadPoolExecutor(max_workers=self.summary_concurrency, thread_name_prefix="memory-summary") as pool:
+            summaries = list(pool.map(self._summary_text, batches))
+
+        done = [(batch, summary) for batch, summary in zip(batches, summaries) if summary]
+        for batch, summary in done:
+            self.memory.add_memory(
+                text=f"Summary of earlier conversations:\n{summary}",
+                metadata={
+                    "interaction_type": "summary",
+                    "created_at": _created_at(batch[-1]),
+                    "period_start": _created_at(batch[0]),
+                    "summarized_count": len(batch)
+                },
+                user_id=user_id
+            )
+        # Summaries are stored before what they replace is deleted, so a crash never loses both
+        self.memory.flush()
+
+        for batch, _ in done:
+            memories = self._delete(memories, batch, "summarized", stats)
+            stats["summaries"] += 1
+        return memories
+
+    def _summary_text(self, batch) -> Optional[str]:
+        transcript = "\n\n".join(m["text"] for m in batch)
+        try:
+            return self.llm_manager.generate(
+                transcript,
+                system_message=SUMMARY_SYSTEM_MESSAGE,
+                temperature=0.2,
+                max_tokens=400,
+                model=self.summary_model
+            ).strip()
+        except Exception:
+            logger.exception("Summarizing %d memories failed; keeping them", len(batch))
+            return None
+
+    def _delete(self, memories, doomed, reason, stats):
+        """Delete `doomed` and return the remaining `memories`."""
+        if not doomed:
+            return memories
+        ids = [m["id"] for m in doomed]
+        if not self.dry_run:
+            self.memory.delete_memories(ids=ids)
+        stats[reason] += len(doomed)
+        COMPACTED_MEMORIES.inc(len(doomed), reason=reason)
+        ids = set(ids)
+        return [m for m in memories if m["id"] not in ids]
+
+    def _read_checkpoint(self) -> Dict[str, Any]:
+        # The file is authoritative when there is one; dry runs only track progress in memory
+        checkpoint = self._read_json(self.checkpoint_path)
+        if checkpoint is None:
+            checkpoint = dict(self._checkpoint or {})
+        checkpoint.setdefault("last_user", "")
+        return checkpoint
+
+    def _write_checkpoint(self, checkpoint):
+        self._checkpoint = dict(checkpoint)
+        self._write_json(self.checkpoint_path, checkpoint)
+
+    def _read_users(self) -> Optional[List[str]]:
+        users = self._read_json(self._users_path())
+        return users if users is not None else self._users
+
+    def _write_users(self, users):
+        """Keep the pass's user list, so later runs of the pass need not list users again."""
+        self._users = users
+        if users is None:
+            path = self._users_path()
+            if path and not self.dry_run and os.path.exists(path):
+                os.remove(path)
+            return
+        self._write_json(self._users_path(), users)
+
+    def _users_path(self) -> Optional[str]:
+        return f"{self.checkpoint_path}.users" if self.checkpoint_path else None
+
+    def _read_json(self, path):
+        if path and not self.dry_run and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+    def _write_json(self, path, value):
+        if not path or self.dry_run:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+    # Periodic runs
+
+    def ensure_running(self, interval: float) -> None:
+        """
+        Run every `interval` seconds on a background thread in this process.
+
+        Cheap to call repeatedly; the thread is (re)started lazily so a
+        process forked after the first call gets its own. With a checkpoint
+        path, runs hold a lock next to the checkpoint and processes that
+        cannot take it skip the run, so several workers never compact at once.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="memory-compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _loop(self, interval):
+        while not self._stopping.wait(interval):
+            lock = self._try_lock()
+            if lock is False:
+                continue
+            try:
+                self.run()
+            except Exception:
+                logger.exception("Memory compaction failed")
+            finally:
+                if lock is not None:
+                    lock.close()
+
+    def _try_lock(self):
+        """Open lock file (None without a checkpoint path), or False if another process holds it."""
+        if not self.checkpoint_path:
+            return None
+        lock = open(f"{self.checkpoint_path}.lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        return lock
+
+
+def _created_at(memory) -> float:
+    created_at = memory["metadata"].get("created_at")
+    return created_at if isinstance(created_at, (int, float)) else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact the agent memory collection once")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--all", action="store_true", help="Keep going until every user has been processed")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # Same configuration as the app (MEMORY_* and MEMORY_COMPACTION_* variables),
+    # building only the memory backend and, for summaries, the LLM client
+    from dotenv import load_dotenv
+    from utils.factory import build_embedding_cache, build_llm_manager, build_memory, build_memory_compactor
+
+    load_dotenv()
+    memory = build_memory(build_embedding_cache())
+    summarize = float(os.getenv("MEMORY_SUMMARIZE_AFTER_DAYS", "30")) > 0
+    llm_manager = build_llm_manager() if summarize else None
+    compactor = build_memory_compactor(memory, llm_manager)
+    compactor.dry_run = args.dry_run
+    while True:
+        stats = compactor.run()
+        if stats["complete"] or not args.all:
+            break
+    memory.close()
+    if llm_manager is not None:
+        llm_manager.close()
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Hot paths are wrapped in `span(name)`, which records the elapsed time in the
+`agentic_span_seconds` histogram and, while a request is being timed (see
+`start_request`), in that request's timings, so they can be returned as a
+`Server-Timing` header. Values that other components already keep (queue
+depths, cache statistics) are read at scrape time through collectors.
+
+Each process keeps its own registry; with several gunicorn workers every
+scrape reports the worker that served it.
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Timings of the request being served, keyed by span name (None outside a request)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))]), cumulative
+            yield self.name + "_sum", _format_labels(self.labelnames, key), total
+            yield self.name + "_count", _format_labels(self.labelnames, key), count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Metrics of this process plus collectors evaluated at scrape time."""
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self,
+                           name: str,
+                           documentation: str,
+                           kind: str,
+                           collect: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]) -> None:
+        """
+        Report values read at scrape time.
+
+        Args:
+            name: Metric name
+            documentation: HELP text
+            kind: "gauge" or "counter"
+            collect: Returns {((label, value), ...): number}; it is skipped
+                if it raises
+        """
+        with self._lock:
+            self._collectors = [c for c in self._collectors if c[0] != name]
+            self._collectors.append((name, documentation, kind, collect))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+
+        for name, documentation, kind, collect in collectors:
+            try:
+                values = collect()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels((), (), labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "agentic_span_seconds", "Time spent in instrumented operations", ["span"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "agentic_llm_tokens_total", "LLM tokens by model and kind (prompt or completion)", ["model", "kind"]
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "agentic_prompt_tokens", "Estimated tokens of budgeted agent prompts", ["agent"],
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+)
+PROMPT_TRIMMED = REGISTRY.counter(
+    "agentic_prompt_trimmed_total", "History messages and memories left out of or cut in agent prompts", ["agent", "item"]
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "agentic_cache_requests_total", "Cache lookups by cache and result (hit or miss)", ["cache", "result"]
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "agentic_http_requests_total", "HTTP requests by endpoint and status", ["endpoint", "status"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "agentic_http_request_seconds", "HTTP request handling time by endpoint", ["endpoint"]
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "agentic_http_requests_in_flight", "HTTP requests currently being handled"
+)
+
+
+def record(name: str, seconds: float) -> None:
+    """Record a span measured elsewhere."""
+    SPAN_SECONDS.observe(seconds, span=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block under `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """Decorator form of `span` for plain and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def run_in_executor(func, *args):
+    """
+    Run blocking `func(*args)` in the default executor without blocking the event loop.
+
+    The caller's context is copied over, so spans inside land in its request timings.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, func, *args))
+
+
+def start_request() -> contextvars.Token:
+    """Begin collecting span timings for the current request."""
+    return _request_timings.set({})
+
+
+def request_timings() -> Optional[Dict[str, float]]:
+    """Span timings (seconds) collected for the current request so far."""
+    return _request_timings.get()
+
+
+def end_request(token: contextvars.Token) -> None:
+    try:
+        _request_timings.reset(token)
+    except ValueError:
+        # Finished in a different context (e.g. after a streamed body)
+        _request_timings.set(None)
+
+
+def server_timing(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Format timings as a `Server-Timing` header value (milliseconds)."""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def count_tokens(model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+
+
+def record_prompt(agent: str, stats: Dict[str, int]) -> None:
+    """Record the size of one budgeted prompt and what was trimmed to fit it."""
+    PROMPT_TOKENS.observe(stats["prompt_tokens"], agent=agent)
+    for item in ("history_dropped", "memories_duplicate", "memories_truncated", "memories_dropped"):
+        if stats.get(item):
+            PROMPT_TRIMMED.inc(stats[item], agent=agent, item=item)
+
+
+def count_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result="miss")
+
+
+def labelled(values: Dict[str, float], label: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+    """Turn {"a": 1} into collector values {(("label", "a"),): 1}."""
+    return {((label, key),): value for key, value in values.items()}
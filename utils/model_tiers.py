@@ -0,0 +1,79 @@
+import re
+from typing import Dict, List, Optional
+
+AUTO = "auto"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def parse_mapping(spec: Optional[str]) -> Dict[str, str]:
+    """Parse "key=value,key=value" (as used in env vars) into a dict."""
+    mapping = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            mapping[key.strip()] = value.strip()
+    return mapping
+
+
+class ModelTierPolicy:
+    def __init__(self,
+                 tiers: Dict[str, str],
+                 routes: Dict[str, str],
+                 simple_tier: str = "small",
+                 complex_tier: str = "large",
+                 simple_max_words: int = 12,
+                 simple_max_history: int = 2):
+        """
+        Choose which model serves each LLM call.
+
+        `routes` maps a target to a tier name, a literal model name or
+        "auto". Targets are graph node names ("router", "sales", ...) and
+        agent class names ("SalesAgent", ...). With "auto", short
+        FAQ-style questions early in a conversation go to `simple_tier`
+        and everything else to `complex_tier`. Targets without a route use
+        the LLM manager's default model.
+
+        Args:
+            tiers: Tier name to model name, e.g. {"small": "llama3-8b-8192"}
+            routes: Target to tier, model or "auto"
+            simple_tier: Tier used for simple queries under "auto"
+            complex_tier: Tier used for other queries under "auto"
+            simple_max_words: Longest message (in words) treated as simple
+            simple_max_history: Most history messages a simple query may follow
+        """
+        self.tiers = tiers
+        self.routes = routes
+        self.simple_tier = simple_tier
+        self.complex_tier = complex_tier
+        self.simple_max_words = simple_max_words
+        self.simple_max_history = simple_max_history
+
+    def select(self,
+               *targets: str,
+               message: Optional[str] = None,
+               history: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
+        """
+        Return the model for the first target that has a route, or None.
+
+        Args:
+            targets: Candidate targets, most specific first
+            message: The user's message, used by "auto" routes
+            history: Conversation history preceding the message
+        """
+        for target in targets:
+            route = self.routes.get(target)
+            if route is None:
+                continue
+            if route == AUTO:
+                route = self.simple_tier if self.is_simple(message, history) else self.complex_tier
+            return self.tiers.get(route, route)
+        return None
+
+    def is_simple(self, message: Optional[str], history: Optional[List[Dict[str, str]]] = None) -> bool:
+        """Short, single-question messages at the start of a conversation."""
+        if not message:
+            return False
+        if history and len(history) > self.simple_max_history:
+            return False
+        return len(_WORD.findall(message)) <= self.simple_max_words and message.count("?") <= 1
@@ -0,0 +1,190 @@
+"""
+ONNX Runtime export of a SentenceTransformer model, cached on local disk.
+
+The export runs once (it needs torch and sentence-transformers); afterwards
+`OnnxEncoder` loads the cached graph with onnxruntime and the `tokenizers`
+library only, so serving processes start without importing torch.
+
+Pre-build the cache, e.g. in a Docker build step:
+
+    python -m utils.onnx_encoder --model all-MiniLM-L6-v2 --quantize
+"""
+import argparse
+import inspect
+import json
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Union
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "agentic-onnx")
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+META_FILE = "meta.json"
+
+
+def model_dir(model_name: str, cache_dir: Optional[str] = None) -> str:
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, model_name.replace("/", "__"))
+
+
+def export_onnx(model_name: str, cache_dir: Optional[str] = None, quantize: bool = False) -> str:
+    """
+    Export `model_name` to ONNX unless it is already cached.
+
+    The graph includes pooling and normalization, so its output matches
+    `SentenceTransformer.encode`. With `quantize`, an int8 copy with
+    dynamically quantized weights is written next to it.
+
+    Returns:
+        The cache directory holding the model, tokenizer and metadata
+    """
+    target = model_dir(model_name, cache_dir)
+    if not os.path.exists(os.path.join(target, META_FILE)):
+        _export_fp32(model_name, target)
+
+    int8_path = os.path.join(target, INT8_FILE)
+    if quantize and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp_path = int8_path + ".tmp"
+        quantize_dynamic(os.path.join(target, FP32_FILE), tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+
+    return target
+
+
+def _export_fp32(model_name, target):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = model[0], model[1]
+    normalize = any(type(module).__name__ == "Normalize" for module in model)
+    use_cls = bool(getattr(pooling, "pooling_mode_cls_token", False))
+    tokenizer = transformer.tokenizer
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in tokenizer("a")]
+
+    class SentenceEmbedding(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = transformer.auto_model
+
+        def forward(self, *inputs):
+            kwargs = dict(zip(input_names, inputs))
+            tokens = self.model(**kwargs)[0]
+            if use_cls:
+                embedding = tokens[:, 0]
+            else:
+                mask = kwargs["attention_mask"].unsqueeze(-1).to(tokens.dtype)
+                embedding = (tokens * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+            if normalize:
+                embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)
+            return embedding
+
+    # Build in a temporary directory and move it into place, so an
+    # interrupted export never leaves a half-written cache behind
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(target))
+    try:
+        sample = tokenizer(["warm up"], return_tensors="pt")
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["sentence_embedding"] = {0: "batch"}
+        # Newer torch defaults to the dynamo exporter; keep the TorchScript one
+        legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        torch.onnx.export(
+            SentenceEmbedding().eval(),
+            tuple(sample[name] for name in input_names),
+            os.path.join(tmp_dir, FP32_FILE),
+            input_names=input_names,
+            output_names=["sentence_embedding"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **legacy
+        )
+        tokenizer.save_pretrained(tmp_dir)
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "model_name": model_name,
+                "dimension": model.get_sentence_embedding_dimension(),
+                "max_seq_length": model.max_seq_length,
+                "inputs": input_names,
+                "pad_id": tokenizer.pad_token_id,
+                "pad_token": tokenizer.pad_token
+            }, f)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(tmp_dir, target)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+class OnnxEncoder:
+    def __init__(self, path: str, quantized: bool = False, intra_op_threads: Optional[int] = None):
+        """
+        SentenceTransformer-compatible encoder running an exported ONNX graph.
+
+        Args:
+            path: Cache directory written by `export_onnx`
+            quantized: Load the int8 graph instead of the fp32 one
+            intra_op_threads: ONNX Runtime threads per call (None for its default)
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.meta["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_id"], pad_token=self.meta["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            os.path.join(path, INT8_FILE if quantized else FP32_FILE),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.meta["dimension"]
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            features = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+            }
+            feed = {name: features[name] for name in self.meta["inputs"]}
+            vectors.append(self.session.run(["sentence_embedding"], feed)[0])
+
+        vectors = np.vstack(vectors).astype(np.float32)
+        return vectors[0] if single else vectors
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export an embedding model to the local ONNX cache")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    parser.add_argument("--cache-dir", default=os.getenv("EMBEDDING_ONNX_CACHE") or None)
+    parser.add_argument("--quantize", action="store_true", help="Also write an int8 copy")
+    args = parser.parse_args(argv)
+
+    print(export_onnx(args.model, args.cache_dir, quantize=args.quantize))
+
+
+if __name__ == "__main__":
+    main()
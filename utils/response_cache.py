@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from qdrant_client.http import models
+from utils.memory_backend import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+# Payload indexes for the cache collection
+RESPONSE_CACHE_INDEXES = {
+    "scope": models.PayloadSchemaType.KEYWORD,
+    "created_at": models.PayloadSchemaType.FLOAT
+}
+
+
+class SemanticResponseCache:
+    def __init__(self,
+                 memory: MemoryBackend,
+                 similarity_threshold: float = 0.95,
+                 ttl: Optional[float] = 86400,
+                 max_entries: int = 10000,
+                 max_local_entries: int = 2048,
+                 prune_interval: float = 300):
+        """
+        Response cache consulted before calling the LLM.
+
+        Lookups first try an exact hash of the full request (kept in-process),
+        then a similarity search over the last user message in a dedicated
+        memory collection. Entries are scoped by model, the caller's scope
+        (the agent), the user and every non-user message of the prompt (system
+        prompt, knowledge snippets, retrieved memories and earlier replies), so
+        an answer is only reused for the same user with the same context.
+
+        Args:
+            memory: Memory backend on a dedicated collection (see RESPONSE_CACHE_INDEXES)
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+            ttl: Seconds an entry stays valid (None disables expiry)
+            max_entries: Maximum number of entries kept in the collection
+            max_local_entries: Maximum number of exact-match entries kept in-process
+            prune_interval: Minimum seconds between background prune passes
+        """
+        self.memory = memory
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_local_entries = max_local_entries
+        self.prune_interval = prune_interval
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._exact = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = time.time()
+        self._pruning = False
+
+    def lookup(self,
+               messages: List[Dict[str, str]],
+               model: str,
+               scope: Optional[str] = None,
+               user_id: Optional[str] = None,
+               **params) -> Optional[str]:
+        """
+        Return a cached response for the request, or None.
+
+        Semantic matching is only used for scoped calls (agent turns);
+        unscoped calls such as the router prompt only match exactly.
+        """
+        scope_key = _scope_key(messages, model, scope, user_id)
+        exact_key = _exact_key(scope_key, messages, params)
+        now = time.time()
+
+        with self._lock:
+            entry = self._exact.get(exact_key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._exact.move_to_end(exact_key)
+                self.exact_hits += 1
+                return entry[0]
+
+        if scope is not None:
+            text = _semantic_text(messages)
+            if text:
+                hits = self.memory.search_memories(text, limit=1, filters={"scope": scope_key})
+                if hits and hits[0]["score"] >= self.similarity_threshold:
+                    metadata = hits[0]["metadata"]
+                    if not self._expired(metadata.get("created_at", 0), now):
+                        self.semantic_hits += 1
+                        self._remember(exact_key, metadata["response"], now)
+                        return metadata["response"]
+
+        self.misses += 1
+        return None
+
+    def store(self,
+              messages: List[Dict[str, str]],
+              model: str,
+              response: str,
+              scope: Optional[str] = None,
+              user_id: Optional[str] = None,
+              **params) -> None:
+        """Cache a response for the request."""
+        if not response:
+            return
+
+        scope_key = _scope_key(messages, model, scope, user_id)
+        now = time.time()
+        self._remember(_exact_key(scope_key, messages, params), response, now)
+
+        if scope is not None:
+            text = _semantic_text(messages)
+            if text:
+                self.memory.add_memory(
+                    text=text,
+                    metadata={"scope": scope_key, "response": response, "created_at": now}
+                )
+
+        if now - self._last_prune >= self.prune_interval and not self._pruning:
+            self._pruning = True
+            threading.Thread(target=self._prune_in_background, name="response-cache-prune", daemon=True).start()
+
+    async def alookup(self, messages, model, scope=None, user_id=None, **params) -> Optional[str]:
+        """Async variant of `lookup`; runs in the default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.lookup(messages, model, scope, user_id, **params))
+
+    async def astore(self, messages, model, response, scope=None, user_id=None, **params) -> None:
+        """Async variant of `store`; runs in the default executor."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: self.store(messages, model, response, scope, user_id, **params))
+
+    def prune(self) -> None:
+        """Delete expired entries, then the oldest ones beyond `max_entries`."""
+        now = time.time()
+        with self._lock:
+            self._last_prune = now
+
+        if self.ttl is not None:
+            self.memory.delete_memories(created_before=now - self.ttl)
+
+        excess = self.memory.count_memories() - self.max_entries
+        if excess > 0:
+            created = sorted(
+                entry["metadata"].get("created_at", 0)
+                for entry in self.memory.iter_memories(batch_size=1024)
+            )
+            self.memory.delete_memories(created_before=created[excess])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "local_size": len(self._exact)
+        }
+
+    def _prune_in_background(self):
+        try:
+            self.prune()
+        except Exception:
+            logger.exception("Response cache prune failed")
+        finally:
+            self._pruning = False
+
+    def _remember(self, exact_key, response, created_at):
+        with self._lock:
+            self._exact[exact_key] = (response, created_at)
+            self._exact.move_to_end(exact_key)
+            while len(self._exact) > self.max_local_entries:
+                self._exact.popitem(last=False)
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+
+def _scope_key(messages, model, scope, user_id=None):
+    """
+    Hash of the model, the caller's scope, the user and every non-user message.
+
+    Retrieved memories and history are per user, so a prompt carrying them
+    never shares a scope with another user's.
+    """
+    context = [[m["role"], m["content"]] for m in messages if m["role"] != "user"]
+    raw = json.dumps([model, scope or "", user_id or "", context], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _exact_key(scope_key, messages, params):
+    raw = json.dumps([scope_key, messages, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _semantic_text(messages):
+    """
+    Text embedded for semantic matching: the last user message, prefixed by
+    the preceding assistant reply so follow-ups only match in similar context.
+    """
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]["role"] == "user":
+            previous = next(
+                (m["content"] for m in reversed(messages[:i]) if m["role"] == "assistant"),
+                ""
+            )
+            return f"{previous}\n{messages[i]['content']}".strip()
+    return ""
@@ -0,0 +1,194 @@
+"""
+Per-user cache of memory search candidates, re-ranked locally.
+
+Consecutive turns of a conversation search the same user's memories, and
+between them usually only the turn just written has changed. On a miss the
+memory backend fetches `candidate_limit` nearest points with their vectors
+and stores them here, keyed by user and filters. Later queries are scored
+against those vectors with NumPy, and the store is only searched again when
+the local result might differ from a remote one:
+
+- If the remote search returned fewer points than asked for, the entry holds
+  every memory of that user and local ranking is exact.
+- Otherwise no point outside the entry scored above the weakest candidate
+  (`floor`) for the query that filled it (`anchor`). On the unit sphere a
+  point's angle to a new query is at least its angle to the anchor minus
+  the angle between the two queries, which bounds what an uncached point can
+  score. If the local top `limit` all score at least that bound, the result
+  is exact.
+
+Writes for a user are inserted into that user's entries (write-through), so
+the bound stays valid. Other processes' writes are only seen after `ttl`.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.memory_backend import canonical_id
+from utils.metrics import count_cache
+
+# A cached point: (id, unit vector, payload)
+Candidate = Tuple[str, np.ndarray, Dict[str, Any]]
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _filter_key(filters):
+    return tuple(sorted((filters or {}).items()))
+
+
+def _matches(payload, filter_key):
+    return all(payload.get(key) == value for key, value in filter_key)
+
+
+class _Entry:
+    __slots__ = ("ids", "vectors", "payloads", "anchor", "floor", "complete", "created_at")
+
+    def __init__(self, candidates, anchor, floor, complete):
+        self.ids = [c[0] for c in candidates]
+        self.vectors = np.asarray([c[1] for c in candidates], dtype=np.float32) if candidates else np.empty((0, len(anchor)), np.float32)
+        self.payloads = [c[2] for c in candidates]
+        self.anchor = anchor
+        self.floor = floor
+        self.complete = complete
+        self.created_at = time.monotonic()
+
+
+class RetrievalCache:
+    def __init__(self, max_users: int = 1000, candidate_limit: int = 32, ttl: Optional[float] = 60.0):
+        """
+        Per-user retrieval cache.
+
+        Args:
+            max_users: Users (times filter combinations) kept, least recently used evicted
+            candidate_limit: Points fetched, with vectors, on a miss
+            ttl: Seconds an entry is trusted (bounds staleness from other processes' writes)
+        """
+        self.max_users = max_users
+        self.candidate_limit = candidate_limit
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def version(self, user_id: str) -> Tuple[int, int]:
+        """Write counter for the user; pass it to `store` to detect writes during a search."""
+        with self._lock:
+            return self._epoch, self._versions.get(user_id, 0)
+
+    def lookup(self, user_id: str, filters: Optional[Dict[str, Any]], vector, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Hits for the query if the cached candidates answer it exactly, else None."""
+        key = (user_id, _filter_key(filters))
+        query = _unit(vector)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry.created_at > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None or limit > self.candidate_limit:
+                return self._miss()
+            self._entries.move_to_end(key)
+
+            scores = entry.vectors @ query if len(entry.ids) else np.empty(0, dtype=np.float32)
+            top = np.argsort(-scores)[:limit]
+            if not entry.complete:
+                # Best score an uncached point could reach for this query
+                drift = np.arccos(np.clip(float(entry.anchor @ query), -1.0, 1.0))
+                bound = np.cos(max(0.0, np.arccos(np.clip(entry.floor, -1.0, 1.0)) - drift))
+                if len(top) < limit or float(scores[top[-1]]) < bound:
+                    return self._miss()
+
+            self.hits += 1
+            hits = [
+                {
+                    "text": entry.payloads[i].get("text"),
+                    "metadata": {k: v for k, v in entry.payloads[i].items() if k != "text"},
+                    "score": float(scores[i])
+                }
+                for i in top
+            ]
+        count_cache("retrieval", hits=1)
+        return hits
+
+    def _miss(self):
+        self.misses += 1
+        count_cache("retrieval", misses=1)
+        return None
+
+    def store(self,
+              user_id: str,
+              filters: Optional[Dict[str, Any]],
+              vector,
+              candidates: Sequence[Candidate],
+              version: Tuple[int, int]) -> None:
+        """
+        Cache the result of a remote search for `candidate_limit` points.
+
+        Args:
+            candidates: (id, vector, payload) of the points found, best first
+            version: `version(user_id)` taken before the search; the entry is
+                dropped if the user was written to meanwhile
+        """
+        query = _unit(vector)
+        candidates = [(canonical_id(point_id), _unit(point_vector), payload) for point_id, point_vector, payload in candidates]
+        complete = len(candidates) < self.candidate_limit
+        floor = float(min(c[1] @ query for c in candidates)) if candidates else -1.0
+        with self._lock:
+            if (self._epoch, self._versions.get(user_id, 0)) != version:
+                return
+            key = (user_id, _filter_key(filters))
+            self._entries[key] = _Entry(candidates, query, floor, complete)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def add(self, user_id: str, point_id: str, vector, payload: Dict[str, Any]) -> None:
+        """Write-through: add a newly stored point to the user's matching entries."""
+        point_id = canonical_id(point_id)
+        vector = _unit(vector)
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            for (entry_user, filter_key), entry in self._entries.items():
+                if entry_user != user_id or not _matches(payload, filter_key):
+                    continue
+                if point_id in entry.ids:
+                    # Replaced point: drop the old copy first
+                    self._remove(entry, {point_id})
+                entry.ids.append(point_id)
+                entry.vectors = np.vstack([entry.vectors, vector[None, :]])
+                entry.payloads.append(payload)
+
+    def discard(self, ids=None, user_id: Optional[str] = None) -> None:
+        """Forget deleted points by ID, or every entry of a user (all users if None)."""
+        with self._lock:
+            if ids is not None:
+                ids = {canonical_id(point_id) for point_id in ids}
+                for entry in self._entries.values():
+                    self._remove(entry, ids)
+                return
+            for key in [key for key in self._entries if user_id is None or key[0] == user_id]:
+                del self._entries[key]
+            if user_id is None:
+                self._epoch += 1
+            else:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def _remove(self, entry, ids):
+        keep = [i for i, point_id in enumerate(entry.ids) if point_id not in ids]
+        if len(keep) == len(entry.ids):
+            return
+        entry.ids = [entry.ids[i] for i in keep]
+        entry.payloads = [entry.payloads[i] for i in keep]
+        entry.vectors = entry.vectors[keep]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
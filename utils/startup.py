@@ -0,0 +1,38 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self, start: Optional[float] = None):
+        """
+        Record how long each startup phase takes.
+
+        Args:
+            start: `time.perf_counter()` value at which startup began
+                (defaults to now)
+        """
+        self.start = start if start is not None else time.perf_counter()
+        self.phases = {}
+        self._last = self.start
+
+    def mark(self, phase: str) -> None:
+        """Close the current phase, attributing the time since the previous mark to it."""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def report(self) -> Dict[str, Any]:
+        """Log and return the per-phase timings in seconds."""
+        report = {
+            "total_seconds": round(self._last - self.start, 4),
+            "phases": {phase: round(seconds, 4) for phase, seconds in self.phases.items()}
+        }
+        logger.info(
+            "Startup took %.2fs: %s",
+            report["total_seconds"],
+            ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in report["phases"].items())
+        )
+        return report
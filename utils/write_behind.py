@@ -0,0 +1,133 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self,
+                 write_batch: Callable[[List[Any]], None],
+                 max_batch_size: int = 64,
+                 flush_interval: float = 0.5,
+                 max_pending: int = 10000,
+                 put_timeout: float = 1.0):
+        """
+        Bounded queue that applies writes in batches on a background thread.
+
+        Callers enqueue items and return immediately; a worker drains the
+        queue and hands up to `max_batch_size` items at a time to
+        `write_batch`. When the buffer is full, `put` waits `put_timeout`
+        seconds and then writes the item synchronously, so writes are never
+        dropped and memory use stays bounded.
+
+        Args:
+            write_batch: Callable that persists a list of queued items
+            max_batch_size: Maximum number of items per write
+            flush_interval: Seconds to wait for a batch to fill up
+            max_pending: Maximum number of buffered items
+            put_timeout: Seconds `put` blocks on a full buffer before writing inline
+        """
+        self.write_batch = write_batch
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.failed_writes = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._worker = None
+        self._pid = None
+
+    def put(self, item: Any, block: bool = True) -> bool:
+        """
+        Enqueue an item for writing.
+
+        Returns:
+            True if the item was queued or written; False only when
+            `block` is False and the buffer is full (nothing was written)
+        """
+        self._ensure_worker()
+        try:
+            self._queue.put(item, block=block, timeout=self.put_timeout if block else None)
+            return True
+        except queue.Full:
+            if not block:
+                return False
+
+        # Buffer is saturated: apply backpressure by writing inline
+        self.write_batch([item])
+        return True
+
+    def pending(self) -> int:
+        """Number of items waiting to be written."""
+        return self._queue.qsize()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every queued item has been written.
+
+        Returns:
+            False if the timeout expired first
+        """
+        if self._worker is None or self._pid != os.getpid():
+            return self._queue.unfinished_tasks == 0
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Flush pending writes and stop the worker."""
+        flushed = self.flush(timeout)
+        self._stopping.set()
+        return flushed
+
+    def _ensure_worker(self):
+        """Start the worker lazily, and again after a fork (threads do not survive it)."""
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_pending)
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self.write_batch(batch)
+            except Exception:
+                self.failed_writes += len(batch)
+                logger.exception("Write-behind batch of %d items failed", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()